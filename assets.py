@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""静态资源与压缩：启动时计算内容哈希并预压缩 gzip / br，带哈希的 URL 可长期缓存；
+较大的 JSON 响应按 Accept-Encoding 压缩"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import abort, current_app, request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # Brotli 是可选依赖，缺失时只提供 gzip
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+HASH_LENGTH = 12
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'application/javascript', 'image/svg+xml'}
+ENCODINGS = ('br', 'gzip')
+API_COMPRESS_MIN_SIZE = 1024
+
+
+def compress(body, encoding, fast=False):
+    """静态资源只压一次用最高级别；API 响应在请求路径上压缩，用 fast 换速度"""
+    with metrics.span('compress'):
+        if encoding == 'br':
+            return brotli.compress(body, quality=5 if fast else 11)
+        return gzip.compress(body, compresslevel=6 if fast else 9, mtime=0)
+
+
+def pick_encoding(available=ENCODINGS, accept=None):
+    """accept 默认取当前 Flask 请求的 Accept-Encoding"""
+    if accept is None:
+        accept = request.accept_encodings
+    for encoding in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        if encoding in available and accept[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def should_compress_json(body):
+    return len(body) >= API_COMPRESS_MIN_SIZE
+
+
+def compress_response(response):
+    """after_request：没被 cached_json 处理过的大 JSON 响应在这里即时压缩"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype != 'application/json'
+    ):
+        return response
+
+    body = response.get_data()
+    if not should_compress_json(body):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = pick_encoding()
+    if encoding == 'identity':
+        return response
+
+    response.set_data(compress(body, encoding, fast=True))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+class AssetBundle:
+    """一组静态文件。HTML 里的 "/<name>" 引用会被改写成 /assets/<hash>/<name>，
+    文件修改时间变化时整体重建（开发时改了 CSS 不用重启）"""
+
+    def __init__(self, root, names):
+        self.root = root
+        self.names = list(names)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._assets = {}
+        self._load()
+
+    def _current_stamp(self):
+        return tuple(os.stat(os.path.join(self.root, name)).st_mtime_ns for name in self.names)
+
+    def _build(self):
+        assets = {}
+        # 先处理被引用的 CSS/JS，再改写 HTML 里的链接
+        for name in sorted(self.names, key=lambda n: n.endswith('.html')):
+            with open(os.path.join(self.root, name), 'rb') as f:
+                body = f.read()
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if mimetype == 'text/html':
+                text = body.decode('utf-8')
+                for dep, asset in assets.items():
+                    text = text.replace(f'"/{dep}"', f'"{asset["url"]}"')
+                body = text.encode('utf-8')
+
+            digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+            variants = {'identity': body}
+            if mimetype in COMPRESSIBLE_TYPES:
+                for encoding in ENCODINGS:
+                    if encoding == 'br' and brotli is None:
+                        continue
+                    compressed = compress(body, encoding)
+                    if len(compressed) < len(body):
+                        variants[encoding] = compressed
+
+            assets[name] = {
+                'hash': digest,
+                'url': f'/assets/{digest}/{name}',
+                'mimetype': mimetype,
+                'variants': variants,
+            }
+        return assets
+
+    def _load(self):
+        stamp = self._current_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._assets = self._build()
+                    self._stamp = stamp
+        return self._assets
+
+    def url(self, name):
+        return self._load()[name]['url']
+
+    def send(self, name, digest=None):
+        """digest 与当前内容一致时按 immutable 缓存；旧哈希仍返回最新内容，但要求重新验证"""
+        asset = self._load().get(name)
+        if asset is None:
+            abort(404)
+
+        encoding = pick_encoding(asset['variants'])
+        response = current_app.response_class(asset['variants'][encoding], mimetype=asset['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset['variants']) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(f"{asset['hash']}-{encoding}")
+        response.headers['Cache-Control'] = IMMUTABLE if digest == asset['hash'] else REVALIDATE
+        return response.make_conditional(request)
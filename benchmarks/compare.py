@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""对比两次 endpoints.py 的结果，列出变慢的接口
+
+    python benchmarks/compare.py benchmarks/results/base.json benchmarks/results/HEAD.json --threshold 0.2
+
+按 (数据集, 调用方式, 服务, 接口) 配对，p50 或 p99 变慢超过 threshold 的记为回退，有回退时退出码为 1。
+延迟太小（低于 --min-ms）的接口只看噪声，不参与判断。
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('meta', {}), {
+        (r['dataset']['meals'], r['dataset']['vendors'], r['transport'], r['app'], r['endpoint']): r
+        for r in data['results']
+    }
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(base, head, threshold, min_ms):
+    """返回 [(key, p50 变化, p99 变化, rss 变化, 是否回退)]"""
+    rows = []
+    for key in sorted(base.keys() & head.keys(), key=str):
+        old, new = base[key], head[key]
+        p50 = change(old['p50_ms'], new['p50_ms'])
+        p99 = change(old['p99_ms'], new['p99_ms'])
+        rss = change(old.get('peak_rss_mb'), new.get('peak_rss_mb'))
+        slow = max(old['p50_ms'] or 0, new['p50_ms'] or 0) >= min_ms and (
+            (p50 is not None and p50 > threshold) or (p99 is not None and p99 > threshold)
+        )
+        rows.append((key, p50, p99, rss, slow or new['errors'] > old['errors']))
+    return rows
+
+
+def fmt(value):
+    return '      -' if value is None else f'{value:+7.1%}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.2, help='延迟增加超过这个比例算回退（默认 20%%）')
+    parser.add_argument('--min-ms', type=float, default=1.0)
+    parser.add_argument('--all', action='store_true', help='列出全部接口，而不只是回退的')
+    args = parser.parse_args()
+
+    base_meta, base = load(args.base)
+    head_meta, head = load(args.head)
+    print(f"base {base_meta.get('commit')}  →  head {head_meta.get('commit')}")
+
+    regressions = 0
+    for (meals, vendors, transport, app, endpoint), p50, p99, rss, regressed in compare(
+        base, head, args.threshold, args.min_ms
+    ):
+        regressions += regressed
+        if regressed or args.all:
+            mark = '!!' if regressed else '  '
+            print(f'{mark} m{meals} v{vendors} {transport:<6} {app:<6} {endpoint[:60]:<60} '
+                  f'p50 {fmt(p50)}  p99 {fmt(p99)}  rss {fmt(rss)}')
+
+    missing = sorted(base.keys() - head.keys(), key=str)
+    for key in missing:
+        print(f'-- 只在 base 中: {key}')
+    print(f'{regressions} 个接口回退')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
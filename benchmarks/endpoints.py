@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""逐个接口测两个服务在不同数据规模下的吞吐量、p50/p99 延迟和峰值内存
+
+    python benchmarks/endpoints.py --meals 1000,100000 --vendors 10,1000 --output benchmarks/results/HEAD.json
+    python benchmarks/endpoints.py --transport http --server gunicorn --requests 100
+    python benchmarks/compare.py benchmarks/results/base.json benchmarks/results/HEAD.json
+
+client：进程内用 Flask test client 调用，只测应用本身；http：把两个服务作为子进程启动，
+通过 keep-alive 连接顺序请求，峰值内存取服务进程（含 gunicorn worker）。
+每个数据集都在 fixtures 的副本上测，写接口不会改动缓存的 fixture。
+顺序：主站读接口 → 管理端读接口 → 管理端写接口 → 事件流（补发前面写入产生的变更）。
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import quote
+
+import fixtures
+import harness
+
+sys.path.insert(0, harness.ROOT)
+
+DEFAULT_REQUESTS = 50
+BULK_SIZE = 100
+GIF = b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+MULTIPART_BOUNDARY = 'eat-benchmark-boundary'
+
+
+def json_body(make):
+    return lambda i, ctx: (json.dumps(make(i, ctx)).encode(), 'application/json')
+
+
+def image_body(i, ctx):
+    """每次上传内容不同的图片，避免命中内容寻址去重"""
+    content = GIF + str(i).encode()
+    body = (
+        f'--{MULTIPART_BOUNDARY}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="bench{i}.gif"\r\n'
+        'Content-Type: image/gif\r\n\r\n'
+    ).encode() + content + f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={MULTIPART_BOUNDARY}'
+
+
+def endpoint(app, method, path, body=None, share=1.0, headers=None):
+    """path 可以是字符串或 (序号, 上下文) → 路径的函数；share 是请求次数相对 --requests 的比例"""
+    return {'app': app, 'method': method, 'path': path, 'body': body, 'share': share, 'headers': headers or {}}
+
+
+def meal_payload(i, ctx):
+    return {
+        'date': f'25{i % 12 + 1:02d}{i % 28 + 1:02d}',
+        'vendor_id': i % ctx['vendors'] + 1,
+        'order': '基准测试',
+        'price': 10 + i % 30,
+        'rate': (i % 10 + 1) / 2,
+    }
+
+
+ENDPOINTS = [
+    # 主站读接口
+    endpoint('server', 'GET', '/'),
+    endpoint('server', 'GET', '/stats'),
+    endpoint('server', 'GET', '/common.css'),
+    endpoint('server', 'GET', lambda i, ctx: ctx['asset']),
+    endpoint('server', 'GET', '/api/stats'),
+    endpoint('server', 'GET', '/api/stats?from=240101&to=241231&bucket=week'),
+    endpoint('server', 'GET', lambda i, ctx: f"/api/stats?bucket=month&vendor_id={i % ctx['vendors'] + 1}"),
+    endpoint('server', 'GET', '/api/vendors/stats'),
+    endpoint('server', 'GET', '/api/vendors/stats?sort=count30d&limit=20'),
+    endpoint('server', 'GET', lambda i, ctx: f"/api/vendors/{i % ctx['vendors'] + 1}/stats"),
+    endpoint('server', 'GET', '/api/vendors'),
+    endpoint('server', 'GET', '/api/meals', share=0.2),
+    endpoint('server', 'GET', '/api/meals?limit=50'),
+    endpoint('server', 'GET', '/api/meals?limit=50&from=240101&to=241231'),
+    endpoint('server', 'GET', lambda i, ctx: f"/api/meals?limit=50&vendor_id={i % ctx['vendors'] + 1}"),
+    endpoint('server', 'GET', '/api/search?q=牛肉面'),
+    endpoint('server', 'GET', '/api/search?q=面馆'),
+    endpoint('server', 'GET', '/api/meals/export?format=ndjson', share=0.1),
+    endpoint('server', 'GET', '/api/meals/export?format=csv', share=0.1),
+    endpoint('server', 'GET', '/api/pick'),
+    endpoint('server', 'GET', '/api/pick?n=5'),
+    endpoint('server', 'GET', '/api/pick?mode=recommend'),
+    endpoint('server', 'GET', '/api/recommend?n=10'),
+    endpoint('server', 'GET', lambda i, ctx: f"/img/{ctx['image']}"),
+    endpoint('server', 'GET', lambda i, ctx: f"/img/{ctx['image']}?w=320", headers={'Accept': 'image/webp'}),
+    # 管理端读接口
+    endpoint('manage', 'GET', '/'),
+    endpoint('manage', 'GET', '/eat_manage.html'),
+    endpoint('manage', 'GET', '/common.css'),
+    endpoint('manage', 'GET', lambda i, ctx: ctx['asset']),
+    endpoint('manage', 'GET', '/api/vendors'),
+    endpoint('manage', 'GET', '/api/weight_rules'),
+    endpoint('manage', 'GET', '/api/meals', share=0.1),
+    endpoint('manage', 'GET', '/api/meals?limit=50'),
+    endpoint('manage', 'GET', '/api/meals/export?format=csv', share=0.1),
+    endpoint('manage', 'GET', lambda i, ctx: f"/img/{ctx['image']}"),
+    # 管理端写接口：新建的商家、规则、记录随后被对应的 PUT / DELETE 用掉
+    endpoint('manage', 'POST', '/api/vendors', json_body(lambda i, ctx: {'vendor': f'基准商家{i}', 'weight': i % 100})),
+    endpoint('manage', 'PUT', lambda i, ctx: f"/api/vendors/{ctx['vendors'] + i + 1}",
+             json_body(lambda i, ctx: {'weight': i % 50})),
+    endpoint('manage', 'POST', '/api/weight_rules',
+             json_body(lambda i, ctx: {'vendor_id': i % ctx['vendors'] + 1, 'weight': 10, 'weekday': i % 7})),
+    endpoint('manage', 'DELETE', lambda i, ctx: f"/api/weight_rules/{ctx['rules'] + i + 1}"),
+    endpoint('manage', 'POST', '/api/meals', json_body(meal_payload)),
+    endpoint('manage', 'PUT', lambda i, ctx: f"/api/meals/{(i * 7919) % ctx['meals'] + 1}",
+             json_body(lambda i, ctx: {'rate': (i % 10 + 1) / 2})),
+    endpoint('manage', 'DELETE', lambda i, ctx: f"/api/meals/{ctx['meals'] - i}"),
+    endpoint('manage', 'POST', '/api/meals/bulk',
+             json_body(lambda i, ctx: [meal_payload(i * BULK_SIZE + n, ctx) for n in range(BULK_SIZE)]), share=0.2),
+    endpoint('manage', 'DELETE', lambda i, ctx: f"/api/vendors/{ctx['vendors'] + i + 1}"),
+    endpoint('manage', 'POST', '/api/upload_image', image_body, share=0.2),
+    # 断线重连后的补发
+    endpoint('server', 'GET', '/api/events', headers={'Last-Event-ID': '0'}, share=0.2),
+    endpoint('manage', 'GET', '/api/events', headers={'Last-Event-ID': '0'}, share=0.2),
+]
+
+
+def endpoint_name(spec, ctx):
+    path = spec['path'] if isinstance(spec['path'], str) else spec['path'](0, ctx)
+    return f"{spec['method']} {path}"
+
+
+def request_count(spec, requests):
+    return max(2, round(requests * spec['share']))
+
+
+def prepare(db_file, img_dir):
+    """测量前读出 ID 范围，放一张图片，算出带哈希的静态资源地址"""
+    import assets
+    import images
+
+    with closing(sqlite3.connect(db_file)) as conn:
+        vendors, meals, rules = (
+            conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+            for table in ('vendors', 'meals', 'weight_rules')
+        )
+    os.makedirs(img_dir, exist_ok=True)
+    image, _ = images.store_upload(img_dir, io.BytesIO(GIF), '.gif')
+    return {
+        'vendors': vendors,
+        'meals': meals,
+        'rules': rules,
+        'image': image,
+        'asset': assets.AssetBundle(harness.ROOT, ['common.css']).url('common.css'),
+    }
+
+
+def build_request(spec, i, ctx):
+    path = spec['path'] if isinstance(spec['path'], str) else spec['path'](i, ctx)
+    headers = dict(spec['headers'])
+    body = None
+    if spec['body'] is not None:
+        body, headers['Content-Type'] = spec['body'](i, ctx)
+    return path, body, headers
+
+
+def measure(spec, ctx, send, requests, warmup, pid=None):
+    """顺序发请求；序号从 0 连续编号（含预热），保证 POST 建出的 ID 正好被后面的 PUT / DELETE 用到"""
+    count = request_count(spec, requests)
+    for i in range(warmup):
+        send(spec['app'], spec['method'], *build_request(spec, i, ctx))
+
+    latencies, errors = [], 0
+    with harness.RssSampler(pid) as sampler:
+        for i in range(warmup, warmup + count):
+            path, body, headers = build_request(spec, i, ctx)
+            started = time.perf_counter()
+            status = send(spec['app'], spec['method'], path, body, headers)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+    return dict(harness.summarize(latencies, errors=errors), peak_rss_mb=sampler.peak_mb)
+
+
+def run_client(db_file, img_dir, requests, warmup, report, selected):
+    """进程内调用：两个应用共用本进程，峰值内存是整个进程的"""
+    os.environ.setdefault('EAT_DB_FILE', db_file)
+    os.environ.setdefault('EAT_IMG_DIR', img_dir)
+    import events
+    import server
+    import server_manage
+
+    for module in (server, server_manage):
+        module.DB_FILE = db_file
+        module.IMG_DIR = img_dir
+    ctx = prepare(db_file, img_dir)
+    clients = {'server': server.app.test_client(), 'manage': server_manage.app.test_client()}
+
+    def send(app, method, path, body, headers):
+        response = clients[app].open(path, method=method, data=body, headers=headers)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+    # 打开同步服务的事件流，只补发一轮就结束
+    with mock.patch.object(events, 'SYNC_ENABLED', True), mock.patch.object(events, 'STREAM_SECONDS', 0):
+        for spec in ENDPOINTS:
+            if selected(spec, ctx):
+                report(spec, ctx, measure(spec, ctx, send, requests, warmup))
+
+
+def run_http(db_file, img_dir, requests, warmup, report, selected, server_mode):
+    env = dict(os.environ, EAT_DB_FILE=db_file, EAT_IMG_DIR=img_dir, EAT_SYNC_EVENTS='1', EAT_EVENTS_STREAM_SECONDS='0', EAT_DEBUG='0')
+    ctx = prepare(db_file, img_dir)
+    ports = {'server': harness.free_port(), 'manage': harness.free_port()}
+    if server_mode == 'gunicorn':
+        commands = {
+            'server': harness.server_command('gunicorn'),
+            'manage': harness.server_command('gunicorn'),
+        }
+        envs = {'server': env, 'manage': dict(env, EAT_APP='server_manage:app', EAT_WORKERS='1')}
+    else:
+        commands = {'server': [sys.executable, 'server.py'], 'manage': [sys.executable, 'server_manage.py']}
+        envs = {'server': env, 'manage': env}
+
+    procs = {}
+    try:
+        for app in ('server', 'manage'):
+            procs[app] = harness.start_server(commands[app], envs[app], ports[app])
+        connections = {}
+
+        def send(app, method, path, body, headers):
+            for attempt in (0, 1):
+                conn = connections.get(app)
+                if conn is None:
+                    conn = connections[app] = http.client.HTTPConnection('127.0.0.1', ports[app], timeout=300)
+                try:
+                    conn.request(method, quote(path, safe='/?&=%'), body=body, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    return response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    connections.pop(app, None)
+                    if attempt:
+                        return 599
+
+        for spec in ENDPOINTS:
+            if selected(spec, ctx):
+                report(spec, ctx, measure(spec, ctx, send, requests, warmup, procs[spec['app']].pid))
+    finally:
+        for proc in procs.values():
+            harness.stop_server(proc)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=harness.ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=harness.ROOT, capture_output=True, text=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--meals', default=','.join(map(str, fixtures.MEAL_SIZES)))
+    parser.add_argument('--vendors', default=','.join(map(str, fixtures.VENDOR_SIZES)))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='每个接口的请求数（导出等重接口按比例减少）')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--transport', default='client,http', help='client、http 或两者')
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='gunicorn', help='http 模式下的服务方式')
+    parser.add_argument('--filter', default='', help='只测名称里包含这段文字的接口（写接口之间有依赖，最好整组测）')
+    parser.add_argument('--output', help='把结果写成 JSON 文件，供 compare.py 对比')
+    args = parser.parse_args()
+
+    commit, dirty = git_revision()
+    results = []
+    for meals in fixtures.parse_sizes(args.meals):
+        for vendors in fixtures.parse_sizes(args.vendors):
+            fixture = fixtures.ensure(meals, vendors, args.seed)
+            for transport in args.transport.split(','):
+                temp_dir = tempfile.mkdtemp()
+                try:
+                    db_file = fixtures.copy_to(fixture, temp_dir)
+                    img_dir = os.path.join(temp_dir, 'img')
+                    print(f'== meals={meals} vendors={vendors} transport={transport}')
+
+                    def report(spec, ctx, result):
+                        name = endpoint_name(spec, ctx)
+                        results.append(dict(
+                            dataset={'meals': meals, 'vendors': vendors},
+                            transport=transport,
+                            app=spec['app'],
+                            endpoint=name,
+                            **result,
+                        ))
+                        print(f"{spec['app']:>6} {name[:60]:<60} {result['rps']:>9} req/s  "
+                              f"p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                              f"rss {result['peak_rss_mb']} MB  errors {result['errors']}")
+
+                    def selected(spec, ctx):
+                        return args.filter in endpoint_name(spec, ctx)
+
+                    if transport == 'client':
+                        run_client(db_file, img_dir, args.requests, args.warmup, report, selected)
+                    else:
+                        run_http(db_file, img_dir, args.requests, args.warmup, report, selected, args.server)
+                finally:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'commit': commit,
+                    'dirty': dirty,
+                    'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'sqlite': sqlite3.sqlite_version,
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'args': vars(args),
+                },
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
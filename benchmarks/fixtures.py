@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""基准测试用的随机数据库：同样的参数和种子总是生成同样的数据
+
+    python benchmarks/fixtures.py --meals 1000,100000,1000000 --vendors 10,1000
+
+生成的库缓存在 benchmarks/.fixtures/ 下，文件名带上参数和 schema 版本，下次直接复用。
+数据在建统计表、搜索索引、变更日志之前插入，由后面的迁移整体回填，
+与老库升级走的是同一条路径，比逐行触发快得多。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import date, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fixtures')
+MEAL_SIZES = (1_000, 100_000, 1_000_000)
+VENDOR_SIZES = (10, 1_000)
+YEARS = 5
+END_DATE = date(2025, 12, 31)
+INSERT_BATCH = 50_000
+# 在 data_versions 之前的迁移只建表和索引，插完数据再跑后面的
+PRELOAD_VERSION = migrations.MIGRATIONS.index(migrations.create_data_versions)
+
+DISHES = ['牛肉面', '黄焖鸡米饭', '麻辣烫 微辣', '鸡腿堡套餐', '番茄鸡蛋盖饭', '酸菜鱼', '煲仔饭', '沙拉', 'Beef noodles', '']
+PREFIXES = ['老', '小', '阿', '大', '新', '东北', '川味', '粤式', '兰州', '沙县']
+SUFFIXES = ['面馆', '饭店', '小吃', '快餐', '烧烤', '麻辣烫', '食堂', '厨房', '汉堡', '粥铺']
+
+
+def fixture_path(meals, vendors, seed=1, directory=FIXTURE_DIR):
+    return os.path.join(
+        directory, f'eat-m{meals}-v{vendors}-s{seed}-schema{migrations.SCHEMA_VERSION}.db'
+    )
+
+
+def vendor_names(count, rng):
+    return [f'{rng.choice(PREFIXES)}{rng.choice(SUFFIXES)}{i:04d}' for i in range(count)]
+
+
+def generate_meals(count, vendors, rng, years=YEARS):
+    """日期铺满最近 years 年；少数商家占大多数订单，更接近真实分布"""
+    days = years * 365
+    popular = max(1, vendors // 5)
+    for _ in range(count):
+        day = END_DATE - timedelta(days=rng.randrange(days))
+        if rng.random() < 0.8:
+            vendor_id = rng.randint(1, popular)
+        else:
+            vendor_id = rng.randint(1, vendors)
+        yield (
+            day.strftime('%y%m%d'),
+            vendor_id,
+            rng.choice(DISHES),
+            round(rng.uniform(8, 60), 1),
+            rng.randint(1, 10) / 2,
+            '',
+        )
+
+
+def build(db_file, meals, vendors, seed=1, years=YEARS):
+    rng = random.Random(seed)
+    with closing(db.connect(db_file)) as conn:
+        migrations.migrate(conn, PRELOAD_VERSION)
+        with db.write_transaction(conn):
+            conn.executemany(
+                'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
+                [(name, rng.randint(0, 100)) for name in vendor_names(vendors, rng)],
+            )
+            rows = generate_meals(meals, vendors, rng, years)
+            while True:
+                batch = [row for _, row in zip(range(INSERT_BATCH), rows)]
+                if not batch:
+                    break
+                conn.executemany(
+                    'INSERT INTO meals (date, vendor_id, order_text, price, rate, image) VALUES (?, ?, ?, ?, ?, ?)',
+                    batch,
+                )
+        migrations.migrate(conn)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('ANALYZE')
+
+
+def ensure(meals, vendors, seed=1, directory=FIXTURE_DIR):
+    """返回缓存的数据库路径，不存在时先生成（写到临时文件再改名，中断不会留下半成品）"""
+    path = fixture_path(meals, vendors, seed, directory)
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    partial = path + '.partial'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(partial + suffix):
+            os.remove(partial + suffix)
+    build(partial, meals, vendors, seed)
+    os.replace(partial, path)
+    return path
+
+
+def copy_to(path, directory, name='eat.db'):
+    """写接口会修改数据，每次测量都在副本上跑"""
+    target = os.path.join(directory, name)
+    with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(target)) as dest:
+        source.backup(dest)
+    return target
+
+
+def parse_sizes(value):
+    return [int(size.replace('_', '')) for size in value.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--meals', default=','.join(map(str, MEAL_SIZES)))
+    parser.add_argument('--vendors', default=','.join(map(str, VENDOR_SIZES)))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='删除缓存重新生成')
+    args = parser.parse_args()
+
+    for meals in parse_sizes(args.meals):
+        for vendors in parse_sizes(args.vendors):
+            path = fixture_path(meals, vendors, args.seed)
+            if args.force and os.path.exists(path):
+                os.remove(path)
+            started = time.perf_counter()
+            ensure(meals, vendors, args.seed)
+            print(f'{os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB, '
+                  f'{time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""基准测试脚本共用的小工具：起停服务进程、统计延迟、采样内存"""
+import http.client
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RSS_INTERVAL = 0.01
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode):
+    """dev：Werkzeug 开发服务器；gunicorn：gunicorn.conf.py；asgi：server_asgi.py（uvicorn）"""
+    if mode == 'dev':
+        return [sys.executable, 'server.py']
+    if mode == 'asgi':
+        return [sys.executable, 'server_asgi.py']
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+
+
+def start_server(cmd, env, port, probe='/api/vendors', timeout=60):
+    env = dict(env, EAT_PORT=str(port), EAT_ACCESS_LOG='/dev/null')
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            conn.request('GET', probe)
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{" ".join(cmd)} did not start')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """elapsed 缺省时按顺序请求计算吞吐量（总耗时即延迟之和）"""
+    ordered = sorted(latencies)
+    elapsed = sum(ordered) if elapsed is None else elapsed
+
+    def pct(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99),
+    }
+
+
+def process_tree(pid):
+    """pid 及其所有子进程（gunicorn 的 worker 是 master 的子进程）"""
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def read_rss(pids):
+    """各进程当前常驻内存之和（字节）；没有 /proc 的系统返回 None"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            if pid == pids[0]:
+                return None
+    return total
+
+
+class RssSampler:
+    """测量期间在后台线程里反复读 RSS，记下峰值。
+
+    没有 /proc 时只能测本进程，退化为 ru_maxrss（进程生命周期内的峰值）。
+    """
+
+    def __init__(self, pid=None):
+        self.pid = pid or os.getpid()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        pids = process_tree(self.pid)
+        rss = read_rss(pids)
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        self.peak = 0
+        self._stop.clear()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def peak_mb(self):
+        if self.peak:
+            return round(self.peak / 2**20, 1)
+        if self.pid == os.getpid():
+            # Linux 上 ru_maxrss 单位是 KiB，macOS 上是字节
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+        return None
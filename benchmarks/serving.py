@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""对比 Flask 开发服务器、gunicorn 与 ASGI 读服务下主站的吞吐量
+
+    python benchmarks/serving.py --meals 5000 --duration 10 --clients 32
+    python benchmarks/serving.py --modes gunicorn,asgi --idle 200
+
+各模式用同一份随机生成的数据库（见 fixtures.py），客户端在多个进程里各开若干保持连接的线程，
+轮流请求主站的几个只读接口，输出每秒请求数与 p50/p99 延迟。
+--idle 另开若干只发了一半请求头就停住的慢连接，模拟隧道另一端很慢的客户端。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import time
+import threading
+
+import fixtures
+import harness
+
+PATHS = ['/api/vendors', '/api/meals?limit=50', '/api/stats', '/api/pick?n=3', '/api/meals']
+
+
+def open_idle(port, count):
+    """只发请求行和一个头，不发结尾的空行，服务端会一直等下去"""
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b'GET /api/vendors HTTP/1.1\r\nHost: localhost\r\n')
+        sockets.append(sock)
+    return sockets
+
+
+def client_process(port, threads, duration, queue):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.time() + duration
+
+    def run(offset):
+        local = []
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        n = offset
+        while time.time() < stop:
+            path = PATHS[n % len(PATHS)]
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    raise OSError(resp.status)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            else:
+                local.append(time.perf_counter() - started)
+            n += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    queue.put((latencies, errors[0]))
+
+
+def measure(port, clients, duration):
+    processes = max(1, min(clients, multiprocessing.cpu_count()))
+    queue = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=client_process,
+            args=(port, clients // processes + (i < clients % processes), duration, queue),
+        )
+        for i in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    latencies, errors = [], 0
+    for _ in procs:
+        part, failed = queue.get()
+        latencies.extend(part)
+        errors += failed
+    for proc in procs:
+        proc.join()
+
+    return harness.summarize(latencies, duration, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--meals', type=int, default=5000)
+    parser.add_argument('--vendors', type=int, default=40)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None, help='gunicorn worker 数，默认按 gunicorn.conf.py')
+    parser.add_argument('--modes', default='dev,gunicorn,asgi')
+    parser.add_argument('--idle', type=int, default=0, help='测量期间保持的慢连接数')
+    parser.add_argument('--output', help='把结果写成 JSON 文件')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        env = dict(
+            os.environ,
+            EAT_DB_FILE=fixtures.copy_to(fixtures.ensure(args.meals, args.vendors), temp_dir),
+            EAT_IMG_DIR=os.path.join(temp_dir, 'img'),
+        )
+        if args.workers:
+            env['EAT_WORKERS'] = str(args.workers)
+
+        results = {}
+        for mode in args.modes.split(','):
+            port = harness.free_port()
+            proc = harness.start_server(harness.server_command(mode), env, port)
+            idle = []
+            try:
+                measure(port, args.clients, 1)  # 预热
+                idle = open_idle(port, args.idle)
+                results[mode] = measure(port, args.clients, args.duration)
+            finally:
+                for sock in idle:
+                    sock.close()
+                harness.stop_server(proc)
+            print(f"{mode:>9}: {results[mode]['rps']:>8} req/s  p50 {results[mode]['p50_ms']} ms  "
+                  f"p99 {results[mode]['p99_ms']} ms  errors {results[mode]['errors']}")
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""SQLite 连接管理：每个线程复用一条调优过的 WAL 连接，写事务遇到 busy 时重试"""
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+BUSY_TIMEOUT_MS = 5000
+RETRY_ATTEMPTS = 5
+RETRY_DELAY = 0.05
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE = 128 * 1024 * 1024
+
+# metrics.enable() 换成计时的连接类
+connection_factory = sqlite3.Connection
+
+_local = threading.local()
+
+
+def connect(db_file, check_same_thread=True, readonly=False):
+    """readonly=True 时以 mode=ro 打开并设置 query_only，连接永远不会去拿写锁"""
+    if readonly:
+        conn = sqlite3.connect(
+            f'file:{pathname2url(os.path.abspath(db_file))}?mode=ro',
+            uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=check_same_thread,
+            factory=connection_factory,
+        )
+        conn.execute('PRAGMA query_only = 1')
+    else:
+        conn = sqlite3.connect(
+            db_file,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=check_same_thread,
+            factory=connection_factory,
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def get_conn(db_file, readonly=False):
+    """返回当前线程对 db_file 的连接，首次使用时创建"""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get((db_file, readonly))
+    if conn is None:
+        conn = conns[(db_file, readonly)] = connect(db_file, readonly=readonly)
+    return conn
+
+
+def close_thread_connections():
+    for conn in getattr(_local, 'conns', {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+@contextmanager
+def write_transaction(conn):
+    """BEGIN IMMEDIATE：一开始就拿写锁，等待交给 busy_timeout，避免读锁升级失败"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def is_busy_error(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(func=None, attempts=RETRY_ATTEMPTS, delay=RETRY_DELAY):
+    """写操作遇到 database is locked / busy 时按指数退避重试"""
+    if func is None:
+        return functools.partial(retry_on_busy, attempts=attempts, delay=delay)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as exc:
+                if not is_busy_error(exc) or attempt == attempts - 1:
+                    raise
+                time.sleep(delay * (2 ** attempt) * (1 + random.random()))
+
+    return wrapper
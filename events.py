@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""/api/events：把 change_log 里的行级变更以 Server-Sent Events 推给页面。
+
+每条事件形如：
+
+    id: <change_log.id>
+    event: vendors | meals
+    data: {"action": "insert|update|delete", "id": 行 id, "version": 表版本, "row": 行内容}
+
+浏览器断线重连时自动带上 Last-Event-ID，从那之后补发；要补的日志已经被清理时发一条 reset，
+页面收到后整表重新加载。
+"""
+import json
+import os
+import time
+
+import db
+import repository
+
+EVENT_RESOURCES = ('vendors', 'meals')
+BATCH_SIZE = 500
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+# gunicorn gthread 里每条流一直占着一个线程，打开的页面一多就把 worker 占满，所以两个 Flask 服务默认不推送：
+# /api/events 直接返回 204，浏览器的 EventSource 不再重连，页面改用 ETag 轮询。
+# 线程足够、页面很少时可以设置 EAT_SYNC_EVENTS=1 打开；ASGI 服务的事件流只占协程，总是推送。
+SYNC_ENABLED = os.environ.get('EAT_SYNC_EVENTS', '').lower() in ('1', 'true', 'yes')
+# 同步服务里每条流占一个线程：定时结束，浏览器带 Last-Event-ID 自动重连，线程得以回收
+STREAM_SECONDS = int(os.environ.get('EAT_EVENTS_STREAM_SECONDS', 300))
+RETRY_MS = 2000
+HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+MIMETYPE = 'text/event-stream'
+
+
+def parse_last_event_id(value):
+    """没带或格式不对时返回 None，表示从当前最新的变更之后开始推送"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def last_change_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+
+
+def format_event(event, change_id, data):
+    return f'id: {change_id}\nevent: {event}\ndata: '.encode() + repository.dumps(data) + b'\n'
+
+
+def changes_since(conn, after, transform=None):
+    """读出 after 之后的变更，返回 (编码好的事件, 最后一条的 id)
+
+    transform(resource, row) 可以在推送前改写行内容（如主站按生效规则替换权重）。
+    """
+    oldest, latest = conn.execute(
+        'SELECT MIN(id), COALESCE(MAX(id), 0) FROM change_log'
+    ).fetchone()
+    if after > latest or (oldest is not None and oldest > after + 1):
+        # 日志已被清理，或数据库被替换过
+        return format_event('reset', latest, {'version': latest}), latest
+
+    chunks = []
+    cursor = repository.tuple_cursor(conn)
+    while True:
+        rows = cursor.execute(
+            '''
+            SELECT id, resource, action, row_id, version, payload
+            FROM change_log
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            ''',
+            (after, BATCH_SIZE),
+        ).fetchall()
+        for change_id, resource, action, row_id, version, payload in rows:
+            row = json.loads(payload)
+            if transform is not None:
+                row = transform(resource, row)
+            chunks.append(format_event(
+                resource, change_id, {'action': action, 'id': row_id, 'version': version, 'row': row}
+            ))
+            after = change_id
+        if len(rows) < BATCH_SIZE:
+            return b''.join(chunks), after
+
+
+def stream(db_file, after=None, transform=None):
+    """同步服务用的事件流：单独开一个只读连接，PRAGMA data_version 变化时才查 change_log"""
+    conn = db.connect(db_file, check_same_thread=False, readonly=True)
+    try:
+        if after is None:
+            after = last_change_id(conn)
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+
+        started = last_sent = time.monotonic()
+        seen = None
+        while True:
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            now = time.monotonic()
+            if data_version != seen:
+                seen = data_version
+                chunk, after = changes_since(conn, after, transform)
+                if chunk:
+                    yield chunk
+                    last_sent = now
+            if now - last_sent >= HEARTBEAT_SECONDS:
+                yield b': ping\n\n'
+                last_sent = now
+            if now - started >= STREAM_SECONDS:
+                return
+            time.sleep(POLL_SECONDS)
+    finally:
+        conn.close()
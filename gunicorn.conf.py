@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""生产环境用 gunicorn 运行两个服务：
+
+    gunicorn -c gunicorn.conf.py                      # 主站 server:app，默认 5000 端口
+    EAT_APP=server_manage:app EAT_PORT=5001 EAT_WORKERS=1 gunicorn -c gunicorn.conf.py
+
+kill -HUP <master pid> 平滑重载：新 worker 加载新代码并预热后，旧 worker 处理完手上的请求再退出。
+"""
+import importlib
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get('EAT_APP', 'server:app')
+bind = f"0.0.0.0:{os.environ.get('EAT_PORT', '5000')}"
+
+# gthread：每个 worker 进程若干线程，每个线程复用自己的 SQLite 连接（见 db.get_conn）
+worker_class = 'gthread'
+workers = int(os.environ.get('EAT_WORKERS', min(2 * multiprocessing.cpu_count() + 1, 8)))
+threads = int(os.environ.get('EAT_THREADS', 4))
+
+# 隧道 / 反向代理后面的长连接多保持一会儿，省掉重复握手
+keepalive = int(os.environ.get('EAT_KEEPALIVE', 15))
+timeout = 30
+graceful_timeout = 30
+
+# 不 preload：HUP 时每个新 worker 重新 import，才能加载到新代码
+preload_app = False
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = os.environ.get('EAT_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """worker 开始接请求前调用应用模块里的 warmup()（如果有）"""
+    module_name = wsgi_app.split(':', 1)[0]
+    warmup = getattr(importlib.import_module(module_name), 'warmup', None)
+    if warmup is not None:
+        warmup()
+        worker.log.info('warmed up %s', module_name)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""图片处理：按内容哈希存储上传文件，后台生成缩略图 / WebP，/img/<name>?w= 返回最合适的版本"""
+import functools
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+import assets
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 是可选依赖，缺失时只提供原图
+    Image = None
+
+THUMB_DIR = 'thumbs'
+THUMB_WIDTHS = (320, 640, 1280)
+THUMB_SOURCE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
+THUMB_WORKERS = 2
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_TMP_PREFIX = '.upload-'
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+GC_GRACE_SECONDS = 3600
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+EXIF_ORIENTATION = 0x0112
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix='img-thumbs')
+_pending = set()
+_derived = set()
+_pending_lock = threading.Lock()
+
+
+class UploadFile:
+    """IMG_DIR 下的上传临时文件：写入时同时计算 sha256，store() 按哈希改名，未 store 就 close 时删除"""
+
+    def __init__(self, img_dir):
+        os.makedirs(img_dir, exist_ok=True)
+        self.img_dir = img_dir
+        self.digest = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(prefix=UPLOAD_TMP_PREFIX, dir=img_dir)
+        self.file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # werkzeug 还会用到 seek/read 等，交给底层文件
+        return getattr(self.file, name)
+
+    def store(self, ext):
+        """按 <hash><ext> 落盘；同内容已存在时丢弃临时文件。返回 (文件名, 是否新建)"""
+        ext = EXTENSION_ALIASES.get(ext.lower(), ext.lower())
+        self.file.close()
+        filename = f'{self.digest.hexdigest()}{ext}'
+        path = os.path.join(self.img_dir, filename)
+        try:
+            if os.path.exists(path):
+                return filename, False
+            os.chmod(self.path, 0o644)
+            os.replace(self.path, path)
+            self.path = None
+            return filename, True
+        finally:
+            self.close()
+
+    def close(self):
+        self.file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+
+def store_upload(img_dir, stream, ext):
+    """保存上传的图片。stream 已是 UploadFile（解析请求时直接写入）时只改名，否则先边读边写进临时文件"""
+    if not isinstance(stream, UploadFile):
+        upload = UploadFile(img_dir)
+        try:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                upload.write(chunk)
+        except BaseException:
+            upload.close()
+            raise
+        stream = upload
+    return stream.store(ext)
+
+
+def image_reference(value):
+    """meals.image 里可能是文件名，也可能是 /img/<name>[?w=] 形式的 URL"""
+    value = (value or '').strip().split('?', 1)[0]
+    return value.rsplit('/', 1)[-1]
+
+
+def collect_garbage(img_dir, referenced, grace=GC_GRACE_SECONDS, dry_run=False):
+    """删除未被引用的原图及其缩略图；grace 秒内的新文件跳过（可能刚上传还没保存记录）。返回删除的相对路径"""
+    cutoff = time.time() - grace
+    thumb_dir = os.path.join(img_dir, THUMB_DIR)
+    candidates = []
+    if os.path.isdir(img_dir):
+        candidates += [(img_dir, name, name) for name in os.listdir(img_dir)]
+    if os.path.isdir(thumb_dir):
+        # thumbs/<原文件名>.w<宽度>.<格式>
+        candidates += [
+            (thumb_dir, name, name.rsplit('.', 2)[0])
+            for name in os.listdir(thumb_dir)
+        ]
+
+    removed = []
+    for directory, name, source in candidates:
+        path = os.path.join(directory, name)
+        if source in referenced or not os.path.isfile(path) or os.path.getmtime(path) > cutoff:
+            continue
+        if not dry_run:
+            os.remove(path)
+            with _pending_lock:
+                _derived.discard((img_dir, source))
+        removed.append(os.path.relpath(path, img_dir))
+    return sorted(removed)
+
+
+def thumb_name(filename, width, fmt):
+    return f'{filename}.w{width}.{fmt}'
+
+
+def can_derive(filename):
+    _, ext = os.path.splitext(filename)
+    return Image is not None and '/' not in filename and ext.lower() in THUMB_SOURCE_EXTENSIONS
+
+
+def generate_derivatives(img_dir, filename):
+    """按 THUMB_WIDTHS 生成比原图窄的 WebP + JPEG 缩略图，先写临时文件再原子替换"""
+    thumb_dir = os.path.join(img_dir, THUMB_DIR)
+    os.makedirs(thumb_dir, exist_ok=True)
+    with Image.open(os.path.join(img_dir, filename)) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+        for width in THUMB_WIDTHS:
+            if width >= source.width:
+                break
+            height = max(1, round(source.height * width / source.width))
+            thumb = source.resize((width, height), Image.LANCZOS)
+            variants = [('webp', {'quality': WEBP_QUALITY, 'method': 4})]
+            if not has_alpha:
+                variants.append(('jpg', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}))
+            for fmt, options in variants:
+                path = os.path.join(thumb_dir, thumb_name(filename, width, fmt))
+                if os.path.exists(path):
+                    continue
+                tmp_path = f'{path}.tmp'
+                thumb.save(tmp_path, format='JPEG' if fmt == 'jpg' else 'WEBP', **options)
+                os.replace(tmp_path, path)
+
+
+def _run_derivatives(img_dir, filename):
+    try:
+        generate_derivatives(img_dir, filename)
+        with _pending_lock:
+            _derived.add((img_dir, filename))
+    except Exception:  # noqa: BLE001 - 生成失败只影响缩略图，原图照常提供
+        logger.exception('生成缩略图失败: %s', filename)
+    finally:
+        with _pending_lock:
+            _pending.discard((img_dir, filename))
+
+
+def schedule_derivatives(img_dir, filename):
+    """提交到后台线程池，返回 Future；不支持、已在排队或本进程已生成过时返回 None"""
+    if not can_derive(filename):
+        return None
+    key = (img_dir, filename)
+    with _pending_lock:
+        if key in _pending or key in _derived:
+            return None
+        _pending.add(key)
+    return _executor.submit(_run_derivatives, img_dir, filename)
+
+
+def parse_width(value):
+    if value in (None, ''):
+        return None
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        return False
+    return width if width > 0 else False
+
+
+def pick_variant(img_dir, filename, width, accept_webp):
+    """返回宽度不小于 width 的最小缩略图（相对 img_dir 的路径），没有合适的返回 None"""
+    thumb_dir = os.path.join(img_dir, THUMB_DIR)
+    formats = ('webp', 'jpg') if accept_webp else ('jpg',)
+    for candidate in THUMB_WIDTHS:
+        if candidate < width:
+            continue
+        for fmt in formats:
+            name = thumb_name(filename, candidate, fmt)
+            if os.path.isfile(os.path.join(thumb_dir, name)):
+                return f'{THUMB_DIR}/{name}'
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _source_info(path, mtime_ns):
+    try:
+        with Image.open(path) as source:
+            width, height = source.size
+            if source.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                # 转正后宽高互换，与 generate_derivatives 一致
+                width = height
+            return width, source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+    except OSError:
+        return None
+
+
+def variant_possible(source, width, accept_webp):
+    """这个宽度将来会不会有缩略图：只读原图文件头（按修改时间缓存），不看缩略图是否已经生成"""
+    info = _source_info(source, os.stat(source).st_mtime_ns)
+    if info is None:
+        return False
+    source_width, has_alpha = info
+    if has_alpha and not accept_webp:
+        # 带透明通道的图只生成 WebP
+        return False
+    return any(width <= candidate < source_width for candidate in THUMB_WIDTHS)
+
+
+def send_image(img_dir, path, immutable):
+    """send_from_directory 自带 ETag / Last-Modified 条件请求和 Range；按内容命名的文件可永久缓存"""
+    response = send_from_directory(img_dir, path)
+    response.headers['Cache-Control'] = assets.IMMUTABLE if immutable else assets.REVALIDATE
+    return response
+
+
+def serve(img_dir, filename):
+    """/img/<filename>[?w=]：有缩略图就返回缩略图，老图片缺缩略图时顺便在后台补上"""
+    width = parse_width(request.args.get('w'))
+    if width is False:
+        return {'error': 'w必须是正整数'}, 400
+    immutable = bool(CONTENT_ADDRESSED.match(filename))
+    if width is None or not can_derive(filename):
+        response = send_image(img_dir, filename, immutable)
+        if width is not None:
+            response.vary.add('Accept')
+        return response
+
+    source = safe_join(img_dir, filename)
+    if source is None or not os.path.isfile(source):
+        abort(404)
+
+    accept_webp = request.accept_mimetypes['image/webp'] > 0
+    variant = pick_variant(img_dir, filename, width, accept_webp)
+    if variant is None and variant_possible(source, width, accept_webp):
+        # 缩略图还没生成，先给原图，但不能让浏览器把它当成这个宽度的最终结果缓存下来
+        schedule_derivatives(img_dir, filename)
+        response = send_image(img_dir, filename, False)
+    elif variant is None:
+        # 比最大的缩略图还宽，或原图本身就更窄：原图就是这个宽度的最终结果，也不用再排后台任务
+        response = send_image(img_dir, filename, immutable)
+    else:
+        response = send_image(img_dir, variant, immutable)
+    response.vary.add('Accept')
+    return response
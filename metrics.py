@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""可选的性能埋点；设置 EAT_METRICS=1 时开启，默认不开
+
+开启后：
+- 每个请求记录耗时直方图、状态码、响应字节数，按路由（URL 规则）汇总；
+- 所有 SQLite 连接换成计时的连接类，按语句累计执行次数、耗时（含取行）和返回行数；
+- 响应带 Server-Timing 头，分成 sql / rows（组装结果）/ encode（JSON 编码）/ compress 几段，
+  各段互不重叠，app 是到响应头发出时的总耗时；流式响应正文期间的 SQL 只计入 /metrics；
+- GET /metrics 以 Prometheus 文本格式输出上面的数据（每个进程各自统计）；
+- 另外设置 EAT_PROFILE=1 时，请求头带 X-Profile: 1 的请求用 cProfile 跑一遍，结果写到 EAT_PROFILE_DIR，
+  文件名（不含目录）在响应头 X-Profile-File 里，用 python -m pstats 查看。
+"""
+import cProfile
+import functools
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+import db
+
+ENABLED = False
+# 剖析会在服务器上写文件，任何客户端都能带请求头触发，所以要单独打开
+PROFILE_ENABLED = os.environ.get('EAT_PROFILE', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('EAT_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'eat-profiles'))
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SPANS = ('sql', 'rows', 'encode', 'compress')
+STATEMENT_MAX = 200
+STATEMENTS_MAX = 500
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_requests = {}
+_durations = {}
+_route_spans = {}
+_response_bytes = {}
+_statements = {}
+
+
+class Record:
+    """一个请求的累计数据，放在线程局部变量里，SQL 计时和 span 往这里加"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = dict.fromkeys(SPANS, 0.0)
+        self.queries = 0
+        self.rows = 0
+        self.profiler = None
+        self.profile_file = None
+
+
+def current():
+    return getattr(_local, 'record', None) if ENABLED else None
+
+
+@contextmanager
+def span(name):
+    """把一段代码的耗时记到当前请求的 name 段，扣掉其间已记到 sql 的时间"""
+    record = current()
+    if record is None:
+        yield
+        return
+    started, sql = time.perf_counter(), record.spans['sql']
+    try:
+        yield
+    finally:
+        record.spans[name] += time.perf_counter() - started - (record.spans['sql'] - sql)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql):
+    return ' '.join(sql.split())[:STATEMENT_MAX]
+
+
+def record_sql(sql, seconds, rows=0, executions=0):
+    label = statement_label(sql)
+    with _lock:
+        stats = _statements.get(label)
+        if stats is None:
+            if len(_statements) >= STATEMENTS_MAX:
+                label = 'other'
+            stats = _statements.setdefault(label, [0, 0.0, 0])
+        stats[0] += executions
+        stats[1] += seconds
+        stats[2] += rows
+
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.spans['sql'] += seconds
+        record.queries += executions
+        record.rows += rows
+
+
+class TimedCursor(sqlite3.Cursor):
+    """execute 和之后取行的耗时都算到最近一次执行的语句上（SELECT 的大部分工作在取行时）"""
+
+    _sql = None
+
+    def _done(self, started, rows=0, executions=0):
+        if self._sql is not None:
+            record_sql(self._sql, time.perf_counter() - started, rows, executions)
+
+    def execute(self, sql, parameters=()):
+        self._sql, started = sql, time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._done(started, executions=1)
+        return self
+
+    def executemany(self, sql, parameters):
+        self._sql, started = sql, time.perf_counter()
+        try:
+            super().executemany(sql, parameters)
+        finally:
+            self._done(started, executions=1)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._done(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._done(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._done(started, len(rows))
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection.execute 不经过 cursor()，这里改成走计时游标"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+def enable():
+    """在打开数据库连接之前调用；已经打开的连接不会被计时"""
+    global ENABLED
+    ENABLED = True
+    db.connection_factory = TimedConnection
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    db.connection_factory = sqlite3.Connection
+    _local.record = None
+
+
+def reset():
+    with _lock:
+        for registry in (_requests, _durations, _route_spans, _response_bytes, _statements):
+            registry.clear()
+
+
+def route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def start_request():
+    if not ENABLED:
+        return
+    record = _local.record = Record()
+    if PROFILE_ENABLED and request.headers.get('X-Profile') == '1' and _profile_lock.acquire(blocking=False):
+        # 同一时间只剖析一个请求：cProfile 在同一进程里不能嵌套
+        record.profiler = cProfile.Profile()
+        record.profiler.enable()
+
+
+def server_timing(record, elapsed):
+    parts = []
+    for name in SPANS:
+        seconds = record.spans[name]
+        if seconds or name == 'sql':
+            part = f'{name};dur={seconds * 1000:.2f}'
+            if name == 'sql':
+                part += f';desc="{record.queries} queries, {record.rows} rows"'
+            parts.append(part)
+    parts.append(f'app;dur={elapsed * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def count_bytes(iterable, counter):
+    try:
+        for chunk in iterable:
+            counter[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def finish_request(response):
+    """after_request：最后一个执行（最先注册），压缩之后的响应才是实际发送的字节"""
+    record = getattr(_local, 'record', None)
+    if record is None or not ENABLED:
+        return response
+
+    response.headers['Server-Timing'] = server_timing(record, time.perf_counter() - record.started)
+    if record.profiler is not None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', f'{request.method}{request.path}').strip('_')
+        record.profile_file = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{name}.prof')
+        response.headers['X-Profile-File'] = os.path.basename(record.profile_file)
+
+    counter = [0]
+    if response.status_code == 304 or request.method == 'HEAD':
+        pass
+    elif not response.is_streamed:
+        counter[0] = response.calculate_content_length() or 0
+    elif response.content_length is not None:
+        counter[0] = response.content_length
+    else:
+        response.response = count_bytes(response.response, counter)
+
+    route, method, status = route_label(), request.method, response.status_code
+    response.call_on_close(lambda: close_request(record, route, method, status, counter))
+    return response
+
+
+def close_request(record, route, method, status, counter):
+    """响应正文发完（或连接关闭）时调用，流式响应的耗时也算在内"""
+    elapsed = time.perf_counter() - record.started
+    if getattr(_local, 'record', None) is record:
+        _local.record = None
+    if record.profiler is not None:
+        record.profiler.disable()
+        record.profiler.dump_stats(record.profile_file)
+        _profile_lock.release()
+
+    with _lock:
+        key = (route, method, str(status))
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _durations.setdefault((route, method), [0] * len(BUCKETS) + [0.0, 0])
+        for index, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                histogram[index] += 1
+        histogram[-2] += elapsed
+        histogram[-1] += 1
+        for name, seconds in record.spans.items():
+            if seconds:
+                _route_spans[(route, name)] = _route_spans.get((route, name), 0.0) + seconds
+        _response_bytes[route] = _response_bytes.get(route, 0) + counter[0]
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in values.items()) + '}'
+
+
+def render():
+    """Prometheus 文本格式（0.0.4）"""
+    with _lock:
+        requests = sorted(_requests.items())
+        durations = sorted((key, list(value)) for key, value in _durations.items())
+        route_spans = sorted(_route_spans.items())
+        response_bytes = sorted(_response_bytes.items())
+        statements = sorted((key, list(value)) for key, value in _statements.items())
+
+    lines = [
+        '# HELP eat_requests_total 请求数',
+        '# TYPE eat_requests_total counter',
+    ]
+    lines += [
+        f'eat_requests_total{labels(route=route, method=method, status=status)} {count}'
+        for (route, method, status), count in requests
+    ]
+
+    lines += [
+        '# HELP eat_request_duration_seconds 请求耗时（含流式正文）',
+        '# TYPE eat_request_duration_seconds histogram',
+    ]
+    for (route, method), histogram in durations:
+        for bound, count in zip(BUCKETS, histogram):
+            lines.append(
+                f'eat_request_duration_seconds_bucket{labels(route=route, method=method, le=bound)} {count}'
+            )
+        lines.append(
+            f'eat_request_duration_seconds_bucket{labels(route=route, method=method, le="+Inf")} {histogram[-1]}'
+        )
+        lines.append(f'eat_request_duration_seconds_sum{labels(route=route, method=method)} {histogram[-2]:.6f}')
+        lines.append(f'eat_request_duration_seconds_count{labels(route=route, method=method)} {histogram[-1]}')
+
+    lines += [
+        '# HELP eat_request_span_seconds_total 各段累计耗时（sql / rows / encode / compress，互不重叠）',
+        '# TYPE eat_request_span_seconds_total counter',
+    ]
+    lines += [
+        f'eat_request_span_seconds_total{labels(route=route, span=name)} {seconds:.6f}'
+        for (route, name), seconds in route_spans
+    ]
+
+    lines += [
+        '# HELP eat_response_bytes_total 响应正文字节数（压缩后）',
+        '# TYPE eat_response_bytes_total counter',
+    ]
+    lines += [f'eat_response_bytes_total{labels(route=route)} {size}' for route, size in response_bytes]
+
+    for name, kind, help_text, index, fmt in (
+        ('eat_sql_executions_total', 'counter', 'SQL 语句执行次数', 0, '{}'),
+        ('eat_sql_seconds_total', 'counter', 'SQL 语句累计耗时（含取行）', 1, '{:.6f}'),
+        ('eat_sql_rows_total', 'counter', 'SQL 语句返回的行数', 2, '{}'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [
+            f'{name}{labels(statement=statement)} {fmt.format(stats[index])}'
+            for statement, stats in statements
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def install(app):
+    """在其他 after_request（CORS、压缩）之前调用，保证计时和字节数覆盖它们"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics_view():
+        if not ENABLED:
+            return app.response_class('metrics disabled\n', status=404, mimetype='text/plain')
+        return app.response_class(render(), content_type=CONTENT_TYPE)
+
+
+if os.environ.get('EAT_METRICS', '').lower() in ('1', 'true', 'yes'):
+    enable()
@@ -0,0 +1,823 @@
+# -*- coding: utf-8 -*-
+"""按 PRAGMA user_version 编号的数据库迁移
+
+每个迁移只执行一次，并在同一个写事务里把 user_version 推进到它的编号；
+已经是最新版本时启动只读一次 user_version。新增表、列、索引时在 MIGRATIONS 末尾追加，
+不要修改已发布的迁移。
+"""
+import sqlite3
+
+import db
+
+
+def create_base_tables(conn):
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS vendors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vendor TEXT NOT NULL UNIQUE,
+            weight INTEGER NOT NULL DEFAULT 0 CHECK(weight >= 0)
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            order_text TEXT NOT NULL DEFAULT '',
+            price REAL NOT NULL DEFAULT 0 CHECK(price >= 0),
+            rate REAL NOT NULL DEFAULT 1 CHECK(rate >= 0.5 AND rate <= 5),
+            image TEXT NOT NULL DEFAULT ''
+        )
+        '''
+    )
+
+
+def add_meal_vendor_id(conn):
+    """旧版 meals.order_text 存的是商家名：补 vendor_id 列，按名称建商家并回填"""
+    columns = {
+        row['name']
+        for row in conn.execute('PRAGMA table_info(meals)').fetchall()
+    }
+    if 'vendor_id' in columns:
+        return
+
+    conn.execute('ALTER TABLE meals ADD COLUMN vendor_id INTEGER')
+
+    meal_vendor_names = [
+        row['order_text'].strip()
+        for row in conn.execute(
+            """
+            SELECT DISTINCT order_text
+            FROM meals
+            WHERE TRIM(order_text) != ''
+            """
+        ).fetchall()
+    ]
+
+    existing_vendor_names = {
+        row['vendor']
+        for row in conn.execute('SELECT vendor FROM vendors').fetchall()
+    }
+
+    for vendor_name in meal_vendor_names:
+        if vendor_name not in existing_vendor_names:
+            conn.execute(
+                'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
+                (vendor_name, 0),
+            )
+            existing_vendor_names.add(vendor_name)
+
+    conn.execute(
+        """
+        UPDATE meals
+        SET vendor_id = (
+            SELECT id FROM vendors WHERE vendor = TRIM(meals.order_text)
+        )
+        WHERE vendor_id IS NULL AND TRIM(order_text) != ''
+        """
+    )
+    conn.execute(
+        """
+        UPDATE meals
+        SET order_text = ''
+        WHERE vendor_id IS NOT NULL AND TRIM(order_text) != ''
+        """
+    )
+
+
+def create_meal_indexes(conn):
+    """时间线分页用 (date, id)；按商家筛选和最近一次到访用 (vendor_id, date, id)"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meals_date_id ON meals (date, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meals_vendor_date_id ON meals (vendor_id, date, id)')
+
+
+def create_weight_rules(conn):
+    """动态权重规则：按星期/日期/时段覆盖商家权重，读服务在内存中求值"""
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'weight_rules'"
+    ).fetchone() is None
+
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS weight_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vendor_id INTEGER NOT NULL,
+            weekday INTEGER CHECK(weekday >= 0 AND weekday <= 6),
+            date_from TEXT,
+            date_to TEXT,
+            time_from TEXT,
+            time_to TEXT,
+            weight INTEGER NOT NULL CHECK(weight >= 0),
+            priority INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+
+    if created:
+        # 取代原来写死在读路径上的 K记 规则：星期四 1000，其他 100
+        kji = conn.execute("SELECT id FROM vendors WHERE vendor = 'K记'").fetchone()
+        if kji is not None:
+            conn.executemany(
+                'INSERT INTO weight_rules (vendor_id, weekday, weight, priority) VALUES (?, ?, ?, ?)',
+                [(kji['id'], 3, 1000, 1), (kji['id'], None, 100, 0)],
+            )
+
+
+def create_data_versions(conn):
+    """每张表一个版本号，由触发器在同一事务内递增"""
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            resource TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    for table in ('vendors', 'meals', 'weight_rules'):
+        conn.execute(
+            'INSERT OR IGNORE INTO data_versions (resource, version) VALUES (?, 0)',
+            (table,),
+        )
+        for action in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_version
+                AFTER {action} ON {table}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1
+                    WHERE resource = '{table}';
+                END
+                '''
+            )
+
+
+STATS_TABLES = ('stats_summary', 'stats_vendor', 'stats_month', 'stats_rating', 'stats_price')
+
+
+def price_bucket_sql(price):
+    """价格区间下标：免费、¥0-10 … ¥40+"""
+    return f"""
+        CASE
+            WHEN {price} = 0 THEN 0
+            WHEN {price} <= 10 THEN 1
+            WHEN {price} <= 15 THEN 2
+            WHEN {price} <= 20 THEN 3
+            WHEN {price} <= 25 THEN 4
+            WHEN {price} <= 30 THEN 5
+            WHEN {price} <= 40 THEN 6
+            ELSE 7
+        END
+    """
+
+
+def stats_delta_sql(row, sign):
+    """把一条点餐记录（NEW/OLD）计入或移出统计汇总表"""
+    paid = f'WHERE {row}.price > 0'
+    return f"""
+        INSERT INTO stats_summary (id, count, total, rate_sum)
+        SELECT 1, {sign}, {sign} * {row}.price, {sign} * {row}.rate {paid}
+        ON CONFLICT(id) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total,
+            rate_sum = rate_sum + excluded.rate_sum;
+        INSERT INTO stats_vendor (vendor_id, count, total, rate_sum)
+        SELECT COALESCE({row}.vendor_id, 0), {sign}, {sign} * {row}.price, {sign} * {row}.rate {paid}
+        ON CONFLICT(vendor_id) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total,
+            rate_sum = rate_sum + excluded.rate_sum;
+        INSERT INTO stats_month (month, count, total)
+        SELECT SUBSTR({row}.date, 1, 4), {sign}, {sign} * {row}.price {paid}
+        ON CONFLICT(month) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total;
+        INSERT INTO stats_rating (rating, count)
+        SELECT ROUND({row}.rate * 2) / 2, {sign} {paid}
+        ON CONFLICT(rating) DO UPDATE SET count = count + excluded.count;
+        INSERT INTO stats_price (bucket, count)
+        VALUES ({price_bucket_sql(f'{row}.price')}, {sign})
+        ON CONFLICT(bucket) DO UPDATE SET count = count + excluded.count;
+    """
+
+
+def rebuild_stats(conn):
+    for table in STATS_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute(
+        """
+        INSERT INTO stats_summary (id, count, total, rate_sum)
+        SELECT 1, COUNT(*), COALESCE(SUM(price), 0), COALESCE(SUM(rate), 0)
+        FROM meals
+        WHERE price > 0
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO stats_vendor (vendor_id, count, total, rate_sum)
+        SELECT COALESCE(vendor_id, 0), COUNT(*), SUM(price), SUM(rate)
+        FROM meals
+        WHERE price > 0
+        GROUP BY COALESCE(vendor_id, 0)
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO stats_month (month, count, total)
+        SELECT SUBSTR(date, 1, 4), COUNT(*), SUM(price)
+        FROM meals
+        WHERE price > 0
+        GROUP BY SUBSTR(date, 1, 4)
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO stats_rating (rating, count)
+        SELECT ROUND(rate * 2) / 2, COUNT(*)
+        FROM meals
+        WHERE price > 0
+        GROUP BY ROUND(rate * 2) / 2
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO stats_price (bucket, count)
+        SELECT {price_bucket_sql('price')} AS bucket, COUNT(*)
+        FROM meals
+        GROUP BY bucket
+        """
+    )
+
+
+def create_stats_tables(conn):
+    """/api/stats 的汇总表，由 meals 上的触发器增量维护"""
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_summary'"
+    ).fetchone() is None
+
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_summary (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_vendor (
+            vendor_id INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_month (
+            month TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_rating (
+            rating REAL PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_price (
+            bucket INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meals_price ON meals (price)')
+
+    triggers = {
+        'meals_insert_stats': ('INSERT', stats_delta_sql('NEW', 1)),
+        'meals_delete_stats': ('DELETE', stats_delta_sql('OLD', -1)),
+        'meals_update_stats': (
+            'UPDATE OF date, vendor_id, price, rate',
+            stats_delta_sql('OLD', -1) + stats_delta_sql('NEW', 1),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {name}
+            AFTER {event} ON meals
+            BEGIN
+                {body}
+            END
+            '''
+        )
+
+    if created:
+        rebuild_stats(conn)
+
+
+SEARCH_INDEXES = {'meals_fts': ('meals', 'order_text'), 'vendors_fts': ('vendors', 'vendor')}
+
+
+def create_search_indexes(conn):
+    """trigram 分词的 FTS5 外部内容索引，由触发器同步；SQLite 不支持时跳过，搜索退化为 LIKE"""
+    for fts, (table, column) in SEARCH_INDEXES.items():
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+        ).fetchone()
+        if not exists:
+            try:
+                conn.execute(
+                    f"""
+                    CREATE VIRTUAL TABLE {fts} USING fts5(
+                        {column}, content='{table}', content_rowid='id', tokenize='trigram'
+                    )
+                    """
+                )
+            except sqlite3.OperationalError:
+                return
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+            '''
+        )
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            END
+            '''
+        )
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+            '''
+        )
+
+
+CHANGE_LOG_KEEP = 10000
+# 推送给客户端的行内容，字段与 repository.VENDOR_FIELDS / MEAL_FIELDS 一致
+CHANGE_PAYLOADS = {
+    'vendors': "json_object('id', {row}.id, 'vendor', {row}.vendor, 'weight', {row}.weight)",
+    'meals': """json_object(
+        'id', {row}.id,
+        'date', {row}.date,
+        'vendor_id', {row}.vendor_id,
+        'vendor_name', (SELECT vendor FROM vendors WHERE id = {row}.vendor_id),
+        'order', COALESCE({row}.order_text, ''),
+        'price', {row}.price,
+        'rate', {row}.rate,
+        'image', {row}.image
+    )""",
+}
+
+
+def create_change_log(conn):
+    """行级变更日志，供 /api/events 推送。
+
+    直接替换 data_versions 的触发器：同一个触发器里先递增版本再记日志，
+    日志里的 version 就是这次修改后的表版本，与数据在同一事务内写入。
+    只保留最近 CHANGE_LOG_KEEP 条。
+    """
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource TEXT NOT NULL,
+            action TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            payload TEXT NOT NULL
+        )
+        '''
+    )
+    conn.execute(
+        f'''
+        CREATE TRIGGER IF NOT EXISTS change_log_prune AFTER INSERT ON change_log
+        BEGIN
+            DELETE FROM change_log WHERE id <= new.id - {CHANGE_LOG_KEEP};
+        END
+        '''
+    )
+    for table, payload in CHANGE_PAYLOADS.items():
+        for action, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            trigger = f'{table}_{action.lower()}_version'
+            row_payload = payload.format(row=row) if row == 'new' else "json_object('id', old.id)"
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            conn.execute(
+                f'''
+                CREATE TRIGGER {trigger}
+                AFTER {action} ON {table}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1
+                    WHERE resource = '{table}';
+                    INSERT INTO change_log (resource, action, row_id, version, payload)
+                    VALUES (
+                        '{table}',
+                        '{action.lower()}',
+                        {row}.id,
+                        (SELECT version FROM data_versions WHERE resource = '{table}'),
+                        {row_payload}
+                    );
+                END
+                '''
+            )
+
+
+def daily_delta_sql(row, sign):
+    """把一条点餐记录计入或移出按天的汇总（和 stats_* 一样只统计价格大于 0 的记录）"""
+    paid = f'WHERE {row}.price > 0'
+    return f"""
+        INSERT INTO stats_daily (day, count, total, rate_sum)
+        SELECT {row}.date, {sign}, {sign} * {row}.price, {sign} * {row}.rate {paid}
+        ON CONFLICT(day) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total,
+            rate_sum = rate_sum + excluded.rate_sum;
+        INSERT INTO stats_vendor_daily (vendor_id, day, count, total, rate_sum)
+        SELECT COALESCE({row}.vendor_id, 0), {row}.date, {sign}, {sign} * {row}.price, {sign} * {row}.rate {paid}
+        ON CONFLICT(vendor_id, day) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total,
+            rate_sum = rate_sum + excluded.rate_sum;
+    """
+
+
+def rebuild_daily_stats(conn):
+    conn.execute('DELETE FROM stats_daily')
+    conn.execute('DELETE FROM stats_vendor_daily')
+    conn.execute(
+        """
+        INSERT INTO stats_daily (day, count, total, rate_sum)
+        SELECT date, COUNT(*), SUM(price), SUM(rate)
+        FROM meals
+        WHERE price > 0
+        GROUP BY date
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO stats_vendor_daily (vendor_id, day, count, total, rate_sum)
+        SELECT COALESCE(vendor_id, 0), date, COUNT(*), SUM(price), SUM(rate)
+        FROM meals
+        WHERE price > 0
+        GROUP BY COALESCE(vendor_id, 0), date
+        """
+    )
+
+
+def create_stats_daily(conn):
+    """按天（以及按商家、天）的汇总，/api/stats?from=&to=&bucket= 在此之上按周/月/年聚合。
+
+    先把历史数据里的 YYYY-MM-DD / YYYYMMDD 日期统一成 YYMMDD：字符串顺序就是时间顺序，
+    范围查询可以直接走日期索引。
+    """
+    conn.execute(
+        """
+        UPDATE meals
+        SET date = SUBSTR(TRIM(date), 3, 2) || SUBSTR(TRIM(date), 6, 2) || SUBSTR(TRIM(date), 9, 2)
+        WHERE TRIM(date) GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        """
+    )
+    conn.execute(
+        """
+        UPDATE meals
+        SET date = SUBSTR(TRIM(date), 3)
+        WHERE TRIM(date) GLOB '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'
+        """
+    )
+    conn.execute('UPDATE meals SET date = TRIM(date) WHERE date != TRIM(date)')
+
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            day TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_vendor_daily (
+            vendor_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (vendor_id, day)
+        ) WITHOUT ROWID
+        '''
+    )
+
+    triggers = {
+        'meals_insert_stats_daily': ('INSERT', daily_delta_sql('NEW', 1)),
+        'meals_delete_stats_daily': ('DELETE', daily_delta_sql('OLD', -1)),
+        'meals_update_stats_daily': (
+            'UPDATE OF date, vendor_id, price, rate',
+            daily_delta_sql('OLD', -1) + daily_delta_sql('NEW', 1),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {name}
+            AFTER {event} ON meals
+            BEGIN
+                {body}
+            END
+            '''
+        )
+
+    rebuild_daily_stats(conn)
+
+
+def vendor_rating_delta_sql(row, sign):
+    paid = f'WHERE {row}.price > 0'
+    return f"""
+        INSERT INTO stats_vendor_rating (vendor_id, rating, count)
+        SELECT COALESCE({row}.vendor_id, 0), ROUND({row}.rate * 2) / 2, {sign} {paid}
+        ON CONFLICT(vendor_id, rating) DO UPDATE SET count = count + excluded.count;
+    """
+
+
+def create_vendor_rating_stats(conn):
+    """每个商家的评分分布（0.5 一档），/api/vendors/stats 据此算中位数，不用扫 meals"""
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS stats_vendor_rating (
+            vendor_id INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (vendor_id, rating)
+        ) WITHOUT ROWID
+        '''
+    )
+
+    triggers = {
+        'meals_insert_vendor_rating': ('INSERT', vendor_rating_delta_sql('NEW', 1)),
+        'meals_delete_vendor_rating': ('DELETE', vendor_rating_delta_sql('OLD', -1)),
+        'meals_update_vendor_rating': (
+            'UPDATE OF vendor_id, price, rate',
+            vendor_rating_delta_sql('OLD', -1) + vendor_rating_delta_sql('NEW', 1),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {name}
+            AFTER {event} ON meals
+            BEGIN
+                {body}
+            END
+            '''
+        )
+
+    conn.execute('DELETE FROM stats_vendor_rating')
+    conn.execute(
+        """
+        INSERT INTO stats_vendor_rating (vendor_id, rating, count)
+        SELECT COALESCE(vendor_id, 0), ROUND(rate * 2) / 2, COUNT(*)
+        FROM meals
+        WHERE price > 0
+        GROUP BY COALESCE(vendor_id, 0), ROUND(rate * 2) / 2
+        """
+    )
+
+
+def vendor_activity_remove_sql(row):
+    # 删掉的可能正是最近一次，最近到访日期用 (vendor_id, date) 索引重新取
+    return f"""
+        UPDATE vendor_activity
+        SET visits = visits - 1,
+            rate_sum = rate_sum - {row}.rate,
+            last_date = (SELECT MAX(date) FROM meals WHERE vendor_id = {row}.vendor_id),
+            seq = (SELECT MAX(seq) FROM vendor_activity) + 1
+        WHERE vendor_id = {row}.vendor_id;
+    """
+
+
+def vendor_activity_add_sql(row):
+    return f"""
+        INSERT INTO vendor_activity (vendor_id, visits, rate_sum, last_date, seq)
+        SELECT {row}.vendor_id, 1, {row}.rate, {row}.date,
+               COALESCE((SELECT MAX(seq) FROM vendor_activity), 0) + 1
+        WHERE {row}.vendor_id IS NOT NULL
+        ON CONFLICT(vendor_id) DO UPDATE SET
+            visits = visits + 1,
+            rate_sum = rate_sum + excluded.rate_sum,
+            last_date = MAX(COALESCE(last_date, ''), excluded.last_date),
+            seq = excluded.seq;
+    """
+
+
+def create_vendor_activity(conn):
+    """每个商家的到访次数、评分和最近到访日期（含免费的餐），推荐模式据此打分。
+
+    seq 每次变化递增，读服务只读 seq 比上次大的行，增量更新内存里的汇总。
+    """
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS vendor_activity (
+            vendor_id INTEGER PRIMARY KEY,
+            visits INTEGER NOT NULL DEFAULT 0,
+            rate_sum REAL NOT NULL DEFAULT 0,
+            last_date TEXT,
+            seq INTEGER NOT NULL
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vendor_activity_seq ON vendor_activity (seq)')
+
+    triggers = {
+        'meals_insert_vendor_activity': ('INSERT', vendor_activity_add_sql('NEW')),
+        'meals_delete_vendor_activity': ('DELETE', vendor_activity_remove_sql('OLD')),
+        'meals_update_vendor_activity': (
+            'UPDATE OF vendor_id, date, rate',
+            vendor_activity_remove_sql('OLD') + vendor_activity_add_sql('NEW'),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {name}
+            AFTER {event} ON meals
+            BEGIN
+                {body}
+            END
+            '''
+        )
+
+    conn.execute('DELETE FROM vendor_activity')
+    conn.execute(
+        """
+        INSERT INTO vendor_activity (vendor_id, visits, rate_sum, last_date, seq)
+        SELECT vendor_id, COUNT(*), COALESCE(SUM(rate), 0), MAX(date), ROW_NUMBER() OVER (ORDER BY vendor_id)
+        FROM meals
+        WHERE vendor_id IS NOT NULL
+        GROUP BY vendor_id
+        """
+    )
+
+
+# 每段文字只切前这么多个字符，点餐内容和店名远短于此
+BIGRAM_MAX_CHARS = 500
+# meals_bigram 的 rowid = 日期 (YYMMDD) × BIGRAM_KEY + id，按 rowid 倒序就是按 (date, id) 倒序
+BIGRAM_KEY = 10 ** 10
+
+
+def bigrams_sql(value):
+    """把文字切成相邻两字一组、空格分隔（最后一个字单独一组），unicode61 分词后每组是一个词"""
+    return f"""(
+        SELECT group_concat(substr({value}, n, 2), ' ')
+        FROM search_positions
+        WHERE n <= length({value})
+    )"""
+
+
+def meal_bigram_key_sql(row):
+    return f'CAST({row}.date AS INTEGER) * {BIGRAM_KEY} + {row}.id'
+
+
+def meal_bigram_sql(row, vendor, delete=False):
+    """把一条点餐记录的内容和商家名写进 meals_bigram；不存原文的 FTS5 表删除时要给出写入时的同样内容"""
+    command = "'delete', " if delete else ''
+    return f"""
+        INSERT INTO meals_bigram ({'meals_bigram, ' if delete else ''}rowid, order_grams, vendor_grams)
+        SELECT {command}{meal_bigram_key_sql(row)}, {bigrams_sql(f'{row}.order_text')}, {bigrams_sql(vendor)}
+    """
+
+
+def create_bigram_indexes(conn):
+    """trigram 索引要 3 个字符以上才能命中；1-2 个字符的词（常见的两字店名）用这里的 bigram 索引，不再 LIKE 全表。
+
+    SQLite 没有内置的 bigram 分词器，触发器里也不能用 WITH，所以借一张 1..N 的序号表在 SQL 里切词，
+    写进不存原文的 FTS5 表（unicode61 分词，大小写不敏感，另建单字前缀索引给一个字的词用）。meals_bigram 每条记录同时收录商家名，
+    rowid 按日期编码，只有短词的搜索一次 MATCH 就能按日期倒序取一页。SQLite 不支持 FTS5 时跳过，搜索退化为 LIKE。
+    """
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS vendors_bigram USING fts5(grams, content='', tokenize='unicode61', prefix='1')"
+        )
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS meals_bigram
+            USING fts5(order_grams, vendor_grams, content='', tokenize='unicode61', prefix='1')
+            """
+        )
+    except sqlite3.OperationalError:
+        return
+
+    conn.execute('CREATE TABLE IF NOT EXISTS search_positions (n INTEGER PRIMARY KEY)')
+    conn.execute(
+        f"""
+        INSERT OR IGNORE INTO search_positions (n)
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {BIGRAM_MAX_CHARS})
+        SELECT n FROM seq
+        """
+    )
+
+    vendor_add = f"INSERT INTO vendors_bigram (rowid, grams) VALUES (new.id, {bigrams_sql('new.vendor')});"
+    vendor_remove = (
+        f"INSERT INTO vendors_bigram (vendors_bigram, rowid, grams) VALUES ('delete', old.id, {bigrams_sql('old.vendor')});"
+    )
+
+    def vendor_name(row):
+        return f'(SELECT vendor FROM vendors WHERE id = {row}.vendor_id)'
+
+    meal_add = meal_bigram_sql('NEW', vendor_name('NEW')) + ';'
+    meal_remove = meal_bigram_sql('OLD', vendor_name('OLD'), delete=True) + ';'
+    triggers = {
+        'vendors_bigram_insert': ('INSERT ON vendors', vendor_add),
+        'vendors_bigram_delete': ('DELETE ON vendors', vendor_remove),
+        # 改名时该商家的每条点餐记录都要按新名字重新收录；改名很少见，代价与该商家的记录数成正比
+        'vendors_bigram_update': (
+            'UPDATE OF vendor ON vendors',
+            vendor_remove
+            + vendor_add
+            + meal_bigram_sql('meals', 'old.vendor', delete=True) + ' FROM meals WHERE meals.vendor_id = old.id;'
+            + meal_bigram_sql('meals', 'new.vendor') + ' FROM meals WHERE meals.vendor_id = new.id;',
+        ),
+        'meals_bigram_insert': ('INSERT ON meals', meal_add),
+        'meals_bigram_delete': ('DELETE ON meals', meal_remove),
+        'meals_bigram_update': ('UPDATE OF date, vendor_id, order_text ON meals', meal_remove + meal_add),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}
+            BEGIN
+                {body}
+            END
+            '''
+        )
+
+    for fts in ('vendors_bigram', 'meals_bigram'):
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+    conn.execute(f"INSERT INTO vendors_bigram (rowid, grams) SELECT id, {bigrams_sql('vendors.vendor')} FROM vendors")
+    conn.execute(
+        meal_bigram_sql('meals', 'vendors.vendor')
+        + ' FROM meals LEFT JOIN vendors ON vendors.id = meals.vendor_id'
+    )
+
+
+# 第 n 个迁移执行后 user_version = n。在引入 user_version 之前建好的库版本为 0，
+# 所以前几个迁移都写成可重复执行的（IF NOT EXISTS / 先探测再改）。
+MIGRATIONS = [
+    create_base_tables,
+    add_meal_vendor_id,
+    create_meal_indexes,
+    create_weight_rules,
+    create_data_versions,
+    create_stats_tables,
+    create_search_indexes,
+    create_change_log,
+    create_stats_daily,
+    create_vendor_rating_stats,
+    create_vendor_activity,
+    create_bigram_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """把数据库升级到 target（默认 SCHEMA_VERSION），返回升级前的版本。
+
+    BEGIN IMMEDIATE 保证两个服务同时启动时只有一个在迁移，另一个拿到写锁后重新读版本直接跳过。
+    """
+    target = SCHEMA_VERSION if target is None else target
+    current = schema_version(conn)
+    if current >= target:
+        return current
+
+    with db.write_transaction(conn):
+        current = schema_version(conn)
+        for number in range(current + 1, target + 1):
+            MIGRATIONS[number - 1](conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+    return current
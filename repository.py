@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""数据访问层：SQL、查询参数解析和 JSON 编码
+
+列表查询用普通 tuple 行（不经过 sqlite3.Row 的逐键取值），按固定字段顺序 zip 成 dict；
+SQL 文本按参数组合缓存成同一个字符串，命中 sqlite3 连接自带的预编译语句缓存。
+装了 orjson 时用它编码 JSON。
+"""
+import csv
+import functools
+import io
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+import db
+import metrics
+import migrations
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，缺失时用标准库 json
+    orjson = None
+
+MEALS_PAGE_SIZE = 50
+MEALS_PAGE_MAX = 500
+MEAL_QUERY_KEYS = {'limit', 'before', 'from', 'to', 'vendor_id'}
+EXPORT_BATCH_SIZE = 500
+EXPORT_CSV_COLUMNS = ['id', 'date', 'vendor_id', 'vendor', 'order', 'price', 'rate', 'image']
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 100
+SEARCH_VENDOR_LIMIT = 10
+SEARCH_QUERY_MAX = 100
+FTS_MIN_TERM = 3
+
+VENDOR_FIELDS = ('id', 'vendor', 'weight')
+MEAL_FIELDS = ('id', 'date', 'vendor_id', 'vendor_name', 'order', 'price', 'rate', 'image')
+
+VENDOR_COLUMNS = 'v.id, v.vendor, v.weight'
+# 顺序与 MEAL_FIELDS 一致；导出 CSV 时也直接按这个顺序写
+MEAL_COLUMNS = '''
+    m.id,
+    m.date,
+    m.vendor_id,
+    v.vendor AS vendor_name,
+    COALESCE(m.order_text, '') AS order_text,
+    m.price,
+    m.rate,
+    m.image
+'''
+
+
+def dumps(obj):
+    """编码为以换行结尾的 UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class JSONProvider(DefaultJSONProvider):
+    """让 jsonify 也走 dumps()；解析请求体仍用默认实现"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.span('encode'):
+            body = dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def tuple_cursor(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def serialize_vendor(row):
+    return dict(zip(VENDOR_FIELDS, row))
+
+
+def serialize_meal(row):
+    return dict(zip(MEAL_FIELDS, row))
+
+
+def read_vendors(conn):
+    rows = tuple_cursor(conn).execute(
+        f'SELECT {VENDOR_COLUMNS} FROM vendors AS v ORDER BY v.id ASC'
+    ).fetchall()
+    return [dict(zip(VENDOR_FIELDS, row)) for row in rows]
+
+
+def get_vendor(conn, vendor_id):
+    return conn.execute(
+        'SELECT id, vendor, weight FROM vendors WHERE id = ?',
+        (vendor_id,),
+    ).fetchone()
+
+
+def get_meal(conn, meal_id):
+    return conn.execute(
+        f'''
+        SELECT {MEAL_COLUMNS}
+        FROM meals AS m
+        LEFT JOIN vendors AS v ON v.id = m.vendor_id
+        WHERE m.id = ?
+        ''',
+        (meal_id,),
+    ).fetchone()
+
+
+@functools.lru_cache(maxsize=None)
+def meals_sql(before, date_from, date_to, vendor_id, limit):
+    """每种筛选组合只拼一次 SQL"""
+    clauses = []
+    if before:
+        clauses.append('(m.date, m.id) < (?, ?)')
+    if date_from:
+        clauses.append('m.date >= ?')
+    if date_to:
+        clauses.append('m.date <= ?')
+    if vendor_id:
+        clauses.append('m.vendor_id = ?')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    page = 'LIMIT ?' if limit else ''
+    return f'''
+        SELECT {MEAL_COLUMNS}
+        FROM meals AS m
+        LEFT JOIN vendors AS v ON v.id = m.vendor_id
+        {where}
+        ORDER BY m.date DESC, m.id DESC
+        {page}
+    '''
+
+
+def read_meals(conn, limit=None, before=None, date_from=None, date_to=None, vendor_id=None):
+    params = []
+    if before is not None:
+        params.extend(before)
+    for value in (date_from, date_to, vendor_id, limit):
+        if value is not None:
+            params.append(value)
+    sql = meals_sql(
+        before is not None,
+        date_from is not None,
+        date_to is not None,
+        vendor_id is not None,
+        limit is not None,
+    )
+    rows = tuple_cursor(conn).execute(sql, params).fetchall()
+    return [dict(zip(MEAL_FIELDS, row)) for row in rows]
+
+
+def encode_meal_cursor(meal):
+    return f"{meal['date']}:{meal['id']}"
+
+
+def parse_meal_cursor(value):
+    date, sep, meal_id = (value or '').rpartition(':')
+    if not sep or not date:
+        return None
+    try:
+        meal_id = int(meal_id)
+    except ValueError:
+        return None
+    return date, meal_id
+
+
+def parse_meal_date(value):
+    digits = (value or '').strip().replace('-', '')
+    if len(digits) == 8:
+        digits = digits[2:]
+    if len(digits) != 6 or not digits.isdigit():
+        return None
+    return digits
+
+
+def parse_meal_query(args):
+    """解析 /api/meals 的分页与筛选参数，日期统一为 YYMMDD"""
+    query = {}
+
+    try:
+        limit = int(args.get('limit', MEALS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return None, 'limit必须是整数'
+    if limit < 1 or limit > MEALS_PAGE_MAX:
+        return None, f'limit必须在1-{MEALS_PAGE_MAX}之间'
+    query['limit'] = limit
+
+    if args.get('before'):
+        query['before'] = parse_meal_cursor(args['before'])
+        if query['before'] is None:
+            return None, '无效的分页游标'
+
+    for key, field in (('from', 'date_from'), ('to', 'date_to')):
+        if args.get(key):
+            query[field] = parse_meal_date(args[key])
+            if query[field] is None:
+                return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
+
+    if args.get('vendor_id'):
+        try:
+            query['vendor_id'] = int(args['vendor_id'])
+        except ValueError:
+            return None, '无效的商家ID'
+
+    return query, None
+
+
+def read_meal_page(conn, query):
+    limit = query['limit']
+    meals = read_meals(conn, **{**query, 'limit': limit + 1})
+    next_cursor = encode_meal_cursor(meals[limit - 1]) if len(meals) > limit else None
+    return {'meals': meals[:limit], 'next_cursor': next_cursor}
+
+
+def iter_meal_export(db_file, export_format):
+    """逐批从游标读取并编码，内存占用与记录总数无关"""
+    conn = db.connect(db_file, check_same_thread=False, readonly=True)
+    try:
+        cursor = tuple_cursor(conn).execute(
+            f'''
+            SELECT {MEAL_COLUMNS}
+            FROM meals AS m
+            LEFT JOIN vendors AS v ON v.id = m.vendor_id
+            ORDER BY m.date DESC, m.id DESC
+            '''
+        )
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write('\ufeff')
+            writer.writerow(EXPORT_CSV_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if export_format == 'csv':
+                writer.writerows(rows)
+                chunk = buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                chunk = b''.join(dumps(dict(zip(MEAL_FIELDS, row))) for row in rows)
+            yield chunk
+    finally:
+        conn.close()
+
+
+def parse_search_query(args):
+    """解析 /api/search 参数：q 按空白切词（词之间为 AND），limit/offset 分页，from/to 同 /api/meals"""
+    terms = (args.get('q') or '').split()
+    if not terms:
+        return None, '搜索词不能为空'
+    if sum(len(term) for term in terms) > SEARCH_QUERY_MAX:
+        return None, f'搜索词不能超过{SEARCH_QUERY_MAX}个字符'
+    query = {'terms': terms}
+
+    for key, default in (('limit', SEARCH_PAGE_SIZE), ('offset', 0)):
+        try:
+            query[key] = int(args.get(key, default))
+        except (TypeError, ValueError):
+            return None, f'{key}必须是整数'
+    if query['limit'] < 1 or query['limit'] > SEARCH_PAGE_MAX:
+        return None, f'limit必须在1-{SEARCH_PAGE_MAX}之间'
+    if query['offset'] < 0:
+        return None, 'offset不能为负数'
+
+    for key, field in (('from', 'date_from'), ('to', 'date_to')):
+        query[field] = None
+        if args.get(key):
+            query[field] = parse_meal_date(args[key])
+            if query[field] is None:
+                return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
+
+    return query, None
+
+
+def fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_indexes(conn):
+    """已建好的搜索索引：{'fts'}（trigram）和/或 {'bigram'}，SQLite 不支持 FTS5 时为空"""
+    names = {
+        row[0]
+        for row in conn.execute(
+            """
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name IN ('meals_fts', 'vendors_fts', 'meals_bigram', 'vendors_bigram')
+            """
+        ).fetchall()
+    }
+    return {
+        kind
+        for kind in ('fts', 'bigram')
+        if {f'meals_{kind}', f'vendors_{kind}'} <= names
+    }
+
+
+def search_available(conn):
+    return 'fts' in search_indexes(conn)
+
+
+def term_index(term, indexes):
+    """trigram 至少要 3 个字符才能命中，更短的词（常见的两字店名）查 bigram 索引；
+    含标点、符号等分隔字符的短词 unicode61 会把它切开，仍走 LIKE。返回 'fts'、'bigram' 或 None"""
+    if len(term) >= FTS_MIN_TERM:
+        return 'fts' if 'fts' in indexes else None
+    if 'bigram' in indexes and term.isalnum():
+        return 'bigram'
+    return None
+
+
+def match_query(term, index):
+    # bigram 索引里每个字都是某一组的开头，单个字按前缀匹配
+    if index == 'bigram' and len(term) == 1:
+        return fts_phrase(term) + '*'
+    return fts_phrase(term)
+
+
+def search_vendors(conn, terms, indexes):
+    clauses = []
+    params = []
+    for term in terms:
+        index = term_index(term, indexes)
+        if index is not None:
+            clauses.append(f'v.id IN (SELECT rowid FROM vendors_{index} WHERE vendors_{index} MATCH ?)')
+            params.append(match_query(term, index))
+        else:
+            clauses.append("v.vendor LIKE ? ESCAPE '\\'")
+            params.append(like_pattern(term))
+    params.append(SEARCH_VENDOR_LIMIT)
+    rows = tuple_cursor(conn).execute(
+        f'''
+        SELECT {VENDOR_COLUMNS}
+        FROM vendors AS v
+        WHERE {' AND '.join(clauses)}
+        ORDER BY length(v.vendor), v.id
+        LIMIT ?
+        ''',
+        params,
+    ).fetchall()
+    return [dict(zip(VENDOR_FIELDS, row)) for row in rows]
+
+
+def search_meals_by_date(conn, query):
+    """所有词都走 bigram 索引时：一次 MATCH（词之间 AND），按 rowid（日期编码）倒序取一页，
+    FTS5 取够就停，耗时与命中总数无关"""
+    match = ' AND '.join(match_query(term, 'bigram') for term in query['terms'])
+    params = [match]
+    clauses = []
+    if query['date_from'] is not None:
+        clauses.append('AND rowid >= ?')
+        params.append(int(query['date_from']) * migrations.BIGRAM_KEY)
+    if query['date_to'] is not None:
+        clauses.append('AND rowid < ?')
+        params.append((int(query['date_to']) + 1) * migrations.BIGRAM_KEY)
+    params.extend([query['limit'] + 1, query['offset']])
+
+    rows = tuple_cursor(conn).execute(
+        f'''
+        SELECT {MEAL_COLUMNS}
+        FROM (
+            SELECT rowid AS key FROM meals_bigram
+            WHERE meals_bigram MATCH ? {' '.join(clauses)}
+            ORDER BY rowid DESC
+            LIMIT ? OFFSET ?
+        ) AS h
+        JOIN meals AS m ON m.id = h.key % {migrations.BIGRAM_KEY}
+        LEFT JOIN vendors AS v ON v.id = m.vendor_id
+        ORDER BY h.key DESC
+        ''',
+        params,
+    ).fetchall()
+    return [dict(zip(MEAL_FIELDS, row)) for row in rows]
+
+
+def search_meals(conn, query, indexes):
+    """每个词命中点餐内容或商家名都算；点餐内容的命中按 bm25 排在前面，其余按日期倒序"""
+    if all(term_index(term, indexes) == 'bigram' for term in query['terms']):
+        return search_meals_by_date(conn, query)
+
+    hits = []
+    params = []
+    for term in query['terms']:
+        index = term_index(term, indexes)
+        if index == 'bigram':
+            # meals_bigram 同时收录了商家名
+            hits.append(f'SELECT rowid % {migrations.BIGRAM_KEY} AS id FROM meals_bigram WHERE meals_bigram MATCH ?')
+            params.append(match_query(term, index))
+        elif index == 'fts':
+            phrase = match_query(term, index)
+            hits.append(
+                '''
+                SELECT rowid AS id FROM meals_fts WHERE meals_fts MATCH ?
+                UNION
+                SELECT id FROM meals
+                WHERE vendor_id IN (SELECT rowid FROM vendors_fts WHERE vendors_fts MATCH ?)
+                '''
+            )
+            params.extend([phrase, phrase])
+        else:
+            pattern = like_pattern(term)
+            hits.append(
+                '''
+                SELECT id FROM meals WHERE order_text LIKE ? ESCAPE '\\'
+                UNION
+                SELECT id FROM meals
+                WHERE vendor_id IN (SELECT id FROM vendors WHERE vendor LIKE ? ESCAPE '\\')
+                '''
+            )
+            params.extend([pattern, pattern])
+
+    ranked = [fts_phrase(term) for term in query['terms'] if term_index(term, indexes) == 'fts']
+    rank_join = ''
+    order = 'm.date DESC, m.id DESC'
+    if ranked:
+        rank_join = '''
+            LEFT JOIN (
+                SELECT rowid, bm25(meals_fts) AS score FROM meals_fts WHERE meals_fts MATCH ?
+            ) AS s ON s.rowid = m.id
+        '''
+        params.append(' OR '.join(ranked))
+        order = f's.score IS NULL, s.score, {order}'
+
+    clauses = []
+    for field, op in (('date_from', '>='), ('date_to', '<=')):
+        if query[field] is not None:
+            clauses.append(f'm.date {op} ?')
+            params.append(query[field])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    params.extend([query['limit'] + 1, query['offset']])
+
+    rows = tuple_cursor(conn).execute(
+        f'''
+        WITH hits (id) AS (
+            {' INTERSECT '.join(f'SELECT id FROM ({sql})' for sql in hits)}
+        )
+        SELECT {MEAL_COLUMNS}
+        FROM hits AS h
+        JOIN meals AS m ON m.id = h.id
+        LEFT JOIN vendors AS v ON v.id = m.vendor_id
+        {rank_join}
+        {where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+        ''',
+        params,
+    ).fetchall()
+    return [dict(zip(MEAL_FIELDS, row)) for row in rows]
+
+
+def read_search(conn, query):
+    indexes = search_indexes(conn)
+    vendors = search_vendors(conn, query['terms'], indexes)
+    meals = search_meals(conn, query, indexes)
+    limit = query['limit']
+    next_offset = query['offset'] + limit if len(meals) > limit else None
+    return {'vendors': vendors, 'meals': meals[:limit], 'next_offset': next_offset}
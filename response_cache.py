@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""按数据版本缓存编码后的 JSON 响应及其压缩版本，生成 ETag 并处理 If-None-Match"""
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from werkzeug.http import quote_etag
+
+import assets
+import db
+import metrics
+import repository
+
+CACHE_SIZE = 256
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_probe = {'db_file': None, 'conn': None, 'data_version': None, 'versions': {}}
+
+
+def current_versions(db_file):
+    """各表的版本号；PRAGMA data_version 未变化时直接复用上次结果，不查表"""
+    with _lock:
+        probe = _probe
+        if probe['db_file'] != db_file:
+            if probe['conn'] is not None:
+                probe['conn'].close()
+            _entries.clear()
+            probe.update(
+                db_file=db_file,
+                conn=db.connect(db_file, check_same_thread=False, readonly=True),
+                data_version=None,
+            )
+        data_version = probe['conn'].execute('PRAGMA data_version').fetchone()[0]
+        if data_version != probe['data_version']:
+            probe['versions'] = dict(
+                probe['conn'].execute('SELECT resource, version FROM data_versions').fetchall()
+            )
+            probe['data_version'] = data_version
+        return probe['versions']
+
+
+def cache_key(path, args):
+    """args 是 (参数名, 值) 序列，顺序不同的同一组参数命中同一条缓存"""
+    return f'{path}?{urlencode(sorted(args))}'
+
+
+def make_stamp(versions, resources, extra=None):
+    """extra 是除表版本外影响结果的其他状态（如当前生效的权重规则）"""
+    return tuple(versions.get(resource, 0) for resource in resources) + (extra,)
+
+
+def lookup(key, stamp):
+    """命中且版本一致时返回缓存条目，否则返回 None"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        _entries.move_to_end(key)
+    return entry if entry[0] == stamp else None
+
+
+def store(key, stamp, data):
+    with metrics.span('encode'):
+        body = repository.dumps(data)
+    entry = (stamp, {'identity': body}, hashlib.sha1(body).hexdigest())
+    with _lock:
+        _entries[key] = entry
+        while len(_entries) > CACHE_SIZE:
+            _entries.popitem(last=False)
+    return entry
+
+
+def negotiate(entry, accept_encodings, if_none_match):
+    """选出响应编码，返回 (status, encoding, headers)；两个参数是 werkzeug 解析好的请求头"""
+    _, variants, etag = entry
+    compressible = assets.should_compress_json(variants['identity'])
+    encoding = assets.pick_encoding(accept=accept_encodings) if compressible else 'identity'
+    if encoding != 'identity':
+        etag = f'{etag}-{encoding}'
+
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+    if compressible:
+        headers['Vary'] = 'Accept-Encoding'
+    if if_none_match.contains(etag):
+        return 304, encoding, headers
+
+    headers['Content-Type'] = 'application/json'
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return 200, encoding, headers
+
+
+def has_body(entry, encoding):
+    return encoding in entry[1]
+
+
+def body(entry, encoding):
+    variants = entry[1]
+    data = variants.get(encoding)
+    if data is None:
+        # 每个版本每种编码只压缩一次，和未压缩的正文放在同一个缓存条目里
+        data = variants[encoding] = assets.compress(variants['identity'], encoding, fast=True)
+    return data
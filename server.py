@@ -1,185 +1,135 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, request
 from flask_cors import CORS
+import assets
+import db
+import events
+import images
+import metrics
+import migrations
 import os
-import sqlite3
+import random
+import repository
+import response_cache
+import threading
+from bisect import bisect_right
+from contextlib import closing
 from datetime import datetime, timedelta, timezone
+from itertools import accumulate
 
 app = Flask(__name__)
+app.json = repository.JSONProvider(app)
+# 先于 CORS 和压缩注册，after_request 里最后执行
+metrics.install(app)
 CORS(app)
+app.after_request(assets.compress_response)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, 'eat.db')
-IMG_DIR = os.path.join(BASE_DIR, 'img')
-
+DB_FILE = os.environ.get('EAT_DB_FILE', os.path.join(BASE_DIR, 'eat.db'))
+IMG_DIR = os.environ.get('EAT_IMG_DIR', os.path.join(BASE_DIR, 'img'))
+ASSETS = assets.AssetBundle(BASE_DIR, ['eat.html', 'stats.html', 'common.css'])
+PICK_MAX = 50
+BJ_TZ = timezone(timedelta(hours=8))
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+_cache_lock = threading.Lock()
+_weight_rules = {'stamp': None, 'rules': {}}
+_pick_table = {'stamp': None, 'vendors': [], 'weights': [], 'prefix': [], 'fenwick': [0]}
+_vendor_activity = {'stamp': None, 'db_file': None, 'seq': 0, 'vendors': {}}
+_recommend_table = {'stamp': None, 'vendors': [], 'weights': [], 'prefix': [], 'fenwick': [0], 'ranked': []}
 
 
-def ensure_meal_vendor_schema(conn):
-    columns = {
-        row['name']
-        for row in conn.execute('PRAGMA table_info(meals)').fetchall()
-    }
-    if 'vendor_id' in columns:
-        return
+def get_conn():
+    """读服务的请求路径只用只读连接，不会和管理端争写锁"""
+    return db.get_conn(DB_FILE, readonly=True)
 
-    conn.execute('ALTER TABLE meals ADD COLUMN vendor_id INTEGER')
 
-    meal_vendor_names = [
-        row['order_text'].strip()
-        for row in conn.execute(
-            """
-            SELECT DISTINCT order_text
-            FROM meals
-            WHERE TRIM(order_text) != ''
-            """
-        ).fetchall()
-    ]
+def ensure_db():
+    os.makedirs(IMG_DIR, exist_ok=True)
+    # 迁移只在启动时用一次可写连接，最新版本时只是读一下 user_version
+    with closing(db.connect(DB_FILE)) as conn:
+        migrations.migrate(conn)
 
-    existing_vendor_names = {
-        row['vendor']
-        for row in conn.execute('SELECT vendor FROM vendors').fetchall()
-    }
 
-    for vendor_name in meal_vendor_names:
-        if vendor_name not in existing_vendor_names:
-            conn.execute(
-                'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
-                (vendor_name, 0),
-            )
-            existing_vendor_names.add(vendor_name)
-
-    conn.execute(
-        """
-        UPDATE meals
-        SET vendor_id = (
-            SELECT id FROM vendors WHERE vendor = TRIM(meals.order_text)
-        )
-        WHERE vendor_id IS NULL AND TRIM(order_text) != ''
-        """
-    )
-    conn.execute(
-        """
-        UPDATE meals
-        SET order_text = ''
-        WHERE vendor_id IS NOT NULL AND TRIM(order_text) != ''
-        """
-    )
-    conn.commit()
+# 下标与 migrations.price_bucket_sql 的价格区间一一对应
+PRICE_RANGES = ['免费', '¥0-10', '¥10-15', '¥15-20', '¥20-25', '¥25-30', '¥30-40', '¥40+']
 
 
-def ensure_db():
-    os.makedirs(IMG_DIR, exist_ok=True)
-    with get_conn() as conn:
-        conn.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS vendors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vendor TEXT NOT NULL UNIQUE,
-                weight INTEGER NOT NULL DEFAULT 0 CHECK(weight >= 0)
-            )
-            '''
-        )
-        conn.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS meals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                order_text TEXT NOT NULL DEFAULT '',
-                price REAL NOT NULL DEFAULT 0 CHECK(price >= 0),
-                rate REAL NOT NULL DEFAULT 1 CHECK(rate >= 0.5 AND rate <= 5),
-                image TEXT NOT NULL DEFAULT ''
-            )
-            '''
-        )
-        ensure_meal_vendor_schema(conn)
-        conn.commit()
+def read_vendors():
+    return repository.read_vendors(get_conn())
 
 
-def serialize_vendor(row):
-    return {
-        'id': row['id'],
-        'vendor': row['vendor'],
-        'weight': row['weight'],
-    }
+def read_meals():
+    return repository.read_meals(get_conn())
 
 
-def serialize_meal(row):
-    return {
-        'id': row['id'],
-        'date': row['date'],
-        'vendor_id': row['vendor_id'],
-        'vendor_name': row['vendor_name'],
-        'order': row['order_text'] or '',
-        'price': row['price'],
-        'rate': row['rate'],
-        'image': row['image'],
-    }
+def current_versions():
+    return response_cache.current_versions(DB_FILE)
 
 
-def read_vendors():
-    with get_conn() as conn:
-        rows = conn.execute(
-            'SELECT id, vendor, weight FROM vendors ORDER BY id ASC'
-        ).fetchall()
-    return [serialize_vendor(row) for row in rows]
-
+def cached_json(resources, build, extra=None):
+    """按数据版本缓存编码后的 JSON，并支持 ETag / If-None-Match → 304"""
+    key = response_cache.cache_key(request.path, request.args.items(multi=True))
+    stamp = response_cache.make_stamp(current_versions(), resources, extra)
+    entry = response_cache.lookup(key, stamp)
+    if entry is None:
+        with metrics.span('rows'):
+            data = build()
+        entry = response_cache.store(key, stamp, data)
 
-def read_meals():
-    with get_conn() as conn:
-        rows = conn.execute(
-            '''
-            SELECT
-                m.id,
-                m.date,
-                m.vendor_id,
-                v.vendor AS vendor_name,
-                m.order_text,
-                m.price,
-                m.rate,
-                m.image
-            FROM meals AS m
-            LEFT JOIN vendors AS v ON v.id = m.vendor_id
-            ORDER BY m.date DESC, m.id DESC
-            '''
-        ).fetchall()
-    return [serialize_meal(row) for row in rows]
+    status, encoding, headers = response_cache.negotiate(
+        entry, request.accept_encodings, request.if_none_match
+    )
+    if status == 304:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(response_cache.body(entry, encoding))
+    response.headers.update(headers)
+    return response
 
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'eat.html')
+    return ASSETS.send('eat.html')
 
 
 @app.route('/common.css')
 def common_css():
-    return send_from_directory('.', 'common.css')
+    return ASSETS.send('common.css')
 
 
 @app.route('/stats')
 def stats():
-    return send_from_directory('.', 'stats.html')
+    return ASSETS.send('stats.html')
 
 
-@app.route('/api/stats')
-def api_stats():
+@app.route('/assets/<digest>/<name>')
+def hashed_asset(digest, name):
+    return ASSETS.send(name, digest)
+
+
+def read_stats():
     with get_conn() as conn:
         summary = conn.execute(
             """
             SELECT
-                COUNT(*) AS totalMeals,
-                COUNT(DISTINCT vendor_id) AS vendorsUsed,
-                ROUND(AVG(price), 2) AS avgPrice,
-                ROUND(MIN(price), 2) AS minPrice,
-                ROUND(MAX(price), 2) AS maxPrice,
-                ROUND(SUM(price), 2) AS totalSpent,
-                ROUND(AVG(rate), 1) AS avgRating
-            FROM meals
-            WHERE price > 0
+                s.count AS totalMeals,
+                (
+                    SELECT COUNT(*) FROM stats_vendor
+                    WHERE vendor_id > 0 AND count > 0
+                ) AS vendorsUsed,
+                ROUND(s.total / s.count, 2) AS avgPrice,
+                (
+                    SELECT ROUND(price, 2) FROM meals
+                    WHERE price > 0 ORDER BY price ASC LIMIT 1
+                ) AS minPrice,
+                (
+                    SELECT ROUND(price, 2) FROM meals
+                    WHERE price > 0 ORDER BY price DESC LIMIT 1
+                ) AS maxPrice,
+                CASE WHEN s.count > 0 THEN ROUND(s.total, 2) END AS totalSpent,
+                ROUND(s.rate_sum / s.count, 1) AS avgRating
+            FROM stats_summary AS s
+            WHERE s.id = 1
             """
         ).fetchone()
 
@@ -187,14 +137,13 @@ def api_stats():
             """
             SELECT
                 v.vendor,
-                COUNT(m.id) AS count,
-                ROUND(AVG(m.price), 2) AS avgPrice,
-                ROUND(SUM(m.price), 2) AS total
-            FROM meals m
-            JOIN vendors v ON m.vendor_id = v.id
-            WHERE m.price > 0
-            GROUP BY m.vendor_id
-            ORDER BY count DESC, total DESC
+                s.count,
+                ROUND(s.total / s.count, 2) AS avgPrice,
+                ROUND(s.total, 2) AS total
+            FROM stats_vendor s
+            JOIN vendors v ON s.vendor_id = v.id
+            WHERE s.count > 0
+            ORDER BY s.count DESC, s.total DESC
             LIMIT 15
             """
         ).fetchall()
@@ -202,46 +151,31 @@ def api_stats():
         monthly = conn.execute(
             """
             SELECT
-                SUBSTR(date, 1, 4) AS month,
-                COUNT(*) AS count,
-                ROUND(SUM(price), 2) AS total,
-                ROUND(AVG(price), 2) AS avgPrice
-            FROM meals
-            WHERE price > 0
-            GROUP BY month
+                month,
+                count,
+                ROUND(total, 2) AS total,
+                ROUND(total / count, 2) AS avgPrice
+            FROM stats_month
+            WHERE count > 0
             ORDER BY month
             """
         ).fetchall()
 
         rating_dist = conn.execute(
             """
-            SELECT
-                ROUND(rate * 2) / 2 AS rating,
-                COUNT(*) AS count
-            FROM meals
-            WHERE price > 0
-            GROUP BY rating
+            SELECT rating, count
+            FROM stats_rating
+            WHERE count > 0
             ORDER BY rating DESC
             """
         ).fetchall()
 
         price_dist = conn.execute(
             """
-            SELECT
-                CASE
-                    WHEN price = 0 THEN '免费'
-                    WHEN price <= 10 THEN '¥0-10'
-                    WHEN price <= 15 THEN '¥10-15'
-                    WHEN price <= 20 THEN '¥15-20'
-                    WHEN price <= 25 THEN '¥20-25'
-                    WHEN price <= 30 THEN '¥25-30'
-                    WHEN price <= 40 THEN '¥30-40'
-                    ELSE '¥40+'
-                END AS range,
-                COUNT(*) AS count
-            FROM meals
-            GROUP BY range
-            ORDER BY MIN(price)
+            SELECT bucket, count
+            FROM stats_price
+            WHERE count > 0
+            ORDER BY bucket
             """
         ).fetchall()
 
@@ -249,20 +183,18 @@ def api_stats():
             """
             SELECT
                 v.vendor,
-                COUNT(m.id) AS count,
-                ROUND(AVG(m.rate), 1) AS avgRating,
-                ROUND(AVG(m.price), 2) AS avgPrice
-            FROM meals m
-            JOIN vendors v ON m.vendor_id = v.id
-            WHERE m.price > 0
-            GROUP BY m.vendor_id
-            HAVING count >= 2
-            ORDER BY avgRating DESC, count DESC
+                s.count,
+                ROUND(s.rate_sum / s.count, 1) AS avgRating,
+                ROUND(s.total / s.count, 2) AS avgPrice
+            FROM stats_vendor s
+            JOIN vendors v ON s.vendor_id = v.id
+            WHERE s.count >= 2
+            ORDER BY avgRating DESC, s.count DESC
             LIMIT 10
             """
         ).fetchall()
 
-    return jsonify({
+    return {
         'summary': {
             'totalMeals': summary['totalMeals'],
             'vendorsUsed': summary['vendorsUsed'],
@@ -275,50 +207,711 @@ def api_stats():
         'topVendors': [dict(r) for r in top_vendors],
         'monthly': [dict(r) for r in monthly],
         'ratingDist': [dict(r) for r in rating_dist],
-        'priceDist': [dict(r) for r in price_dist],
+        'priceDist': [
+            {'range': PRICE_RANGES[r['bucket']], 'count': r['count']}
+            for r in price_dist
+        ],
         'vendorRatings': [dict(r) for r in vendor_ratings],
-    })
+    }
 
 
-BJ_TZ = timezone(timedelta(hours=8))
+STATS_QUERY_KEYS = {'from', 'to', 'bucket', 'vendor_id'}
+# 各粒度的分组键（按天汇总表里的 day 是 YYMMDD）：天 YYMMDD、周取周一的 YYMMDD、月 YYMM、年 YY
+STATS_BUCKETS = {
+    'day': 'day',
+    'week': (
+        "SUBSTR(strftime('%Y%m%d', '20' || SUBSTR(day, 1, 2) || '-' || SUBSTR(day, 3, 2) || '-' || SUBSTR(day, 5, 2),"
+        " '-6 days', 'weekday 1'), 3)"
+    ),
+    'month': 'SUBSTR(day, 1, 4)',
+    'year': 'SUBSTR(day, 1, 2)',
+}
+
+
+def parse_stats_query(args):
+    """解析 /api/stats 的范围参数，日期统一为 YYMMDD；返回 (query, 错误信息)"""
+    query = {'date_from': None, 'date_to': None, 'bucket': args.get('bucket', 'month'), 'vendor_id': None}
+    if query['bucket'] not in STATS_BUCKETS:
+        return None, 'bucket必须是day、week、month或year'
+
+    for key, field in (('from', 'date_from'), ('to', 'date_to')):
+        if args.get(key):
+            query[field] = repository.parse_meal_date(args[key])
+            if query[field] is None:
+                return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
+
+    if args.get('vendor_id'):
+        try:
+            query['vendor_id'] = int(args['vendor_id'])
+        except ValueError:
+            return None, '无效的商家ID'
+    return query, None
+
+
+def read_stats_range(query):
+    """任意日期范围、粒度的统计：只读按天汇总表，范围条件走主键"""
+    clauses, params = ['count > 0'], []
+    if query['vendor_id'] is not None:
+        table = 'stats_vendor_daily'
+        clauses.append('vendor_id = ?')
+        params.append(query['vendor_id'])
+    else:
+        table = 'stats_daily'
+    if query['date_from']:
+        clauses.append('day >= ?')
+        params.append(query['date_from'])
+    if query['date_to']:
+        clauses.append('day <= ?')
+        params.append(query['date_to'])
+    where = ' AND '.join(clauses)
+
+    conn = get_conn()
+    buckets = conn.execute(
+        f"""
+        SELECT
+            {STATS_BUCKETS[query['bucket']]} AS bucket,
+            SUM(count) AS count,
+            ROUND(SUM(total), 2) AS total,
+            ROUND(SUM(total) / SUM(count), 2) AS avgPrice,
+            ROUND(SUM(rate_sum) / SUM(count), 1) AS avgRating
+        FROM {table}
+        WHERE {where}
+        GROUP BY bucket
+        ORDER BY bucket
+        """,
+        params,
+    ).fetchall()
+
+    summary = conn.execute(
+        f"""
+        SELECT
+            COALESCE(SUM(count), 0) AS totalMeals,
+            ROUND(SUM(total), 2) AS totalSpent,
+            ROUND(SUM(total) / SUM(count), 2) AS avgPrice,
+            ROUND(SUM(rate_sum) / SUM(count), 1) AS avgRating
+        FROM {table}
+        WHERE {where}
+        """,
+        params,
+    ).fetchone()
+    if query['vendor_id'] is not None:
+        vendors_used = 1 if summary['totalMeals'] and query['vendor_id'] > 0 else 0
+    else:
+        # 每个商家按主键 (vendor_id, day) 找范围内的第一条，不用按日期扫全部商家的行
+        vendors_used = conn.execute(
+            f"""
+            SELECT COUNT(*) FROM stats_vendor AS s
+            WHERE s.vendor_id > 0 AND s.count > 0 AND EXISTS (
+                SELECT 1 FROM stats_vendor_daily
+                WHERE stats_vendor_daily.vendor_id = s.vendor_id AND {where}
+            )
+            """,
+            params,
+        ).fetchone()[0]
 
+    return {
+        'range': {
+            'from': query['date_from'],
+            'to': query['date_to'],
+            'bucket': query['bucket'],
+            'vendor_id': query['vendor_id'],
+        },
+        'summary': {**dict(summary), 'vendorsUsed': vendors_used},
+        'buckets': [dict(r) for r in buckets],
+    }
+
+
+@app.route('/api/stats')
+def api_stats():
+    if not STATS_QUERY_KEYS.intersection(request.args):
+        return cached_json(('vendors', 'meals'), read_stats)
+
+    query, error = parse_stats_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    return cached_json(('meals',), lambda: read_stats_range(query))
+
+
+VENDOR_STATS_WINDOWS = (30, 90, 365)
+VENDOR_STATS_PAGE_SIZE = 50
+VENDOR_STATS_PAGE_MAX = 500
+
+
+def window_value(window, field):
+    return lambda s: s['windows'][window][field]
+
+
+# 排序键 → 取值；空值（从没吃过、没有评分）无论升降序都排在最后
+VENDOR_STATS_SORTS = {
+    'vendor': lambda s: s['vendor'],
+    'count': lambda s: s['count'],
+    'total': lambda s: s['total'],
+    'avgPrice': lambda s: s['avgPrice'],
+    'avgRating': lambda s: s['avgRating'],
+    'medianRating': lambda s: s['medianRating'],
+    'lastVisit': lambda s: s['lastVisit'],
+    **{
+        f'{field}{days}d': window_value(f'{days}d', field)
+        for days in VENDOR_STATS_WINDOWS
+        for field in ('count', 'total', 'avgRating')
+    },
+}
+
+
+def vendor_window_columns():
+    columns = []
+    for days in VENDOR_STATS_WINDOWS:
+        inside = f'd.day >= :from{days}'
+        columns += [
+            f'COALESCE(SUM(CASE WHEN {inside} THEN d.count END), 0) AS count{days}',
+            f'ROUND(COALESCE(SUM(CASE WHEN {inside} THEN d.total END), 0), 2) AS total{days}',
+            f'ROUND(SUM(CASE WHEN {inside} THEN d.rate_sum END) / SUM(CASE WHEN {inside} THEN d.count END), 1)'
+            f' AS avgRating{days}',
+        ]
+    return ',\n'.join(columns)
+
+
+def median_rating(dist):
+    """dist 是按评分升序的 [(评分, 次数)]；偶数个时取中间两个的平均"""
+    total = sum(count for _, count in dist)
+    if not total:
+        return None
+
+    def nth(index):
+        for rating, count in dist:
+            if index < count:
+                return rating
+            index -= count
+
+    return (nth((total - 1) // 2) + nth(total // 2)) / 2
+
+
+def read_vendor_stats(vendor_id=None, today=None):
+    """每个商家的累计数据、评分中位数、最近一次到访和近 30/90/365 天的数据。
+
+    全部来自增量维护的汇总表：stats_vendor、stats_vendor_rating，
+    滚动窗口按主键 (vendor_id, day) 读 stats_vendor_daily 最近一年的行，
+    最近到访取 stats_vendor_daily 里该商家有记录的最大日期（按主键倒查），
+    和其他字段一样只算价格大于 0 的记录，耗时与点餐记录总数无关。
+    """
+    today = today or datetime.now(BJ_TZ).date()
+    params = {'today': today.strftime('%y%m%d'), 'vendor_id': vendor_id}
+    for days in VENDOR_STATS_WINDOWS:
+        params[f'from{days}'] = (today - timedelta(days=days - 1)).strftime('%y%m%d')
+    where = 'WHERE v.id = :vendor_id' if vendor_id is not None else ''
+
+    conn = get_conn()
+    rows = conn.execute(
+        f"""
+        SELECT
+            v.id,
+            v.vendor,
+            COALESCE(s.count, 0) AS count,
+            ROUND(COALESCE(s.total, 0), 2) AS total,
+            ROUND(s.total / s.count, 2) AS avgPrice,
+            ROUND(s.rate_sum / s.count, 1) AS avgRating,
+            (
+                SELECT MAX(l.day) FROM stats_vendor_daily AS l WHERE l.vendor_id = v.id AND l.count > 0
+            ) AS lastVisit,
+            {vendor_window_columns()}
+        FROM vendors AS v
+        LEFT JOIN stats_vendor AS s ON s.vendor_id = v.id
+        LEFT JOIN stats_vendor_daily AS d
+            ON d.vendor_id = v.id AND d.day >= :from{max(VENDOR_STATS_WINDOWS)} AND d.day <= :today
+        {where}
+        GROUP BY v.id
+        ORDER BY v.id
+        """,
+        params,
+    ).fetchall()
+
+    dists = {}
+    for row in conn.execute(
+        f"""
+        SELECT vendor_id, rating, count
+        FROM stats_vendor_rating
+        WHERE count > 0 {'AND vendor_id = :vendor_id' if vendor_id is not None else ''}
+        ORDER BY vendor_id, rating
+        """,
+        params,
+    ).fetchall():
+        dists.setdefault(row['vendor_id'], []).append((row['rating'], row['count']))
+
+    stats = []
+    for row in rows:
+        dist = dists.get(row['id'], [])
+        item = {
+            'id': row['id'],
+            'vendor': row['vendor'],
+            'count': row['count'],
+            'total': row['total'],
+            'avgPrice': row['avgPrice'],
+            'avgRating': row['avgRating'],
+            'medianRating': median_rating(dist),
+            'lastVisit': row['lastVisit'],
+            'windows': {
+                f'{days}d': {
+                    'count': row[f'count{days}'],
+                    'total': row[f'total{days}'],
+                    'avgRating': row[f'avgRating{days}'],
+                }
+                for days in VENDOR_STATS_WINDOWS
+            },
+        }
+        if vendor_id is not None:
+            item['ratingDist'] = [{'rating': rating, 'count': count} for rating, count in reversed(dist)]
+        stats.append(item)
+    return stats
+
+
+def parse_vendor_stats_query(args):
+    """返回 (query, 错误信息)；sort 见 VENDOR_STATS_SORTS，order 为 asc / desc"""
+    query = {'sort': args.get('sort', 'count'), 'order': args.get('order', 'desc')}
+    if query['sort'] not in VENDOR_STATS_SORTS:
+        return None, f"sort必须是{'、'.join(VENDOR_STATS_SORTS)}之一"
+    if query['order'] not in ('asc', 'desc'):
+        return None, 'order必须是asc或desc'
+
+    for key, default in (('limit', VENDOR_STATS_PAGE_SIZE), ('offset', 0)):
+        try:
+            query[key] = int(args.get(key, default))
+        except (TypeError, ValueError):
+            return None, f'{key}必须是整数'
+    if query['limit'] < 1 or query['limit'] > VENDOR_STATS_PAGE_MAX:
+        return None, f'limit必须在1-{VENDOR_STATS_PAGE_MAX}之间'
+    if query['offset'] < 0:
+        return None, 'offset不能为负数'
+    return query, None
+
+
+def read_vendor_stats_page(query, today=None):
+    stats = read_vendor_stats(today=today)
+    key = VENDOR_STATS_SORTS[query['sort']]
+    present = [s for s in stats if key(s) is not None]
+    # 先按 id 排好，稳定排序后同值的商家顺序固定
+    present.sort(key=key, reverse=query['order'] == 'desc')
+    ordered = present + [s for s in stats if key(s) is None]
+
+    start, end = query['offset'], query['offset'] + query['limit']
+    return {
+        'vendors': ordered[start:end],
+        'total': len(ordered),
+        'next_offset': end if end < len(ordered) else None,
+    }
 
-def ensure_kji_weight():
-    """自动调整K记权重：星期四 1000，其他 100"""
-    with get_conn() as conn:
-        kji = conn.execute(
-            "SELECT id, weight FROM vendors WHERE vendor = 'K记'"
-        ).fetchone()
-        if not kji:
-            return
-        target = 1000 if datetime.now(BJ_TZ).weekday() == 3 else 100
-        if kji['weight'] != target:
-            conn.execute(
-                "UPDATE vendors SET weight = ? WHERE id = ?",
-                (target, kji['id']),
-            )
-            conn.commit()
+
+@app.route('/api/vendors/stats', methods=['GET'])
+def api_vendors_stats():
+    query, error = parse_vendor_stats_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    # 滚动窗口随日期变化，当天的日期也是缓存版本的一部分
+    today = datetime.now(BJ_TZ).date()
+    return cached_json(('vendors', 'meals'), lambda: read_vendor_stats_page(query, today), extra=today)
+
+
+@app.route('/api/vendors/<int:vendor_id>/stats', methods=['GET'])
+def api_vendor_stats(vendor_id):
+    if repository.get_vendor(get_conn(), vendor_id) is None:
+        return jsonify({'error': '商家不存在'}), 404
+    today = datetime.now(BJ_TZ).date()
+    return cached_json(('vendors', 'meals'), lambda: read_vendor_stats(vendor_id, today)[0], extra=today)
+
+
+def load_weight_rules():
+    """weight_rules 版本变化时重新读入内存，按商家分组、优先级从高到低"""
+    stamp = (current_versions().get('weight_rules', 0), DB_FILE)
+    with _cache_lock:
+        if _weight_rules['stamp'] == stamp:
+            return _weight_rules['rules']
+
+    rules = {}
+    for row in get_conn().execute(
+        '''
+        SELECT id, vendor_id, weekday, date_from, date_to, time_from, time_to, weight
+        FROM weight_rules
+        ORDER BY priority DESC, id DESC
+        '''
+    ).fetchall():
+        rules.setdefault(row['vendor_id'], []).append(dict(row))
+    with _cache_lock:
+        _weight_rules.update(stamp=stamp, rules=rules)
+    return rules
+
+
+def rule_matches(rule, now):
+    if rule['weekday'] is not None and now.weekday() != rule['weekday']:
+        return False
+
+    today = now.strftime('%y%m%d')
+    if rule['date_from'] and today < rule['date_from']:
+        return False
+    if rule['date_to'] and today > rule['date_to']:
+        return False
+
+    clock = now.strftime('%H:%M')
+    start, end = rule['time_from'], rule['time_to']
+    if start and end and start > end:
+        # 跨午夜的时段，如 22:00-02:00
+        return clock >= start or clock < end
+    if start and clock < start:
+        return False
+    if end and clock >= end:
+        return False
+    return True
+
+
+def active_rules(now):
+    """每个商家此刻生效的规则：匹配条件的规则中优先级最高的一条"""
+    active = {}
+    for vendor_id, rules in load_weight_rules().items():
+        for rule in rules:
+            if rule_matches(rule, now):
+                active[vendor_id] = rule
+                break
+    return active
+
+
+def rules_signature(active):
+    return tuple(sorted((vendor_id, rule['id']) for vendor_id, rule in active.items()))
+
+
+def read_effective_vendors(active):
+    return [
+        {**vendor, 'weight': active[vendor['id']]['weight']} if vendor['id'] in active else vendor
+        for vendor in read_vendors()
+    ]
 
 
 @app.route('/api/vendors', methods=['GET'])
 def get_vendors():
-    ensure_kji_weight()
-    return jsonify(read_vendors())
+    active = active_rules(datetime.now(BJ_TZ))
+    return cached_json(
+        ('vendors', 'weight_rules'),
+        lambda: read_effective_vendors(active),
+        extra=rules_signature(active),
+    )
 
 
 @app.route('/api/meals', methods=['GET'])
 def get_meals():
-    return jsonify(read_meals())
+    if not repository.MEAL_QUERY_KEYS.intersection(request.args):
+        return cached_json(('vendors', 'meals'), read_meals)
+
+    query, error = repository.parse_meal_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    return cached_json(('vendors', 'meals'), lambda: repository.read_meal_page(get_conn(), query))
+
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    query, error = repository.parse_search_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    return cached_json(('vendors', 'meals'), lambda: repository.read_search(get_conn(), query))
+
+
+def build_fenwick(weights):
+    tree = [0] * (len(weights) + 1)
+    for index, weight in enumerate(weights, 1):
+        tree[index] += weight
+        parent = index + (index & -index)
+        if parent < len(tree):
+            tree[parent] += tree[index]
+    return tree
+
+
+def fenwick_add(delta, size, index, value):
+    """把变化量记在 delta（节点 → 增量）里，共享的树保持只读，每次抽取不用复制整棵树"""
+    index += 1
+    while index < size:
+        delta[index] = delta.get(index, 0) + value
+        index += index & -index
+
+
+def fenwick_find(tree, target, delta=None):
+    """返回前缀和（叠加 delta 后）首次超过 target 的下标（0 起）"""
+    index = 0
+    step = 1 << (len(tree).bit_length() - 1)
+    while step:
+        nxt = index + step
+        if nxt < len(tree):
+            node = tree[nxt] + delta.get(nxt, 0) if delta else tree[nxt]
+            if node <= target:
+                index = nxt
+                target -= node
+        step >>= 1
+    return index
+
+
+def fenwick_total(tree, delta=None):
+    """整棵树（叠加 delta 后）的总和"""
+    total, index = 0, len(tree) - 1
+    while index:
+        total += tree[index] + delta.get(index, 0) if delta else tree[index]
+        index -= index & -index
+    return total
+
+
+def pick_table():
+    """按权重抽取用的前缀和表；商家、规则或当前生效规则变化时重建"""
+    active = active_rules(datetime.now(BJ_TZ))
+    versions = current_versions()
+    stamp = (
+        versions.get('vendors', 0),
+        versions.get('weight_rules', 0),
+        rules_signature(active),
+        DB_FILE,
+    )
+    with _cache_lock:
+        if _pick_table['stamp'] == stamp:
+            return _pick_table
+
+    candidates = [
+        vendor for vendor in read_effective_vendors(active) if vendor['weight'] > 0
+    ]
+    weights = [vendor['weight'] for vendor in candidates]
+    table = {
+        'stamp': stamp,
+        'vendors': candidates,
+        'weights': weights,
+        'prefix': list(accumulate(weights)),
+        'fenwick': build_fenwick(weights),
+    }
+    with _cache_lock:
+        _pick_table.update(table)
+    return table
+
+
+def pick_vendors(table, count, rng):
+    """按表里的 weights 不放回地抽 count 个（推荐模式下 weights 是打分）"""
+    vendors, prefix = table['vendors'], table['prefix']
+    if not vendors:
+        return []
+    if count == 1:
+        # 打分是浮点数，random() * 总和可能舍入到总和本身
+        index = min(bisect_right(prefix, rng.random() * prefix[-1]), len(vendors) - 1)
+        return [vendors[index]]
+
+    weights, tree = table['weights'], table['fenwick']
+    delta = {}
+    remaining = prefix[-1]
+    picks, taken = [], set()
+    for _ in range(min(count, len(vendors))):
+        index = fenwick_find(tree, rng.random() * remaining, delta)
+        if index >= len(vendors) or index in taken:
+            # remaining 是浮点累减的，可能比树里实际剩下的略大，越界或落到抽过的商家：按树的实际总和重抽
+            remaining = fenwick_total(tree, delta)
+            index = fenwick_find(tree, rng.random() * remaining, delta)
+            if index >= len(vendors) or index in taken:
+                # 剩下的权重都已舍入成 0
+                index = next(i for i in range(len(vendors)) if i not in taken)
+        taken.add(index)
+        picks.append(vendors[index])
+        fenwick_add(delta, len(tree), index, -weights[index])
+        remaining -= weights[index]
+    return picks
+
+
+def parse_pick_query(args, default=1):
+    """返回 ((数量, 随机数生成器), 错误信息)"""
+    try:
+        count = int(args.get('n', default))
+    except ValueError:
+        return None, 'n必须是整数'
+    if count < 1 or count > PICK_MAX:
+        return None, f'n必须在1-{PICK_MAX}之间'
+
+    seed = args.get('seed')
+    return (count, random.Random(seed) if seed is not None else random), None
+
+
+# 推荐模式：打分 = 生效权重 × 评分系数 × 近期到访衰减
+RECOMMEND_TOP = 5
+RECOMMEND_PRIOR_RATING = 3.0  # 评分按 3 分、3 次做平滑，到访少的商家不会因为一次高分/低分大起大落
+RECOMMEND_PRIOR_VISITS = 3
+RECOMMEND_RECENT_PENALTY = 0.9  # 当天吃过 ×0.1，惩罚每 3 天减半：昨天 ×0.29，一周前 ×0.83
+RECOMMEND_HALF_LIFE_DAYS = 3
+
+
+def day_ordinal(day):
+    try:
+        return datetime.strptime(day, '%y%m%d').toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_vendor_activity():
+    """每个商家的到访汇总 {vendor_id: (到访次数, 评分和, 最近到访, 最近到访的序数)}。
+
+    meals 版本变化时只读 vendor_activity 里 seq 比上次大的行（写入时由触发器维护），
+    其余商家沿用内存里的数据；换了数据库或 seq 变小（库被重建）时整张表重读。
+    """
+    stamp = (current_versions().get('meals', 0), DB_FILE)
+    with _cache_lock:
+        if _vendor_activity['stamp'] == stamp:
+            return _vendor_activity
+        previous = dict(_vendor_activity)
+
+    conn = get_conn()
+    top = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM vendor_activity').fetchone()[0]
+    if previous['db_file'] != DB_FILE or top < previous['seq']:
+        seq, vendors = 0, {}
+    else:
+        seq, vendors = previous['seq'], dict(previous['vendors'])
+    for row in conn.execute(
+        'SELECT vendor_id, visits, rate_sum, last_date, seq FROM vendor_activity WHERE seq > ? ORDER BY seq',
+        (seq,),
+    ).fetchall():
+        vendors[row['vendor_id']] = (row['visits'], row['rate_sum'], row['last_date'], day_ordinal(row['last_date']))
+        seq = row['seq']
+
+    activity = {'stamp': stamp, 'db_file': DB_FILE, 'seq': seq, 'vendors': vendors}
+    with _cache_lock:
+        if _vendor_activity['db_file'] != DB_FILE or _vendor_activity['seq'] <= seq:
+            _vendor_activity.update(activity)
+    return activity
+
+
+def recommend_score(vendor, activity, today):
+    visits, rate_sum, last_date, last_day = activity or (0, 0.0, None, None)
+    rating = (rate_sum + RECOMMEND_PRIOR_RATING * RECOMMEND_PRIOR_VISITS) / (visits + RECOMMEND_PRIOR_VISITS)
+    days = max(today - last_day, 0) if visits and last_day is not None else None
+    recency = 1.0
+    if days is not None:
+        recency -= RECOMMEND_RECENT_PENALTY * 0.5 ** (days / RECOMMEND_HALF_LIFE_DAYS)
+    return {
+        **vendor,
+        'score': round(vendor['weight'] * rating / RECOMMEND_PRIOR_RATING * recency, 4),
+        'avgRating': round(rate_sum / visits, 1) if visits else None,
+        'lastVisit': last_date if visits else None,
+        'daysSince': days,
+    }
+
+
+def recommend_table():
+    """推荐模式的抽取表：候选商家与 pick_table 相同，权重换成打分，另按打分从高到低排好。
+
+    抽取表、到访汇总或日期变化时重建（商家数量级的计算），否则直接复用。
+    """
+    base = pick_table()
+    activity = load_vendor_activity()
+    today = datetime.now(BJ_TZ).date().toordinal()
+    stamp = (base['stamp'], activity['seq'], activity['db_file'], today)
+    with _cache_lock:
+        if _recommend_table['stamp'] == stamp:
+            return _recommend_table
+
+    scored = [
+        recommend_score(vendor, activity['vendors'].get(vendor['id']), today)
+        for vendor in base['vendors']
+    ]
+    weights = [vendor['score'] for vendor in scored]
+    table = {
+        'stamp': stamp,
+        'vendors': scored,
+        'weights': weights,
+        'prefix': list(accumulate(weights)),
+        'fenwick': build_fenwick(weights),
+        'ranked': sorted(scored, key=lambda vendor: (-vendor['score'], vendor['id'])),
+    }
+    with _cache_lock:
+        _recommend_table.update(table)
+    return table
+
+
+PICK_MODES = {'weight': pick_table, 'recommend': recommend_table}
+
+
+def parse_pick_mode(args):
+    """返回 (取抽取表的函数, 错误信息)"""
+    mode = args.get('mode', 'weight')
+    if mode not in PICK_MODES:
+        return None, 'mode必须是weight或recommend'
+    return PICK_MODES[mode], None
+
+
+@app.route('/api/meals/export', methods=['GET'])
+def export_meals():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in repository.EXPORT_MIMETYPES:
+        return jsonify({'error': 'format必须是ndjson或csv'}), 400
+
+    response = app.response_class(
+        repository.iter_meal_export(DB_FILE, export_format),
+        mimetype=repository.EXPORT_MIMETYPES[export_format],
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=meals.{export_format}'
+    return response
+
+
+@app.route('/api/pick', methods=['GET'])
+def api_pick():
+    query, error = parse_pick_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    build_table, error = parse_pick_mode(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    count, rng = query
+    return jsonify({'picks': pick_vendors(build_table(), count, rng)})
+
+
+@app.route('/api/recommend', methods=['GET'])
+def api_recommend():
+    query, error = parse_pick_query(request.args, default=RECOMMEND_TOP)
+    if error:
+        return jsonify({'error': error}), 400
+    count, _ = query
+    return jsonify({'vendors': recommend_table()['ranked'][:count]})
+
+
+def effective_change(resource, row):
+    """推送的商家行也按此刻生效的规则替换权重，与 /api/vendors 一致"""
+    if resource == 'vendors' and 'weight' in row:
+        rule = active_rules(datetime.now(BJ_TZ)).get(row['id'])
+        if rule is not None:
+            return {**row, 'weight': rule['weight']}
+    return row
+
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    if not events.SYNC_ENABLED:
+        return app.response_class(status=204)
+    after = events.parse_last_event_id(
+        request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    )
+    return app.response_class(
+        events.stream(DB_FILE, after, effective_change),
+        mimetype=events.MIMETYPE,
+        headers=events.HEADERS,
+    )
 
 
 @app.route('/img/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(IMG_DIR, filename)
+    return images.serve(IMG_DIR, filename)
+
+
+WARMUP_PATHS = (
+    '/', '/api/vendors', '/api/meals', f'/api/meals?limit={repository.MEALS_PAGE_SIZE}',
+    '/api/stats', '/api/pick', '/api/recommend',
+)
+
+
+def warmup():
+    """gunicorn 每个 worker 启动后调用：提前打开连接和版本探针，建好抽取表和常用响应的缓存"""
+    client = app.test_client()
+    for path in WARMUP_PATHS:
+        client.get(path, headers={'Accept-Encoding': 'br, gzip'}).close()
 
 
 ensure_db()
 
 if __name__ == '__main__':
-    print('Server running at http://localhost:5000')
-    print('Open http://localhost:5000 in your browser')
-    app.run(host='0.0.0.0', debug=False, port=5000)
+    port = int(os.environ.get('EAT_PORT', 5000))
+    print(f'Server running at http://localhost:{port}')
+    print(f'Open http://localhost:{port} in your browser')
+    app.run(host='0.0.0.0', debug=False, port=port)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""主站读接口的 ASGI 版本，给大量轮询、订阅事件或隧道另一端很慢的客户端用：
+
+    python server_asgi.py
+    uvicorn server_asgi:app --port 5000
+
+路由（含 /api/events 事件流）、查询逻辑和响应缓存都与 server.py 共用。读版本号、查库和压缩都放进有上限的线程池，
+事件循环里不碰 SQLite；空闲或很慢的连接只占一个协程，不占线程。
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags
+
+import events
+import repository
+import response_cache
+import server
+
+DB_THREADS = int(os.environ.get('EAT_DB_THREADS', 4))
+
+logger = logging.getLogger(__name__)
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='eat-db')
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+async def run_blocking(func, *args):
+    """查库、压缩等阻塞操作放进线程池；池满时后来的请求在事件循环里排队等待"""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+
+
+class Request:
+    """只解析读接口用得到的部分：路径、查询参数和请求头"""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(
+            parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        )
+        headers = {}
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+        self.headers = headers
+        self.accept_encodings = parse_accept_header(headers.get('accept-encoding'))
+        self.if_none_match = parse_etags(headers.get('if-none-match'))
+
+
+def json_response(data, status=200):
+    return status, {'Content-Type': 'application/json'}, repository.dumps(data)
+
+
+async def cached_json(request, resources, build, extra=None):
+    """与 server.cached_json 相同的缓存与协商逻辑；读版本号（PRAGMA，持有缓存锁）也在线程池里做"""
+    key = response_cache.cache_key(request.path, request.args.items(multi=True))
+    versions = await run_blocking(server.current_versions)
+    stamp = response_cache.make_stamp(versions, resources, extra)
+    entry = response_cache.lookup(key, stamp)
+    if entry is None:
+        entry = await run_blocking(lambda: response_cache.store(key, stamp, build()))
+
+    status, encoding, headers = response_cache.negotiate(
+        entry, request.accept_encodings, request.if_none_match
+    )
+    if status == 304:
+        return status, headers, b''
+    if response_cache.has_body(entry, encoding):
+        body = response_cache.body(entry, encoding)
+    else:
+        body = await run_blocking(response_cache.body, entry, encoding)
+    return status, headers, body
+
+
+async def get_vendors(request):
+    active = await run_blocking(lambda: server.active_rules(datetime.now(server.BJ_TZ)))
+    return await cached_json(
+        request,
+        ('vendors', 'weight_rules'),
+        lambda: server.read_effective_vendors(active),
+        extra=server.rules_signature(active),
+    )
+
+
+async def get_meals(request):
+    if not repository.MEAL_QUERY_KEYS.intersection(request.args):
+        return await cached_json(request, ('vendors', 'meals'), server.read_meals)
+
+    query, error = repository.parse_meal_query(request.args)
+    if error:
+        return json_response({'error': error}, 400)
+    return await cached_json(
+        request, ('vendors', 'meals'), lambda: repository.read_meal_page(server.get_conn(), query)
+    )
+
+
+async def api_stats(request):
+    if not server.STATS_QUERY_KEYS.intersection(request.args):
+        return await cached_json(request, ('vendors', 'meals'), server.read_stats)
+
+    query, error = server.parse_stats_query(request.args)
+    if error:
+        return json_response({'error': error}, 400)
+    return await cached_json(request, ('meals',), lambda: server.read_stats_range(query))
+
+
+async def api_pick(request):
+    query, error = server.parse_pick_query(request.args)
+    if error:
+        return json_response({'error': error}, 400)
+    build_table, error = server.parse_pick_mode(request.args)
+    if error:
+        return json_response({'error': error}, 400)
+    count, rng = query
+    picks = await run_blocking(lambda: server.pick_vendors(build_table(), count, rng))
+    return json_response({'picks': picks})
+
+
+async def api_recommend(request):
+    query, error = server.parse_pick_query(request.args, default=server.RECOMMEND_TOP)
+    if error:
+        return json_response({'error': error}, 400)
+    count, _ = query
+    table = await run_blocking(server.recommend_table)
+    return json_response({'vendors': table['ranked'][:count]})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_events(scope, receive, send):
+    """事件流只占一个协程：每轮在线程池里读一下表版本，有变化才读 change_log"""
+    request = Request(scope)
+    after = events.parse_last_event_id(
+        request.headers.get('last-event-id', request.args.get('last_event_id'))
+    )
+    if after is None:
+        after = await run_blocking(lambda: events.last_change_id(server.get_conn()))
+
+    headers = dict(events.HEADERS, **{'Content-Type': events.MIMETYPE, 'Access-Control-Allow-Origin': '*'})
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': f'retry: {events.RETRY_MS}\n\n'.encode(), 'more_body': True})
+
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    started = last_sent = loop.time()
+    seen = None
+    try:
+        while not disconnected.done():
+            versions = await run_blocking(server.current_versions)
+            stamp = tuple(versions.get(resource, 0) for resource in events.EVENT_RESOURCES)
+            now = loop.time()
+            chunk = b''
+            if stamp != seen:
+                seen = stamp
+                chunk, after = await run_blocking(
+                    lambda: events.changes_since(server.get_conn(), after, server.effective_change)
+                )
+            if not chunk and now - last_sent >= events.HEARTBEAT_SECONDS:
+                chunk = b': ping\n\n'
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                last_sent = now
+            if now - started >= events.STREAM_SECONDS:
+                break
+            await asyncio.wait([disconnected], timeout=events.POLL_SECONDS)
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+
+
+ROUTES = {
+    '/api/vendors': get_vendors,
+    '/api/meals': get_meals,
+    '/api/stats': api_stats,
+    '/api/pick': api_pick,
+    '/api/recommend': api_recommend,
+}
+
+
+async def handle(scope):
+    handler = ROUTES.get(scope['path'])
+    if handler is None:
+        return json_response({'error': 'Not Found'}, 404)
+    if scope['method'] not in ('GET', 'HEAD'):
+        status, headers, body = json_response({'error': 'Method Not Allowed'}, 405)
+        headers['Allow'] = 'GET, HEAD'
+        return status, headers, body
+    try:
+        return await handler(Request(scope))
+    except Exception:
+        logger.exception('处理 %s 失败', scope['path'])
+        return json_response({'error': 'Internal Server Error'}, 500)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # 与 gunicorn 的 post_worker_init 一样先预热，填进同一个响应缓存
+            await run_blocking(server.warmup)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            shutdown_executor()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/api/events' and scope['method'] == 'GET':
+        await stream_events(scope, receive, send)
+        return
+
+    status, headers, body = await handle(scope)
+    headers['Access-Control-Allow-Origin'] = '*'
+    headers['Content-Length'] = str(len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('EAT_PORT', 5000))
+    print(f'Async read server running at http://localhost:{port}')
+    uvicorn.run(
+        'server_asgi:app',
+        host='0.0.0.0',
+        port=port,
+        workers=int(os.environ.get('EAT_WORKERS', 1)),
+        timeout_keep_alive=int(os.environ.get('EAT_KEEPALIVE', 15)),
+        access_log=False,
+    )
@@ -1,186 +1,79 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Request, jsonify, request
 from flask_cors import CORS
+import assets
+import click
+import csv
+import db
+import events
+import images
+import io
+import metrics
+import migrations
 import os
+import repository
 import sqlite3
-import uuid
 from werkzeug.utils import secure_filename
 
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # 上传图片时 multipart 解析直接写进 IMG_DIR 的临时文件并计算哈希，不再额外复制一份
+        if self.endpoint == 'upload_image':
+            return images.UploadFile(IMG_DIR)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.json = repository.JSONProvider(app)
+# 先于 CORS 和压缩注册，after_request 里最后执行
+metrics.install(app)
 CORS(app)
+app.after_request(assets.compress_response)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, 'eat.db')
-IMG_DIR = os.path.join(BASE_DIR, 'img')
+DB_FILE = os.environ.get('EAT_DB_FILE', os.path.join(BASE_DIR, 'eat.db'))
+IMG_DIR = os.environ.get('EAT_IMG_DIR', os.path.join(BASE_DIR, 'img'))
+ASSETS = assets.AssetBundle(BASE_DIR, ['eat_manage.html', 'common.css'])
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
 
 
 def get_conn():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_conn(DB_FILE)
 
 
-def ensure_meal_vendor_schema(conn):
-    columns = {
-        row['name']
-        for row in conn.execute('PRAGMA table_info(meals)').fetchall()
-    }
-    if 'vendor_id' in columns:
-        return
-
-    conn.execute('ALTER TABLE meals ADD COLUMN vendor_id INTEGER')
-
-    meal_vendor_names = [
-        row['order_text'].strip()
-        for row in conn.execute(
-            """
-            SELECT DISTINCT order_text
-            FROM meals
-            WHERE TRIM(order_text) != ''
-            """
-        ).fetchall()
-    ]
-
-    existing_vendor_names = {
-        row['vendor']
-        for row in conn.execute('SELECT vendor FROM vendors').fetchall()
-    }
-
-    for vendor_name in meal_vendor_names:
-        if vendor_name not in existing_vendor_names:
-            conn.execute(
-                'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
-                (vendor_name, 0),
-            )
-            existing_vendor_names.add(vendor_name)
-
-    conn.execute(
-        """
-        UPDATE meals
-        SET vendor_id = (
-            SELECT id FROM vendors WHERE vendor = TRIM(meals.order_text)
-        )
-        WHERE vendor_id IS NULL AND TRIM(order_text) != ''
-        """
-    )
-    conn.execute(
-        """
-        UPDATE meals
-        SET order_text = ''
-        WHERE vendor_id IS NOT NULL AND TRIM(order_text) != ''
-        """
-    )
-    conn.commit()
+def write_transaction():
+    return db.write_transaction(get_conn())
 
 
 def ensure_db():
     os.makedirs(IMG_DIR, exist_ok=True)
-    with get_conn() as conn:
-        conn.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS vendors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vendor TEXT NOT NULL UNIQUE,
-                weight INTEGER NOT NULL DEFAULT 0 CHECK(weight >= 0)
-            )
-            '''
-        )
-        conn.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS meals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                order_text TEXT NOT NULL DEFAULT '',
-                price REAL NOT NULL DEFAULT 0 CHECK(price >= 0),
-                rate REAL NOT NULL DEFAULT 1 CHECK(rate >= 0.5 AND rate <= 5),
-                image TEXT NOT NULL DEFAULT ''
-            )
-            '''
-        )
-        ensure_meal_vendor_schema(conn)
-        conn.commit()
+    migrations.migrate(get_conn())
 
 
-def serialize_vendor(row):
-    return {
-        'id': row['id'],
-        'vendor': row['vendor'],
-        'weight': row['weight'],
-    }
-
-
-def serialize_meal(row):
-    return {
-        'id': row['id'],
-        'date': row['date'],
-        'vendor_id': row['vendor_id'],
-        'vendor_name': row['vendor_name'],
-        'order': row['order_text'] or '',
-        'price': row['price'],
-        'rate': row['rate'],
-        'image': row['image'],
-    }
+def read_version(conn, resource):
+    row = conn.execute(
+        'SELECT version FROM data_versions WHERE resource = ?',
+        (resource,),
+    ).fetchone()
+    return row['version'] if row else 0
 
 
 def read_vendors():
-    with get_conn() as conn:
-        rows = conn.execute(
-            'SELECT id, vendor, weight FROM vendors ORDER BY id ASC'
-        ).fetchall()
-    return [serialize_vendor(row) for row in rows]
+    return repository.read_vendors(get_conn())
 
 
 def read_meals():
-    with get_conn() as conn:
-        rows = conn.execute(
-            '''
-            SELECT
-                m.id,
-                m.date,
-                m.vendor_id,
-                v.vendor AS vendor_name,
-                m.order_text,
-                m.price,
-                m.rate,
-                m.image
-            FROM meals AS m
-            LEFT JOIN vendors AS v ON v.id = m.vendor_id
-            ORDER BY m.date DESC, m.id DESC
-            '''
-        ).fetchall()
-    return [serialize_meal(row) for row in rows]
+    return repository.read_meals(get_conn())
 
 
 def get_vendor(vendor_id):
-    with get_conn() as conn:
-        row = conn.execute(
-            'SELECT id, vendor, weight FROM vendors WHERE id = ?',
-            (vendor_id,),
-        ).fetchone()
-    return row
+    return repository.get_vendor(get_conn(), vendor_id)
 
 
 def get_meal(meal_id):
-    with get_conn() as conn:
-        row = conn.execute(
-            '''
-            SELECT
-                m.id,
-                m.date,
-                m.vendor_id,
-                v.vendor AS vendor_name,
-                m.order_text,
-                m.price,
-                m.rate,
-                m.image
-            FROM meals AS m
-            LEFT JOIN vendors AS v ON v.id = m.vendor_id
-            WHERE m.id = ?
-            ''',
-            (meal_id,),
-        ).fetchone()
-    return row
+    return repository.get_meal(get_conn(), meal_id)
 
 
 def parse_weight(value):
@@ -231,6 +124,11 @@ def validate_meal_payload(data, current=None):
 
     if not date:
         return None, '日期不能为空'
+    if 'date' in data:
+        # 统一存成 YYMMDD，按日期的范围查询和按天汇总都依赖这一点
+        date = repository.parse_meal_date(date)
+        if date is None:
+            return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
     if price is None:
         return None, '价格必须大于等于0'
     if rate is None:
@@ -250,32 +148,193 @@ def validate_meal_payload(data, current=None):
     }, None
 
 
+def parse_weekday(value):
+    if value in (None, ''):
+        return None, None
+    try:
+        weekday = int(value)
+    except (TypeError, ValueError):
+        return None, '星期必须是0-6的整数（0为星期一）'
+    if weekday < 0 or weekday > 6:
+        return None, '星期必须是0-6的整数（0为星期一）'
+    return weekday, None
+
+
+def parse_clock(value):
+    text = str(value or '').strip()
+    if not text:
+        return None, None
+    hour, sep, minute = text.partition(':')
+    if not (sep and hour.isdigit() and minute.isdigit()) or int(hour) > 23 or int(minute) > 59:
+        return None, '时间格式必须是HH:MM'
+    return f'{int(hour):02d}:{int(minute):02d}', None
+
+
+def validate_rule_payload(data):
+    vendor_id = parse_vendor_id(data.get('vendor_id'))
+    if vendor_id is None or get_vendor(vendor_id) is None:
+        return None, '无效的商家ID'
+
+    weight = parse_weight(data.get('weight'))
+    if weight is None:
+        return None, '权重必须是大于等于0的整数'
+
+    try:
+        priority = int(data.get('priority') or 0)
+    except (TypeError, ValueError):
+        return None, '优先级必须是整数'
+
+    weekday, error = parse_weekday(data.get('weekday'))
+    if error:
+        return None, error
+
+    rule = {
+        'vendor_id': vendor_id,
+        'weekday': weekday,
+        'weight': weight,
+        'priority': priority,
+    }
+    for key in ('date_from', 'date_to'):
+        rule[key] = repository.parse_meal_date(data.get(key)) if data.get(key) else None
+        if data.get(key) and rule[key] is None:
+            return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
+    for key in ('time_from', 'time_to'):
+        rule[key], error = parse_clock(data.get(key))
+        if error:
+            return None, error
+
+    return rule, None
+
+
+def validate_bulk_record(record):
+    """批量导入的单行校验（商家另行解析），日期统一为 YYMMDD"""
+    date = repository.parse_meal_date(str(record.get('date') or ''))
+    price = parse_price(record.get('price'))
+    rate = parse_rate(record.get('rate'))
+
+    if date is None:
+        return None, '日期格式必须是YYMMDD或YYYY-MM-DD'
+    if price is None:
+        return None, '价格必须大于等于0'
+    if rate is None:
+        return None, '评价必须在0.5-5之间，且以0.5为步长'
+
+    return {
+        'date': date,
+        'order_text': str(record.get('order') or '').strip(),
+        'price': price,
+        'rate': rate,
+        'image': str(record.get('image') or '').strip(),
+    }, None
+
+
+def read_bulk_records():
+    """JSON 数组 / {"meals": [...]}，或 CSV（请求体或 file 字段）"""
+    upload = request.files.get('file')
+    if upload is not None or request.mimetype == 'text/csv':
+        raw = upload.read() if upload is not None else request.get_data()
+        try:
+            text = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return None, 'CSV必须是UTF-8编码'
+        reader = csv.DictReader(io.StringIO(text))
+        columns = set(reader.fieldnames or [])
+        if not {'date', 'price', 'rate'} <= columns:
+            return None, 'CSV缺少date/price/rate列'
+        records = list(reader)
+        if not columns & {'vendor', 'vendor_id'}:
+            # 旧版 db_meal.csv：order 列就是商家名称
+            records = [{**record, 'vendor': record.get('order'), 'order': ''} for record in records]
+        return records, None
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('meals')
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        return None, '请求体必须是点餐记录数组或CSV'
+    return data, None
+
+
 def allowed_file(filename):
     _, ext = os.path.splitext(filename)
     return ext.lower() in ALLOWED_EXTENSIONS
 
 
+def wants_full_list():
+    """写接口默认只返回受影响的记录；?full=1 时附带完整列表（兼容旧客户端）"""
+    return request.args.get('full', '').lower() in ('1', 'true', 'yes')
+
+
+def vendor_response(vendor_id, version):
+    result = {
+        'success': True,
+        'vendor': repository.serialize_vendor(get_vendor(vendor_id)),
+        'version': version,
+    }
+    if wants_full_list():
+        result['vendors'] = read_vendors()
+    return jsonify(result)
+
+
+def meal_response(meal_id, version):
+    result = {
+        'success': True,
+        'meal': repository.serialize_meal(get_meal(meal_id)),
+        'version': version,
+    }
+    if wants_full_list():
+        result['meals'] = read_meals()
+    return jsonify(result)
+
+
 @app.route('/')
 def index():
-    return send_from_directory('.', 'eat_manage.html')
+    return ASSETS.send('eat_manage.html')
 
 
 @app.route("/common.css")
 def common_css():
-    return send_from_directory(".", "common.css")
+    return ASSETS.send("common.css")
 
 
 @app.route('/eat_manage.html')
 def eat_manage():
-    return send_from_directory('.', 'eat_manage.html')
+    return ASSETS.send('eat_manage.html')
+
+
+@app.route('/assets/<digest>/<name>')
+def hashed_asset(digest, name):
+    return ASSETS.send(name, digest)
+
+
+def versioned_json(resources, build):
+    """ETag 取自数据版本（先读版本再查数据），管理页轮询时据此判断有没有变化"""
+    conn = get_conn()
+    etag = '-'.join(str(read_version(conn, resource)) for resource in resources)
+    response = jsonify(build())
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @app.route('/api/vendors', methods=['GET'])
 def get_vendors():
-    return jsonify(read_vendors())
+    return versioned_json(('vendors',), read_vendors)
+
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    if not events.SYNC_ENABLED:
+        return app.response_class(status=204)
+    after = events.parse_last_event_id(
+        request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    )
+    return app.response_class(
+        events.stream(DB_FILE, after), mimetype=events.MIMETYPE, headers=events.HEADERS
+    )
 
 
 @app.route('/api/vendors', methods=['POST'])
+@db.retry_on_busy
 def add_vendor():
     data = request.get_json(silent=True) or {}
     vendor_name = (data.get('vendor') or '').strip()
@@ -287,19 +346,21 @@ def add_vendor():
         return jsonify({'error': '权重必须是大于等于0的整数'}), 400
 
     try:
-        with get_conn() as conn:
-            conn.execute(
+        with write_transaction() as conn:
+            cursor = conn.execute(
                 'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
                 (vendor_name, weight),
             )
-            conn.commit()
+            vendor_id = cursor.lastrowid
+            version = read_version(conn, 'vendors')
     except sqlite3.IntegrityError:
         return jsonify({'error': '该商家已存在'}), 400
 
-    return jsonify({'success': True, 'vendors': read_vendors()})
+    return vendor_response(vendor_id, version)
 
 
 @app.route('/api/vendors/<int:vendor_id>', methods=['PUT'])
+@db.retry_on_busy
 def update_vendor(vendor_id):
     data = request.get_json(silent=True) or {}
     current = get_vendor(vendor_id)
@@ -315,24 +376,25 @@ def update_vendor(vendor_id):
         return jsonify({'error': '权重必须是大于等于0的整数'}), 400
 
     try:
-        with get_conn() as conn:
+        with write_transaction() as conn:
             conn.execute(
                 'UPDATE vendors SET vendor = ?, weight = ? WHERE id = ?',
                 (new_name, new_weight, vendor_id),
             )
-            conn.commit()
+            version = read_version(conn, 'vendors')
     except sqlite3.IntegrityError:
         return jsonify({'error': '该商家名称已存在'}), 400
 
-    return jsonify({'success': True, 'vendors': read_vendors()})
+    return vendor_response(vendor_id, version)
 
 
 @app.route('/api/vendors/<int:vendor_id>', methods=['DELETE'])
+@db.retry_on_busy
 def delete_vendor(vendor_id):
     if get_vendor(vendor_id) is None:
         return jsonify({'error': '无效的商家ID'}), 400
 
-    with get_conn() as conn:
+    with write_transaction() as conn:
         linked_meal = conn.execute(
             'SELECT id FROM meals WHERE vendor_id = ? LIMIT 1',
             (vendor_id,),
@@ -340,25 +402,98 @@ def delete_vendor(vendor_id):
         if linked_meal is not None:
             return jsonify({'error': '该商家已被点餐记录引用，不能删除'}), 400
         conn.execute('DELETE FROM vendors WHERE id = ?', (vendor_id,))
-        conn.commit()
+        version = read_version(conn, 'vendors')
+
+    result = {'success': True, 'id': vendor_id, 'version': version}
+    if wants_full_list():
+        result['vendors'] = read_vendors()
+    return jsonify(result)
+
+
+@app.route('/api/weight_rules', methods=['GET'])
+def get_weight_rules():
+    with get_conn() as conn:
+        rows = conn.execute(
+            '''
+            SELECT id, vendor_id, weekday, date_from, date_to, time_from, time_to, weight, priority
+            FROM weight_rules
+            ORDER BY vendor_id ASC, priority DESC, id DESC
+            '''
+        ).fetchall()
+    return jsonify([dict(row) for row in rows])
+
+
+@app.route('/api/weight_rules', methods=['POST'])
+@db.retry_on_busy
+def add_weight_rule():
+    data = request.get_json(silent=True) or {}
+    rule, error = validate_rule_payload(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    with write_transaction() as conn:
+        cursor = conn.execute(
+            '''
+            INSERT INTO weight_rules
+                (vendor_id, weekday, date_from, date_to, time_from, time_to, weight, priority)
+            VALUES
+                (:vendor_id, :weekday, :date_from, :date_to, :time_from, :time_to, :weight, :priority)
+            ''',
+            rule,
+        )
+        version = read_version(conn, 'weight_rules')
+
+    return jsonify({'success': True, 'rule': {'id': cursor.lastrowid, **rule}, 'version': version})
+
+
+@app.route('/api/weight_rules/<int:rule_id>', methods=['DELETE'])
+@db.retry_on_busy
+def delete_weight_rule(rule_id):
+    with write_transaction() as conn:
+        cursor = conn.execute('DELETE FROM weight_rules WHERE id = ?', (rule_id,))
+        version = read_version(conn, 'weight_rules')
+    if cursor.rowcount == 0:
+        return jsonify({'error': '无效的规则ID'}), 400
 
-    return jsonify({'success': True, 'vendors': read_vendors()})
+    return jsonify({'success': True, 'id': rule_id, 'version': version})
 
 
 @app.route('/api/meals', methods=['GET'])
 def get_meals():
-    return jsonify(read_meals())
+    # 记录里带着商家名，商家改名也算变化
+    if not repository.MEAL_QUERY_KEYS.intersection(request.args):
+        return versioned_json(('vendors', 'meals'), read_meals)
+
+    query, error = repository.parse_meal_query(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    return versioned_json(('vendors', 'meals'), lambda: repository.read_meal_page(get_conn(), query))
+
+
+@app.route('/api/meals/export', methods=['GET'])
+def export_meals():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in repository.EXPORT_MIMETYPES:
+        return jsonify({'error': 'format必须是ndjson或csv'}), 400
+
+    response = app.response_class(
+        repository.iter_meal_export(DB_FILE, export_format),
+        mimetype=repository.EXPORT_MIMETYPES[export_format],
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=meals.{export_format}'
+    return response
 
 
 @app.route('/api/meals', methods=['POST'])
+@db.retry_on_busy
 def add_meal():
     data = request.get_json(silent=True) or {}
     payload, error = validate_meal_payload(data)
     if error:
         return jsonify({'error': error}), 400
 
-    with get_conn() as conn:
-        conn.execute(
+    with write_transaction() as conn:
+        cursor = conn.execute(
             'INSERT INTO meals (date, vendor_id, order_text, price, rate, image) VALUES (?, ?, ?, ?, ?, ?)',
             (
                 payload['date'],
@@ -369,12 +504,82 @@ def add_meal():
                 payload['image'],
             ),
         )
-        conn.commit()
+        meal_id = cursor.lastrowid
+        version = read_version(conn, 'meals')
 
-    return jsonify({'success': True, 'meals': read_meals()})
+    return meal_response(meal_id, version)
+
+
+@app.route('/api/meals/bulk', methods=['POST'])
+def bulk_add_meals():
+    # 上传的流只能读一次，所以先解析好，只有写库的部分遇到 busy 时重试
+    records, error = read_bulk_records()
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(insert_bulk_records(records))
+
+
+@db.retry_on_busy
+def insert_bulk_records(records):
+    with write_transaction() as conn:
+        vendor_names = {
+            row['vendor']: row['id']
+            for row in conn.execute('SELECT id, vendor FROM vendors').fetchall()
+        }
+        vendor_ids = set(vendor_names.values())
+        created_vendors = []
+        rows = []
+        errors = []
+
+        for index, record in enumerate(records, 1):
+            payload, error = validate_bulk_record(record)
+            if error is None:
+                vendor_id = parse_vendor_id(record.get('vendor_id'))
+                vendor_name = str(record.get('vendor') or '').strip()
+                if vendor_id is None and vendor_name:
+                    vendor_id = vendor_names.get(vendor_name)
+                    if vendor_id is None:
+                        vendor_id = conn.execute(
+                            'INSERT INTO vendors (vendor, weight) VALUES (?, ?)',
+                            (vendor_name, 0),
+                        ).lastrowid
+                        vendor_names[vendor_name] = vendor_id
+                        vendor_ids.add(vendor_id)
+                        created_vendors.append({'id': vendor_id, 'vendor': vendor_name, 'weight': 0})
+                if vendor_id is None:
+                    error = '必须选择商家'
+                elif vendor_id not in vendor_ids:
+                    error = '无效的商家ID'
+            if error:
+                errors.append({'row': index, 'error': error})
+                continue
+
+            rows.append((
+                payload['date'],
+                vendor_id,
+                payload['order_text'],
+                payload['price'],
+                payload['rate'],
+                payload['image'],
+            ))
+
+        conn.executemany(
+            'INSERT INTO meals (date, vendor_id, order_text, price, rate, image) VALUES (?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+        version = read_version(conn, 'meals')
+
+    return {
+        'success': True,
+        'inserted': len(rows),
+        'vendors': created_vendors,
+        'errors': errors,
+        'version': version,
+    }
 
 
 @app.route('/api/meals/<int:meal_id>', methods=['PUT'])
+@db.retry_on_busy
 def update_meal(meal_id):
     data = request.get_json(silent=True) or {}
     current = get_meal(meal_id)
@@ -385,7 +590,7 @@ def update_meal(meal_id):
     if error:
         return jsonify({'error': error}), 400
 
-    with get_conn() as conn:
+    with write_transaction() as conn:
         conn.execute(
             'UPDATE meals SET date = ?, vendor_id = ?, order_text = ?, price = ?, rate = ?, image = ? WHERE id = ?',
             (
@@ -398,21 +603,25 @@ def update_meal(meal_id):
                 meal_id,
             ),
         )
-        conn.commit()
+        version = read_version(conn, 'meals')
 
-    return jsonify({'success': True, 'meals': read_meals()})
+    return meal_response(meal_id, version)
 
 
 @app.route('/api/meals/<int:meal_id>', methods=['DELETE'])
+@db.retry_on_busy
 def delete_meal(meal_id):
     if get_meal(meal_id) is None:
         return jsonify({'error': '无效的点餐记录ID'}), 400
 
-    with get_conn() as conn:
+    with write_transaction() as conn:
         conn.execute('DELETE FROM meals WHERE id = ?', (meal_id,))
-        conn.commit()
+        version = read_version(conn, 'meals')
 
-    return jsonify({'success': True, 'meals': read_meals()})
+    result = {'success': True, 'id': meal_id, 'version': version}
+    if wants_full_list():
+        result['meals'] = read_meals()
+    return jsonify(result)
 
 
 @app.route('/api/upload_image', methods=['POST'])
@@ -426,23 +635,39 @@ def upload_image():
     if not allowed_file(file.filename):
         return jsonify({'error': '仅支持png/jpg/jpeg/gif/webp格式'}), 400
 
-    filename = secure_filename(file.filename)
-    _, ext = os.path.splitext(filename)
-    unique_name = f'{uuid.uuid4().hex}{ext.lower()}'
-    os.makedirs(IMG_DIR, exist_ok=True)
-    file.save(os.path.join(IMG_DIR, unique_name))
+    _, ext = os.path.splitext(secure_filename(file.filename))
+    filename, created = images.store_upload(IMG_DIR, file.stream, ext)
+    images.schedule_derivatives(IMG_DIR, filename)
+
+    return jsonify({'success': True, 'filename': filename, 'url': f'/img/{filename}', 'duplicate': not created})
+
+
+def referenced_images():
+    rows = get_conn().execute("SELECT DISTINCT image FROM meals WHERE image != ''").fetchall()
+    return {images.image_reference(row['image']) for row in rows}
+
 
-    return jsonify({'success': True, 'filename': unique_name, 'url': f'/img/{unique_name}'})
+@app.cli.command('gc-images')
+@click.option('--dry-run', is_flag=True, help='只列出将被删除的文件')
+@click.option('--grace', default=images.GC_GRACE_SECONDS, show_default=True, help='跳过最近多少秒内写入的文件')
+def gc_images(dry_run, grace):
+    """删除 IMG_DIR 中不再被 meals.image 引用的图片和缩略图"""
+    removed = images.collect_garbage(IMG_DIR, referenced_images(), grace=grace, dry_run=dry_run)
+    for name in removed:
+        click.echo(name)
+    click.echo(f"{'将删除' if dry_run else '已删除'} {len(removed)} 个文件")
 
 
 @app.route('/img/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(IMG_DIR, filename)
+    return images.serve(IMG_DIR, filename)
 
 
 ensure_db()
 
 if __name__ == '__main__':
-    print('Management server running at http://localhost:5001')
-    print('Open http://localhost:5001 in your browser for management')
-    app.run(host='0.0.0.0', debug=True, port=5001)
+    port = int(os.environ.get('EAT_PORT', 5001))
+    debug = os.environ.get('EAT_DEBUG', '1') == '1'
+    print(f'Management server running at http://localhost:{port}')
+    print(f'Open http://localhost:{port} in your browser for management')
+    app.run(host='0.0.0.0', debug=debug, port=port)
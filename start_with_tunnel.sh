@@ -40,7 +40,13 @@ fi
 
 # Start management server in detached mode (0.0.0.0:5001 for LAN/Tailscale use)
 echo "Starting management server on port 5001 (local/Tailscale only)..."
-MANAGE_CMD="cd \"$SCRIPT_DIR\" && exec \"$PYTHON_BIN\" server_manage.py"
+# Prefer gunicorn (single worker is plenty for one admin); fall back to the Flask dev server
+if "$PYTHON_BIN" -c "import gunicorn" >/dev/null 2>&1; then
+    MANAGE_CMD="cd \"$SCRIPT_DIR\" && EAT_APP=server_manage:app EAT_PORT=5001 EAT_WORKERS=1 exec \"$PYTHON_BIN\" -m gunicorn -c gunicorn.conf.py"
+else
+    echo "gunicorn not installed for $PYTHON_BIN; using the Flask development server."
+    MANAGE_CMD="cd \"$SCRIPT_DIR\" && EAT_DEBUG=0 exec \"$PYTHON_BIN\" server_manage.py"
+fi
 MANAGE_SESSION="eat-manage"
 
 if command -v tmux >/dev/null 2>&1; then
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import db
+import server
+import server_manage
+
+
+class TempDbTestCase(unittest.TestCase):
+    """Points both servers at a throwaway database and image directory, restored on cleanup."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.originals = {
+            module: (module.DB_FILE, module.IMG_DIR)
+            for module in (server, server_manage)
+        }
+        for module in (server, server_manage):
+            module.DB_FILE = os.path.join(self.temp_dir, "eat.db")
+            module.IMG_DIR = os.path.join(self.temp_dir, "img")
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        for module, (db_file, img_dir) in self.originals.items():
+            module.DB_FILE = db_file
+            module.IMG_DIR = img_dir
+        db.close_thread_connections()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class ApiTestCase(TempDbTestCase):
+    """A migrated empty database with test clients for both apps."""
+
+    def setUp(self):
+        super().setUp()
+        server.ensure_db()
+        self.manage = server_manage.app.test_client()
+        self.client = server.app.test_client()
+
+    def _add_vendor(self, name, weight=1):
+        return self.manage.post("/api/vendors", json={"vendor": name, "weight": weight}).get_json()["vendor"]["id"]
+
+    def _random_writes(self, rng, random_meal, inserts, updates, deletes, meal_ids=()):
+        """Adds, edits and deletes meals through the manage API; returns the ids still present."""
+        meal_ids = list(meal_ids)
+        meal_ids += [self.manage.post("/api/meals", json=random_meal()).get_json()["meal"]["id"] for _ in range(inserts)]
+        for meal_id in rng.sample(meal_ids, updates):
+            self.manage.put(f"/api/meals/{meal_id}", json=random_meal())
+        for meal_id in rng.sample(meal_ids, deletes):
+            self.manage.delete(f"/api/meals/{meal_id}")
+            meal_ids.remove(meal_id)
+        return meal_ids
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import response_cache
+import server
+import server_asgi
+
+
+async def call(path, query="", method="GET", headers=()):
+    """Drive the ASGI app directly and collect (status, headers, body)."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await server_asgi.app(scope, receive, send)
+    start, body = messages
+    response_headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], response_headers, body["body"]
+
+
+def get(path, query="", method="GET", headers=()):
+    return asyncio.run(call(path, query, method, headers))
+
+
+class AsgiServerTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(server_asgi.shutdown_executor)
+
+        vendor = self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5}).get_json()["vendor"]
+        self.manage.post("/api/vendors", json={"vendor": "Rice", "weight": 0})
+        self.manage.post("/api/meals", json={"date": "240101", "vendor_id": vendor["id"], "price": 12, "rate": 4})
+        self.vendor = vendor
+
+    def test_routes_match_wsgi_server(self):
+        for path, query in (("/api/vendors", ""), ("/api/meals", ""), ("/api/meals", "limit=1"), ("/api/stats", "")):
+            status, headers, body = get(path, query)
+            self.assertEqual(status, 200, path)
+            self.assertEqual(headers["content-type"], "application/json")
+            self.assertEqual(headers["access-control-allow-origin"], "*")
+            self.assertEqual(json.loads(body), self.client.get(f"{path}?{query}").get_json())
+
+    def test_cache_hit_only_reads_versions_in_thread_pool(self):
+        status, headers, body = get("/api/meals")
+        real = server_asgi.run_blocking
+        with mock.patch.object(server_asgi, "run_blocking", side_effect=real) as pool:
+            again = get("/api/meals")
+            not_modified = get("/api/meals", headers=[("If-None-Match", headers["etag"])])
+        # The event loop never touches SQLite; a hit needs nothing but the version probe.
+        self.assertEqual([c.args for c in pool.call_args_list], [(server.current_versions,)] * 2)
+        self.assertEqual(again, (status, headers, body))
+        self.assertEqual(not_modified[0], 304)
+        self.assertEqual(not_modified[2], b"")
+
+        # The WSGI server shares the same cache entry and ETag.
+        self.assertEqual(self.client.get("/api/meals").headers["ETag"], headers["etag"])
+
+    def test_writes_invalidate_cached_response(self):
+        _, first_headers, _ = get("/api/meals")
+        self.manage.put(f"/api/vendors/{self.vendor['id']}", json={"vendor": "Dumplings"})
+        status, headers, body = get("/api/meals", headers=[("If-None-Match", first_headers["etag"])])
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers["etag"], first_headers["etag"])
+        self.assertEqual(json.loads(body)[0]["vendor_name"], "Dumplings")
+
+    def test_pick_and_errors(self):
+        status, _, body = get("/api/pick", "n=3&seed=7")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client.get("/api/pick?n=3&seed=7").get_json())
+        self.assertEqual([v["vendor"] for v in json.loads(body)["picks"]], ["Noodles"])
+
+        status, _, body = get("/api/recommend", "n=3")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client.get("/api/recommend?n=3").get_json())
+        self.assertEqual(get("/api/pick", "mode=recommend&seed=7")[0], 200)
+
+        self.assertEqual(get("/api/pick", "n=abc")[0], 400)
+        self.assertEqual(get("/api/pick", "mode=best")[0], 400)
+        self.assertEqual(get("/api/meals", "limit=0")[0], 400)
+        self.assertEqual(get("/api/nothing")[0], 404)
+        status, headers, _ = get("/api/meals", method="POST")
+        self.assertEqual(status, 405)
+        self.assertEqual(headers["allow"], "GET, HEAD")
+
+        status, headers, body = get("/api/vendors", method="HEAD")
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b"")
+        self.assertGreater(int(headers["content-length"]), 0)
+
+    def test_many_concurrent_requests_share_bounded_pool(self):
+        response_cache._entries.clear()
+
+        async def burst():
+            return await asyncio.gather(*(call("/api/stats") for _ in range(200)))
+
+        with mock.patch.object(server_asgi, "DB_THREADS", 2):
+            server_asgi.shutdown_executor()
+            responses = asyncio.run(burst())
+            self.assertEqual(server_asgi.get_executor()._max_workers, 2)
+        self.assertEqual({status for status, _, _ in responses}, {200})
+        self.assertEqual(len({body for _, _, body in responses}), 1)
+
+    def test_lifespan_warms_cache(self):
+        response_cache._entries.clear()
+        messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(server_asgi.app({"type": "lifespan"}, receive, send))
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertIn("/api/vendors?", response_cache._entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import assets
+import db
+import server
+import server_manage
+
+
+class StaticAssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.app.test_client()
+
+    def test_html_links_css_by_content_hash(self):
+        html = self.client.get("/", headers={"Accept-Encoding": "identity"}).get_data(as_text=True)
+        url = re.search(r'href="(/assets/[0-9a-f]+/common\.css)"', html).group(1)
+        self.assertEqual(url, server.ASSETS.url("common.css"))
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.headers["Cache-Control"], assets.IMMUTABLE)
+        with open(os.path.join(server.BASE_DIR, "common.css"), "rb") as f:
+            self.assertEqual(resp.get_data(), f.read())
+
+        self.assertEqual(self.client.get("/assets/000000000000/common.css").headers["Cache-Control"], "no-cache")
+        self.assertEqual(self.client.get("/assets/000000000000/missing.css").status_code, 404)
+
+    def test_precompressed_variants_and_conditional_get(self):
+        plain = self.client.get("/", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.headers["Cache-Control"], "no-cache")
+
+        resp = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(gzip.decompress(resp.get_data()), plain.get_data())
+        self.assertNotEqual(resp.headers["ETag"], plain.headers["ETag"])
+
+        if assets.brotli is not None:
+            resp = self.client.get("/", headers={"Accept-Encoding": "gzip, br"})
+            self.assertEqual(resp.headers["Content-Encoding"], "br")
+            self.assertEqual(assets.brotli.decompress(resp.get_data()), plain.get_data())
+
+        again = self.client.get(
+            "/", headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["ETag"]}
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b"")
+
+    def test_manage_server_uses_same_bundle_layout(self):
+        client = server_manage.app.test_client()
+        html = client.get("/", headers={"Accept-Encoding": "identity"}).get_data(as_text=True)
+        self.assertIn(server_manage.ASSETS.url("common.css"), html)
+        self.assertEqual(server_manage.ASSETS.url("common.css"), server.ASSETS.url("common.css"))
+
+
+class ImageCachingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.original_img_dir = server.IMG_DIR
+        server.IMG_DIR = self.temp_dir
+        self.addCleanup(self._cleanup)
+        self.client = server.app.test_client()
+
+        self.content = bytes(range(256)) * 40
+        self.hashed = hashlib.sha256(self.content).hexdigest() + ".gif"
+        for name in (self.hashed, "legacy.gif"):
+            with open(os.path.join(self.temp_dir, name), "wb") as f:
+                f.write(self.content)
+
+    def _cleanup(self):
+        server.IMG_DIR = self.original_img_dir
+        db.close_thread_connections()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_content_addressed_images_are_immutable(self):
+        resp = self.client.get(f"/img/{self.hashed}")
+        self.assertEqual(resp.headers["Cache-Control"], assets.IMMUTABLE)
+        etag = resp.headers["ETag"]
+        resp.close()
+
+        resp = self.client.get("/img/legacy.gif")
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        resp.close()
+
+        resp = self.client.get(f"/img/{self.hashed}", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        resp.close()
+
+    def test_range_requests(self):
+        resp = self.client.get(f"/img/{self.hashed}", headers={"Range": "bytes=100-199"})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.get_data(), self.content[100:200])
+        self.assertEqual(resp.headers["Content-Range"], f"bytes 100-199/{len(self.content)}")
+        resp.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import unittest
+from contextlib import closing
+
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from base import TempDbTestCase
+import endpoints
+import fixtures
+import server
+import server_manage
+
+
+class BenchmarkHarnessTestCase(TempDbTestCase):
+    def _fixture(self, meals=300, vendors=12, seed=1):
+        return fixtures.ensure(meals, vendors, seed, directory=os.path.join(self.temp_dir, "fixtures"))
+
+    def test_fixtures_are_seeded_and_fully_migrated(self):
+        first = self._fixture()
+        second = fixtures.build(os.path.join(self.temp_dir, "again.db"), 300, 12, seed=1)
+        self.assertIsNone(second)
+
+        def snapshot(path):
+            with closing(sqlite3.connect(path)) as conn:
+                return (
+                    conn.execute("SELECT * FROM meals ORDER BY id").fetchall(),
+                    conn.execute("SELECT * FROM vendors ORDER BY id").fetchall(),
+                    conn.execute("PRAGMA user_version").fetchone()[0],
+                    conn.execute("SELECT count FROM stats_summary").fetchone()[0],
+                )
+
+        meals, vendors, version, counted = snapshot(first)
+        self.assertEqual(snapshot(os.path.join(self.temp_dir, "again.db")), (meals, vendors, version, counted))
+        self.assertEqual((len(meals), len(vendors), counted), (300, 12, 300))
+        self.assertEqual(version, fixtures.migrations.SCHEMA_VERSION)
+        self.assertEqual(self._fixture(), first)
+
+    def test_every_route_of_both_apps_is_benchmarked(self):
+        ctx = {"vendors": 10, "meals": 100, "rules": 0, "image": "a.gif", "asset": "/assets/abc/common.css"}
+        apps = {"server": server.app, "manage": server_manage.app}
+        covered = set()
+        for spec in endpoints.ENDPOINTS:
+            app = apps[spec["app"]]
+            path, _, _ = endpoints.build_request(spec, 0, ctx)
+            adapter = app.url_map.bind("localhost")
+            rule, _ = adapter.match(path.split("?")[0], method=spec["method"], return_rule=True)
+            covered.add((spec["app"], rule.rule, spec["method"]))
+
+        for name, app in apps.items():
+            for rule in app.url_map.iter_rules():
+                # /metrics only answers when EAT_METRICS is on; benchmarks run uninstrumented.
+                if rule.endpoint in ("static", "metrics"):
+                    continue
+                for method in rule.methods - {"HEAD", "OPTIONS"}:
+                    self.assertIn((name, rule.rule, method), covered)
+
+    def test_client_run_reports_every_endpoint_without_errors(self):
+        db_file = fixtures.copy_to(self._fixture(), self.temp_dir)
+        results = []
+        endpoints.run_client(
+            db_file,
+            os.path.join(self.temp_dir, "img"),
+            requests=2,
+            warmup=1,
+            report=lambda spec, ctx, result: results.append((endpoints.endpoint_name(spec, ctx), result)),
+            selected=lambda spec, ctx: True,
+        )
+
+        self.assertEqual(len(results), len(endpoints.ENDPOINTS))
+        for name, result in results:
+            self.assertEqual(result["errors"], 0, name)
+            self.assertGreaterEqual(result["requests"], 2)
+            self.assertGreater(result["p99_ms"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
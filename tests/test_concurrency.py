@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DURATION = 3.0
+READERS = 8
+WRITERS = 2
+READ_P99_LIMIT = 1.0
+WRITE_P99_LIMIT = 2.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class ConcurrentServersLoadTest(unittest.TestCase):
+    """Drive the read server (5000 role) and manage server (5001 role) on one WAL database."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        env = dict(
+            os.environ,
+            EAT_DB_FILE=os.path.join(self.temp_dir, "eat.db"),
+            EAT_IMG_DIR=os.path.join(self.temp_dir, "img"),
+            EAT_DEBUG="0",
+        )
+        self.read_url = self._start("server.py", env)
+        self.manage_url = self._start("server_manage.py", env)
+
+        vendor = self._request("POST", self.manage_url + "/api/vendors", {"vendor": "Load", "weight": 1})
+        self.vendor_id = vendor["vendor"]["id"]
+
+    def _start(self, script, env):
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, script],
+            cwd=ROOT,
+            env=dict(env, EAT_PORT=str(port)),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.terminate)
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            try:
+                urllib.request.urlopen(url + "/api/vendors", timeout=1).read()
+                return url
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.1)
+        self.fail(f"{script} did not start: {proc.stderr.read1().decode(errors='replace')}")
+
+    def _request(self, method, url, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read())
+
+    def test_concurrent_reads_and_writes(self):
+        latencies = {"read": [], "write": []}
+        errors = []
+        stop = time.time() + DURATION
+        lock = threading.Lock()
+
+        def run(kind, action):
+            n = 0
+            while time.time() < stop:
+                started = time.perf_counter()
+                try:
+                    action(n)
+                except Exception as exc:  # noqa: BLE001 - every failure counts
+                    body = exc.read().decode(errors="replace") if isinstance(exc, urllib.error.HTTPError) else ""
+                    with lock:
+                        errors.append(f"{kind}: {exc} {body}")
+                else:
+                    with lock:
+                        latencies[kind].append(time.perf_counter() - started)
+                n += 1
+
+        read_paths = ["/api/meals?limit=50", "/api/vendors", "/api/stats", "/api/meals"]
+
+        def read(n):
+            urllib.request.urlopen(self.read_url + read_paths[n % len(read_paths)], timeout=10).read()
+
+        def write(n):
+            meal = self._request(
+                "POST",
+                self.manage_url + "/api/meals",
+                {"date": f"24{n % 12 + 1:02d}01", "vendor_id": self.vendor_id, "price": 10 + n % 7, "rate": 3},
+            )["meal"]
+            self._request("PUT", f"{self.manage_url}/api/meals/{meal['id']}", {"rate": 4})
+
+        threads = [threading.Thread(target=run, args=("read", read)) for _ in range(READERS)]
+        threads += [threading.Thread(target=run, args=("write", write)) for _ in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(latencies["read"] and latencies["write"])
+        self.assertLess(percentile(latencies["read"], 0.99), READ_P99_LIMIT)
+        self.assertLess(percentile(latencies["write"], 0.99), WRITE_P99_LIMIT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,46 +1,35 @@
-import csv
 import os
-import shutil
-import tempfile
 import unittest
 
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from base import TempDbTestCase
 import server_manage
 
 
-class DatabaseTestCase(unittest.TestCase):
+class DatabaseTestCase(TempDbTestCase):
     def setUp(self):
-        # Use isolated CSV files so tests run against a clean slate.
-        self.original_vendor_csv = server_manage.CSV_VENDOR_FILE
-        self.original_meal_csv = server_manage.CSV_MEAL_FILE
-
-        self.temp_dir = tempfile.mkdtemp()
-        server_manage.CSV_VENDOR_FILE = os.path.join(self.temp_dir, "vendors.csv")
-        server_manage.CSV_MEAL_FILE = os.path.join(self.temp_dir, "meals.csv")
-
+        super().setUp()
         server_manage.ensure_db()
         self.client = server_manage.app.test_client()
-        self.addCleanup(self._cleanup)
-
-    def _cleanup(self):
-        server_manage.CSV_VENDOR_FILE = self.original_vendor_csv
-        server_manage.CSV_MEAL_FILE = self.original_meal_csv
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
 
-    def test_ensure_db_creates_empty_csv(self):
-        self.assertTrue(os.path.exists(server_manage.CSV_VENDOR_FILE))
-        self.assertTrue(os.path.exists(server_manage.CSV_MEAL_FILE))
+    def _add_vendor(self, name="Test Vendor", weight=80):
+        resp = self.client.post("/api/vendors", json={"vendor": name, "weight": weight})
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()["vendor"]
 
-        with open(server_manage.CSV_VENDOR_FILE, newline='', encoding='utf-8') as f:
-            reader = list(csv.reader(f))
-        with open(server_manage.CSV_MEAL_FILE, newline='', encoding='utf-8') as f:
-            meal_reader = list(csv.reader(f))
+    def test_connection_is_reused_per_thread_with_wal(self):
+        conn = server_manage.get_conn()
+        self.assertIs(server_manage.get_conn(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
 
-        self.assertEqual(reader, [["vendor", "weight"]])
-        self.assertEqual(meal_reader, [["date", "order", "price", "rate", "image"]])
+    def test_ensure_db_creates_empty_tables(self):
+        self.assertTrue(os.path.exists(server_manage.DB_FILE))
+        self.assertEqual(self.client.get("/api/vendors").get_json(), [])
+        self.assertEqual(self.client.get("/api/meals").get_json(), [])
 
     def test_add_and_read_vendor(self):
         resp = self.client.post("/api/vendors", json={"vendor": "Test Vendor", "weight": 80})
@@ -48,21 +37,21 @@ class DatabaseTestCase(unittest.TestCase):
         data = resp.get_json()
 
         self.assertTrue(data["success"])
-        self.assertEqual(len(data["vendors"]), 1)
-        vendor = data["vendors"][0]
+        self.assertNotIn("vendors", data)
+        vendor = data["vendor"]
         self.assertEqual(vendor["vendor"], "Test Vendor")
         self.assertEqual(vendor["weight"], 80)
 
-        with open(server_manage.CSV_VENDOR_FILE, newline='', encoding='utf-8') as f:
-            rows = list(csv.DictReader(f))
-        self.assertEqual(rows[0]["vendor"], "Test Vendor")
-        self.assertEqual(int(rows[0]["weight"]), 80)
+        vendors = self.client.get("/api/vendors").get_json()
+        self.assertEqual(vendors, [vendor])
 
     def test_add_and_update_meal(self):
+        vendor = self._add_vendor()
         create_resp = self.client.post(
             "/api/meals",
             json={
-                "date": "2024-01-02",
+                "date": "240102",
+                "vendor_id": vendor["id"],
                 "order": "Noodles",
                 "price": 10.5,
                 "rate": 4.5,
@@ -72,25 +61,44 @@ class DatabaseTestCase(unittest.TestCase):
         self.assertEqual(create_resp.status_code, 200)
         created = create_resp.get_json()
         self.assertTrue(created["success"])
-        self.assertEqual(len(created["meals"]), 1)
-        meal = created["meals"][0]
+        self.assertNotIn("meals", created)
+        meal = created["meal"]
         self.assertEqual(meal["order"], "Noodles")
+        self.assertEqual(meal["vendor_name"], "Test Vendor")
         self.assertAlmostEqual(meal["price"], 10.5)
         self.assertAlmostEqual(meal["rate"], 4.5)
 
-        update_resp = self.client.put("/api/meals/0", json={"price": 12.0, "rate": 3.5})
+        update_resp = self.client.put(f"/api/meals/{meal['id']}", json={"price": 12.0, "rate": 3.5})
         self.assertEqual(update_resp.status_code, 200)
         updated = update_resp.get_json()
 
         self.assertTrue(updated["success"])
-        updated_meal = updated["meals"][0]
+        self.assertGreater(updated["version"], created["version"])
+        updated_meal = updated["meal"]
+        self.assertEqual(updated_meal["id"], meal["id"])
         self.assertAlmostEqual(updated_meal["price"], 12.0)
         self.assertAlmostEqual(updated_meal["rate"], 3.5)
 
-        with open(server_manage.CSV_MEAL_FILE, newline='', encoding='utf-8') as f:
-            rows = list(csv.DictReader(f))
-        self.assertEqual(float(rows[0]["price"]), 12.0)
-        self.assertAlmostEqual(float(rows[0]["rate"]), 3.5)
+        rows = self.client.get("/api/meals").get_json()
+        self.assertEqual(rows, [updated_meal])
+
+    def test_delete_meal_returns_id_and_full_list_on_request(self):
+        vendor = self._add_vendor()
+        meal = self.client.post(
+            "/api/meals",
+            json={"date": "240102", "vendor_id": vendor["id"], "price": 10, "rate": 3},
+        ).get_json()["meal"]
+
+        resp = self.client.delete(f"/api/meals/{meal['id']}?full=1")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data["id"], meal["id"])
+        self.assertEqual(data["meals"], [])
+
+    def test_vendor_write_with_full_flag_includes_list(self):
+        resp = self.client.post("/api/vendors?full=1", json={"vendor": "A", "weight": 1})
+        data = resp.get_json()
+        self.assertEqual(data["vendors"], [data["vendor"]])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import db
+import events
+import migrations
+import server
+import server_asgi
+
+
+def parse_stream(body):
+    """Split an SSE body into (event, id, data) tuples, skipping comments and retry."""
+    parsed = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields["event"], int(fields["id"]), json.loads(fields["data"])))
+    return parsed
+
+
+class EventsTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(server_asgi.shutdown_executor)
+
+        # Streams on, one pass over the change log per request, then the stream ends.
+        for name, value in (("SYNC_ENABLED", True), ("STREAM_SECONDS", 0), ("POLL_SECONDS", 0)):
+            patcher = mock.patch.object(events, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _events(self, client=None, last_event_id=0):
+        headers = {} if last_event_id is None else {"Last-Event-ID": str(last_event_id)}
+        resp = (client or self.client).get("/api/events", headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "text/event-stream")
+        return parse_stream(resp.data)
+
+    def test_row_changes_are_logged_with_table_version(self):
+        vendor = self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5}).get_json()["vendor"]
+        meal = self.manage.post(
+            "/api/meals", json={"date": "240101", "vendor_id": vendor["id"], "order": "Beef", "price": 12, "rate": 4}
+        ).get_json()["meal"]
+        self.manage.put(f"/api/vendors/{vendor['id']}", json={"vendor": "Rice"})
+        self.manage.delete(f"/api/meals/{meal['id']}")
+
+        changes = self._events()
+        self.assertEqual(
+            [(event, data["action"], data["id"]) for event, _, data in changes],
+            [
+                ("vendors", "insert", vendor["id"]),
+                ("meals", "insert", meal["id"]),
+                ("vendors", "update", vendor["id"]),
+                ("meals", "delete", meal["id"]),
+            ],
+        )
+        self.assertEqual(changes[1][2]["row"], meal)
+        self.assertEqual(changes[2][2]["row"]["vendor"], "Rice")
+        self.assertEqual(changes[3][2]["row"], {"id": meal["id"]})
+
+        conn = server.get_conn()
+        versions = dict(conn.execute("SELECT resource, version FROM data_versions").fetchall())
+        self.assertEqual(changes[2][2]["version"], versions["vendors"])
+        self.assertEqual(changes[3][2]["version"], versions["meals"])
+
+    def test_resume_after_last_event_id(self):
+        self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5})
+        first = self._events()
+        self.assertEqual(self._events(last_event_id=None), [])
+
+        self.manage.post("/api/vendors", json={"vendor": "Rice", "weight": 3})
+        later = self._events(last_event_id=first[-1][1])
+        self.assertEqual([data["row"]["vendor"] for _, _, data in later], ["Rice"])
+        self.assertEqual(self._events(client=self.manage, last_event_id=first[-1][1]), later)
+
+    def test_pruned_log_sends_reset(self):
+        self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5})
+        conn = db.connect(server.DB_FILE)
+        with db.write_transaction(conn):
+            conn.executemany(
+                "INSERT INTO change_log (resource, action, row_id, version, payload) VALUES ('vendors', 'update', 1, 1, '{}')",
+                [()] * migrations.CHANGE_LOG_KEEP,
+            )
+        conn.close()
+
+        count = server.get_conn().execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+        self.assertEqual(count, migrations.CHANGE_LOG_KEEP)
+        [(event, change_id, data)] = self._events(last_event_id=0)
+        self.assertEqual(event, "reset")
+        self.assertEqual(change_id, migrations.CHANGE_LOG_KEEP + 1)
+
+    def test_public_stream_uses_effective_weight(self):
+        vendor = self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5}).get_json()["vendor"]
+        self.manage.post("/api/weight_rules", json={"vendor_id": vendor["id"], "weight": 50})
+
+        [(_, _, public)] = self._events()
+        [(_, _, manage)] = self._events(client=self.manage)
+        self.assertEqual(public["row"]["weight"], 50)
+        self.assertEqual(manage["row"]["weight"], 5)
+
+    def test_sync_servers_decline_streams_by_default(self):
+        # 204 makes EventSource stop reconnecting instead of pinning a gthread worker thread.
+        with mock.patch.object(events, "SYNC_ENABLED", False):
+            for client in (self.client, self.manage):
+                resp = client.get("/api/events")
+                self.assertEqual((resp.status_code, resp.data), (204, b""))
+
+    def test_manage_reads_carry_version_etags_for_polling(self):
+        # The manage page falls back to polling these with If-None-Match.
+        vendors = self.manage.get("/api/vendors")
+        meals = self.manage.get("/api/meals?limit=50")
+        for url, resp in (("/api/vendors", vendors), ("/api/meals?limit=50", meals)):
+            self.assertEqual(self.manage.get(url, headers={"If-None-Match": resp.headers["ETag"]}).status_code, 304)
+
+        vendor_id = self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5}).get_json()["vendor"]["id"]
+        self.assertNotEqual(self.manage.get("/api/vendors").headers["ETag"], vendors.headers["ETag"])
+        # Meal rows carry the vendor name, so vendor writes change the meals ETag too.
+        changed = self.manage.get("/api/meals?limit=50").headers["ETag"]
+        self.assertNotEqual(changed, meals.headers["ETag"])
+        self.manage.post("/api/meals", json={"date": "240101", "vendor_id": vendor_id, "price": 12, "rate": 4})
+        self.assertNotEqual(self.manage.get("/api/meals?limit=50").headers["ETag"], changed)
+
+    def test_asgi_stream(self):
+        self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5})
+        messages = []
+
+        async def receive():
+            await asyncio.sleep(1)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/events",
+            "query_string": b"last_event_id=0",
+            "headers": [],
+        }
+        asyncio.run(server_asgi.app(scope, receive, send))
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), messages[0]["headers"])
+        self.assertFalse(messages[-1].get("more_body", False))
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        [(event, _, data)] = parse_stream(body)
+        self.assertEqual((event, data["row"]["vendor"]), ("vendors", "Noodles"))
+
+
+if __name__ == "__main__":
+    unittest.main()
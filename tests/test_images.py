@@ -0,0 +1,177 @@
+import hashlib
+import io
+import os
+import time
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import images
+import server
+import server_manage
+
+
+class ImageTestBase(ApiTestCase):
+    def _wait(self, filename):
+        deadline = time.time() + 30
+        while (server.IMG_DIR, filename) in images._pending:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+
+class ImageStoreTestCase(ImageTestBase):
+    def _upload(self, content, name="photo.png"):
+        resp = self.manage.post(
+            "/api/upload_image",
+            data={"file": (io.BytesIO(content), name)},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()
+
+    def test_upload_is_named_by_content_hash_and_deduplicated(self):
+        first = self._upload(b"same bytes" * 1000)
+        second = self._upload(b"same bytes" * 1000, "again.png")
+        other = self._upload(b"other bytes", "other.JPEG")
+
+        self.assertEqual(first["filename"], hashlib.sha256(b"same bytes" * 1000).hexdigest() + ".png")
+        self.assertEqual(second["filename"], first["filename"])
+        self.assertEqual((first["duplicate"], second["duplicate"]), (False, True))
+        self.assertTrue(other["filename"].endswith(".jpg"))
+        self._wait(first["filename"])
+        self._wait(other["filename"])
+        files = [name for name in os.listdir(server.IMG_DIR) if name != images.THUMB_DIR]
+        self.assertEqual(sorted(files), sorted([first["filename"], other["filename"]]))
+
+    def test_upload_is_written_once_into_img_dir(self):
+        # The multipart parser streams the part straight into IMG_DIR; no second copy is made.
+        with mock.patch.object(images, "store_upload", wraps=images.store_upload) as store:
+            result = self._upload(b"x" * (600 * 1024))
+        self.assertIsInstance(store.call_args.args[1], images.UploadFile)
+        self.assertEqual(store.call_args.args[1].img_dir, server.IMG_DIR)
+        self.assertEqual(result["filename"], hashlib.sha256(b"x" * (600 * 1024)).hexdigest() + ".png")
+        self._wait(result["filename"])
+        leftovers = [name for name in os.listdir(server.IMG_DIR) if name.startswith(images.UPLOAD_TMP_PREFIX)]
+        self.assertEqual(leftovers, [])
+
+        # A rejected upload still removes the temp file at request teardown.
+        resp = self.manage.post(
+            "/api/upload_image",
+            data={"file": (io.BytesIO(b"text"), "notes.txt")},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(resp.status_code, 400)
+        leftovers = [name for name in os.listdir(server.IMG_DIR) if name.startswith(images.UPLOAD_TMP_PREFIX)]
+        self.assertEqual(leftovers, [])
+
+    def test_gc_removes_unreferenced_images_only(self):
+        kept = self._upload(b"kept")["filename"]
+        dropped = self._upload(b"dropped")["filename"]
+        self._wait(kept)
+        self._wait(dropped)
+        vendor_id = self.manage.post("/api/vendors", json={"vendor": "V", "weight": 1}).get_json()["vendor"]["id"]
+        self.manage.post(
+            "/api/meals",
+            json={"date": "240101", "vendor_id": vendor_id, "price": 1, "rate": 3, "image": f"/img/{kept}"},
+        )
+        runner = server_manage.app.test_cli_runner()
+
+        result = runner.invoke(args=["gc-images"])
+        self.assertIn(" 0 ", result.output)
+        self.assertTrue(os.path.exists(os.path.join(server.IMG_DIR, dropped)))
+
+        result = runner.invoke(args=["gc-images", "--grace", "0", "--dry-run"])
+        self.assertIn(dropped, result.output)
+        self.assertTrue(os.path.exists(os.path.join(server.IMG_DIR, dropped)))
+
+        result = runner.invoke(args=["gc-images", "--grace", "0"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([name for name in os.listdir(server.IMG_DIR) if name != images.THUMB_DIR], [kept])
+
+
+@unittest.skipIf(images.Image is None, "Pillow not installed")
+class ImageDerivativesTestCase(ImageTestBase):
+    def _photo(self, width=1600, height=1200):
+        buf = io.BytesIO()
+        images.Image.new("RGB", (width, height), (200, 120, 40)).save(buf, format="JPEG")
+        buf.seek(0)
+        return buf
+
+    def _upload(self, width=1600, height=1200):
+        resp = self.manage.post(
+            "/api/upload_image",
+            data={"file": (self._photo(width, height), "photo.jpg")},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()["filename"]
+
+    def test_upload_generates_thumbnails_in_background(self):
+        filename = self._upload()
+        self._wait(filename)
+
+        thumbs = sorted(os.listdir(os.path.join(server.IMG_DIR, images.THUMB_DIR)))
+        self.assertEqual(
+            thumbs,
+            sorted(images.thumb_name(filename, w, fmt) for w in (320, 640, 1280) for fmt in ("webp", "jpg")),
+        )
+
+    def test_width_param_serves_smallest_suitable_variant(self):
+        filename = self._upload()
+        self._wait(filename)
+        original = os.path.getsize(os.path.join(server.IMG_DIR, filename))
+
+        resp = self.client.get(f"/img/{filename}?w=500", headers={"Accept": "image/webp,*/*"})
+        self.assertEqual(resp.mimetype, "image/webp")
+        self.assertIn("Accept", resp.headers["Vary"])
+        self.assertEqual(images.Image.open(io.BytesIO(resp.get_data())).width, 640)
+        self.assertLess(len(resp.get_data()), original)
+        resp.close()
+
+        resp = self.client.get(f"/img/{filename}?w=100", headers={"Accept": "image/jpeg"})
+        self.assertEqual(resp.mimetype, "image/jpeg")
+        self.assertEqual(images.Image.open(io.BytesIO(resp.get_data())).width, 320)
+        resp.close()
+
+        resp = self.client.get(f"/img/{filename}?w=4000")
+        self.assertEqual(len(resp.get_data()), original)
+        resp.close()
+
+    def test_small_and_missing_images(self):
+        filename = self._upload(200, 150)
+        self._wait(filename)
+        resp = self.client.get(f"/img/{filename}?w=320")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(images.Image.open(io.BytesIO(resp.get_data())).width, 200)
+        resp.close()
+
+        self.assertEqual(self.client.get("/img/missing.jpg?w=320").status_code, 404)
+        self.assertEqual(self.client.get(f"/img/{filename}?w=abc").status_code, 400)
+
+    def test_original_is_final_when_no_thumbnail_will_be_made(self):
+        with mock.patch.object(images, "schedule_derivatives") as schedule:
+            filename = self._upload()
+            small = self._upload(200, 150)
+            schedule.reset_mock()
+
+            # Not generated yet: revalidate and queue the background job.
+            resp = self.client.get(f"/img/{filename}?w=500")
+            self.assertEqual(resp.headers["Cache-Control"], images.assets.REVALIDATE)
+            schedule.assert_called_once_with(server.IMG_DIR, filename)
+            resp.close()
+            schedule.reset_mock()
+
+            # Wider than the largest thumbnail, or a source narrower than any: the original is final.
+            for name, width in ((filename, 4000), (small, 320), (small, 100)):
+                resp = self.client.get(f"/img/{name}?w={width}")
+                self.assertEqual(resp.headers["Cache-Control"], images.assets.IMMUTABLE, width)
+                resp.close()
+            schedule.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import server
+import server_manage
+
+
+class MealsPaginationTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        noodles = self._add_vendor("Noodles")
+        rice = self._add_vendor("Rice")
+        for date, vendor_id in [
+            ("240101", noodles),
+            ("240102", rice),
+            ("240102", noodles),
+            ("240103", rice),
+            ("240105", noodles),
+        ]:
+            resp = self.manage.post(
+                "/api/meals",
+                json={"date": date, "vendor_id": vendor_id, "price": 10, "rate": 3},
+            )
+            self.assertEqual(resp.status_code, 200)
+        self.noodles, self.rice = noodles, rice
+
+    def _add_vendor(self, name):
+        resp = self.manage.post("/api/vendors", json={"vendor": name, "weight": 10})
+        return resp.get_json()["vendor"]["id"]
+
+    def test_without_params_returns_full_list(self):
+        data = self.client.get("/api/meals").get_json()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 5)
+
+    def test_cursor_walks_all_pages_in_order(self):
+        full = self.client.get("/api/meals").get_json()
+
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/meals?limit=2" + (f"&before={cursor}" if cursor else "")
+            page = self.client.get(url).get_json()
+            self.assertLessEqual(len(page["meals"]), 2)
+            seen.extend(page["meals"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual([m["id"] for m in seen], [m["id"] for m in full])
+
+    def test_filters_by_date_range_and_vendor(self):
+        page = self.client.get(
+            f"/api/meals?from=2024-01-02&to=240103&vendor_id={self.rice}"
+        ).get_json()
+        self.assertEqual([m["date"] for m in page["meals"]], ["240103", "240102"])
+        self.assertIsNone(page["next_cursor"])
+
+    def test_rejects_invalid_params(self):
+        self.assertEqual(self.client.get("/api/meals?limit=0").status_code, 400)
+        self.assertEqual(self.client.get("/api/meals?before=bogus").status_code, 400)
+        self.assertEqual(self.client.get("/api/meals?from=2024").status_code, 400)
+
+    def test_export_ndjson_streams_every_meal(self):
+        resp = self.client.get("/api/meals/export?format=ndjson")
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines, self.client.get("/api/meals").get_json())
+
+    def test_export_csv_from_manage_server(self):
+        resp = self.manage.get("/api/meals/export?format=csv")
+        rows = list(csv.DictReader(io.StringIO(resp.get_data().decode("utf-8-sig"))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["date"], "240105")
+        self.assertEqual(rows[0]["vendor"], "Noodles")
+        self.assertEqual(self.manage.get("/api/meals/export?format=xml").status_code, 400)
+
+    def test_bulk_json_inserts_valid_rows_and_reports_errors(self):
+        resp = self.manage.post(
+            "/api/meals/bulk",
+            json=[
+                {"date": "2024-02-01", "vendor_id": self.rice, "price": 12, "rate": 4},
+                {"date": "240202", "vendor": "Dumplings", "order": "Pork", "price": 8, "rate": 4.5},
+                {"date": "240203", "vendor": "Dumplings", "price": 9, "rate": 3},
+                {"date": "2402", "vendor_id": self.rice, "price": 12, "rate": 4},
+                {"date": "240204", "vendor_id": 999, "price": 12, "rate": 4},
+                {"date": "240205", "price": 12, "rate": 4},
+            ],
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data["inserted"], 3)
+        self.assertEqual([v["vendor"] for v in data["vendors"]], ["Dumplings"])
+        self.assertEqual(data["vendors"][0]["weight"], 0)
+        self.assertEqual([e["row"] for e in data["errors"]], [4, 5, 6])
+
+        meals = self.client.get("/api/meals").get_json()
+        self.assertEqual(len(meals), 8)
+        self.assertEqual(meals[0]["vendor_name"], "Dumplings")
+        self.assertEqual(meals[1]["order"], "Pork")
+        self.assertIn("240201", [m["date"] for m in meals])
+
+    def test_bulk_csv_legacy_layout_uses_order_as_vendor(self):
+        body = "\ufeffdate,order,price,rate,image\n240301,Noodles,15,4,\n240302,Tacos,20,5,taco.png\n"
+        resp = self.manage.post("/api/meals/bulk", data=body.encode("utf-8"), content_type="text/csv")
+        data = resp.get_json()
+        self.assertEqual((data["inserted"], data["errors"]), (2, []))
+        self.assertEqual([v["vendor"] for v in data["vendors"]], ["Tacos"])
+
+        meals = self.client.get("/api/meals?limit=2").get_json()["meals"]
+        self.assertEqual([(m["vendor_id"], m["order"]) for m in meals][1], (self.noodles, ""))
+        self.assertEqual(meals[0]["image"], "taco.png")
+
+    def test_bulk_csv_upload_roundtrips_export(self):
+        exported = self.manage.get("/api/meals/export?format=csv").get_data()
+        resp = self.manage.post(
+            "/api/meals/bulk",
+            data={"file": (io.BytesIO(exported), "meals.csv")},
+            content_type="multipart/form-data",
+        )
+        data = resp.get_json()
+        self.assertEqual((data["inserted"], data["vendors"], data["errors"]), (5, [], []))
+        self.assertEqual(len(self.client.get("/api/meals").get_json()), 10)
+
+    def test_bulk_csv_upload_survives_busy_retry(self):
+        exported = self.manage.get("/api/meals/export?format=csv").get_data()
+        real = server_manage.write_transaction
+        calls = []
+
+        def busy_once():
+            calls.append(1)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return real()
+
+        # The upload stream is consumed once; the retry must reuse the parsed rows.
+        with mock.patch.object(server_manage, "write_transaction", busy_once):
+            resp = self.manage.post(
+                "/api/meals/bulk",
+                data={"file": (io.BytesIO(exported), "meals.csv")},
+                content_type="multipart/form-data",
+            )
+        self.assertEqual(resp.status_code, 200, resp.get_json())
+        self.assertEqual((resp.get_json()["inserted"], len(calls)), (5, 2))
+
+    def test_bulk_rejects_malformed_body(self):
+        self.assertEqual(self.manage.post("/api/meals/bulk", json={"date": "240101"}).status_code, 400)
+        resp = self.manage.post("/api/meals/bulk", data="name\nx\n", content_type="text/csv")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_pagination_uses_index(self):
+        with server.get_conn() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM meals AS m "
+                "WHERE (m.date, m.id) < (?, ?) ORDER BY m.date DESC, m.id DESC LIMIT 2",
+                ("240103", 10),
+            ).fetchall()
+        details = " ".join(row["detail"] for row in plan)
+        self.assertIn("idx_meals_date_id", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+
+if __name__ == "__main__":
+    unittest.main()
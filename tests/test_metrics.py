@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import db
+import metrics
+import server
+
+
+class MetricsTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(metrics, "PROFILE_DIR", os.path.join(self.temp_dir, "profiles"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Connections opened before enable() are not timed, so start from a clean slate.
+        db.close_thread_connections()
+        metrics.enable()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+
+    def _get(self, client, path, **kwargs):
+        response = client.get(path, **kwargs)
+        response.get_data()
+        response.close()
+        return response
+
+    def _seed(self):
+        # Requests are recorded when the response is closed, as WSGI servers do.
+        self.manage.post("/api/vendors", json={"vendor": "面馆", "weight": 10}).close()
+        for day in range(1, 4):
+            self.manage.post(
+                "/api/meals", json={"date": f"2501{day:02d}", "vendor_id": 1, "price": 20, "rate": 4}
+            ).close()
+
+    def test_server_timing_splits_sql_from_serialization(self):
+        self._seed()
+        response = self._get(self.client, "/api/meals?limit=2")
+
+        timing = response.headers["Server-Timing"]
+        self.assertRegex(timing, r'sql;dur=[\d.]+;desc="\d+ queries, \d+ rows"')
+        self.assertIn("rows;dur=", timing)
+        self.assertIn("encode;dur=", timing)
+        self.assertIn("app;dur=", timing)
+
+        # A cache hit only pays for the version probe.
+        cached = self._get(self.client, "/api/meals?limit=2")
+        self.assertNotIn("rows;dur=", cached.headers["Server-Timing"])
+
+    def test_metrics_endpoint_exposes_routes_statements_and_bytes(self):
+        self._seed()
+        stats = self._get(self.client, "/api/stats")
+        self._get(self.client, "/api/meals/export?format=csv")
+        self._get(self.client, "/api/vendors/999")
+
+        body = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('eat_requests_total{route="/api/stats",method="GET",status="200"} 1', body)
+        self.assertIn('eat_request_duration_seconds_count{route="/api/stats",method="GET"} 1', body)
+        self.assertIn('eat_request_duration_seconds_bucket{route="/api/stats",method="GET",le="+Inf"} 1', body)
+        self.assertIn(f'eat_response_bytes_total{{route="/api/stats"}} {len(stats.get_data())}', body)
+        self.assertIn('eat_requests_total{route="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('eat_request_span_seconds_total{route="/api/stats",span="sql"}', body)
+
+        # The streamed export is counted when its body has been sent.
+        export_bytes = [line for line in body.splitlines() if 'eat_response_bytes_total{route="/api/meals/export"}' in line]
+        self.assertEqual(len(export_bytes), 1)
+        self.assertGreater(int(export_bytes[0].split()[-1]), 0)
+
+        statements = [line for line in body.splitlines() if line.startswith("eat_sql_rows_total{") and "FROM meals AS m" in line]
+        self.assertGreaterEqual(sum(int(line.split()[-1]) for line in statements), 3)
+
+        manage = self.manage.get("/metrics").get_data(as_text=True)
+        self.assertIn('eat_requests_total{route="/api/meals",method="POST",status="200"} 3', manage)
+
+    def test_profile_header_dumps_one_request(self):
+        # Profiling needs its own flag; metrics alone ignore the header.
+        self.assertNotIn("X-Profile-File", self._get(self.client, "/api/vendors", headers={"X-Profile": "1"}).headers)
+
+        with mock.patch.object(metrics, "PROFILE_ENABLED", True):
+            response = self._get(self.client, "/api/vendors", headers={"X-Profile": "1"})
+            self.assertNotIn("X-Profile-File", self._get(self.client, "/api/vendors").headers)
+
+        # Only the file name is returned, never the server path.
+        name = response.headers["X-Profile-File"]
+        self.assertEqual(os.path.basename(name), name)
+        self.assertTrue(os.path.exists(os.path.join(metrics.PROFILE_DIR, name)))
+
+    def test_disabled_by_default(self):
+        metrics.disable()
+        db.close_thread_connections()
+
+        response = self._get(self.client, "/api/vendors")
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertIs(type(db.get_conn(server.DB_FILE, readonly=True)), sqlite3.Connection)
+
+
+if __name__ == "__main__":
+    unittest.main()
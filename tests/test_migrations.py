@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import closing
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import db
+import migrations
+
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.db_file = os.path.join(self.temp_dir, "eat.db")
+
+    def _connect(self):
+        conn = db.connect(self.db_file)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_fresh_database_reaches_latest_version(self):
+        conn = self._connect()
+        self.assertEqual(migrations.migrate(conn), 0)
+        self.assertEqual(migrations.schema_version(conn), migrations.SCHEMA_VERSION)
+
+        indexes = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({"idx_meals_date_id", "idx_meals_vendor_date_id"} <= indexes)
+
+    def test_up_to_date_startup_is_a_single_pragma(self):
+        migrations.migrate(self._connect())
+
+        conn = self._connect()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        self.assertEqual(migrations.migrate(conn), migrations.SCHEMA_VERSION)
+        self.assertEqual(statements, ["PRAGMA user_version"])
+
+    def test_legacy_order_text_schema_is_upgraded(self):
+        with closing(db.connect(self.db_file)) as conn, conn:
+            conn.execute("CREATE TABLE vendors (id INTEGER PRIMARY KEY AUTOINCREMENT, vendor TEXT NOT NULL UNIQUE, weight INTEGER NOT NULL DEFAULT 0)")
+            conn.execute(
+                "CREATE TABLE meals (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, "
+                "order_text TEXT NOT NULL DEFAULT '', price REAL NOT NULL DEFAULT 0, rate REAL NOT NULL DEFAULT 1, "
+                "image TEXT NOT NULL DEFAULT '')"
+            )
+            conn.execute("INSERT INTO vendors (vendor, weight) VALUES ('K记', 5)")
+            conn.executemany(
+                "INSERT INTO meals (date, order_text, price, rate) VALUES (?, ?, ?, ?)",
+                [("240101", "K记", 20, 4), ("240102", "沙县小吃", 15, 3)],
+            )
+
+        conn = self._connect()
+        migrations.migrate(conn)
+        rows = conn.execute(
+            "SELECT m.order_text, v.vendor FROM meals m JOIN vendors v ON v.id = m.vendor_id ORDER BY m.id"
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [("", "K记"), ("", "沙县小吃")])
+        self.assertEqual(conn.execute("SELECT count, total FROM stats_summary").fetchone()[:], (2, 35.0))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM weight_rules").fetchone()[0], 2)
+        hit = conn.execute("SELECT rowid FROM vendors_fts WHERE vendors_fts MATCH '\"沙县小\"'").fetchone()
+        self.assertIsNotNone(hit)
+
+    def test_meal_dates_are_normalized_and_rolled_up_by_day(self):
+        conn = self._connect()
+        daily = migrations.MIGRATIONS.index(migrations.create_stats_daily)
+        migrations.migrate(conn, daily)
+        conn.execute("INSERT INTO vendors (vendor, weight) VALUES ('K记', 1)")
+        conn.executemany(
+            "INSERT INTO meals (date, vendor_id, price, rate) VALUES (?, 1, ?, 4)",
+            [("2024-03-05", 10), ("20240305", 20), (" 240306 ", 30), ("240307", 0)],
+        )
+        conn.commit()
+
+        migrations.migrate(conn)
+        dates = [row[0] for row in conn.execute("SELECT date FROM meals ORDER BY id")]
+        self.assertEqual(dates, ["240305", "240305", "240306", "240307"])
+        daily_rows = conn.execute("SELECT day, count, total FROM stats_daily ORDER BY day").fetchall()
+        self.assertEqual([tuple(row) for row in daily_rows], [("240305", 2, 30.0), ("240306", 1, 30.0)])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM stats_vendor_daily").fetchone()[0], 2)
+
+    def test_databases_created_before_user_version_are_adopted(self):
+        conn = self._connect()
+        migrations.migrate(conn)
+        conn.execute("INSERT INTO vendors (vendor, weight) VALUES ('K记', 1)")
+        conn.execute("INSERT INTO meals (date, vendor_id, price, rate) VALUES ('240101', 1, 10, 3)")
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+
+        migrations.migrate(conn)
+        self.assertEqual(migrations.schema_version(conn), migrations.SCHEMA_VERSION)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM weight_rules").fetchone()[0], 0)
+        self.assertEqual(conn.execute("SELECT count FROM stats_summary").fetchone()[0], 1)
+
+    def test_failed_migration_rolls_back(self):
+        conn = self._connect()
+
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            raise RuntimeError("boom")
+
+        original = list(migrations.MIGRATIONS)
+        migrations.MIGRATIONS.append(broken)
+        migrations.SCHEMA_VERSION += 1
+        try:
+            with self.assertRaises(RuntimeError):
+                migrations.migrate(conn)
+        finally:
+            migrations.MIGRATIONS[:] = original
+            migrations.SCHEMA_VERSION -= 1
+
+        self.assertEqual(migrations.schema_version(conn), 0)
+        self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone())
+
+
+if __name__ == "__main__":
+    unittest.main()
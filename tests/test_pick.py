@@ -0,0 +1,138 @@
+import os
+import unittest
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import db
+import server
+import server_manage
+
+
+class PickTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for name, weight in [("A", 1), ("B", 3), ("Zero", 0), ("K记", 5)]:
+            self.manage.post("/api/vendors", json={"vendor": name, "weight": weight})
+
+    def test_fenwick_find_matches_linear_scan(self):
+        weights = [3, 0, 5, 1, 0, 2, 7]
+        tree = server.build_fenwick(weights)
+        for target in [0, 2.9, 3, 7.5, 8, 8.99, 9, 10.5, 11, 17.9]:
+            running, expected = 0, None
+            for index, weight in enumerate(weights):
+                running += weight
+                if running > target:
+                    expected = index
+                    break
+            self.assertEqual(server.fenwick_find(tree, target), expected, target)
+
+    def test_removals_use_delta_and_leave_shared_tree_untouched(self):
+        weights = [3, 0, 5, 1, 2, 7]
+        tree = server.build_fenwick(weights)
+        shared = list(tree)
+        delta = {}
+        for index in (2, 5):
+            server.fenwick_add(delta, len(tree), index, -weights[index])
+        reduced = [0 if i in (2, 5) else w for i, w in enumerate(weights)]
+        for target in [0, 2.9, 3, 3.5, 4, 5.9]:
+            running = 0
+            for index, weight in enumerate(reduced):
+                running += weight
+                if running > target:
+                    break
+            self.assertEqual(server.fenwick_find(tree, target, delta), index, target)
+        self.assertEqual(tree, shared)
+
+        table = server.pick_table()
+        fenwick = list(table["fenwick"])
+        server.pick_vendors(table, 3, server.random.Random(0))
+        self.assertEqual(table["fenwick"], fenwick)
+
+    def test_float_weights_never_pick_a_vendor_twice(self):
+        # Subtracting float scores drifts above what is left in the tree; random() near 1 then overshoots.
+        class HighRandom:
+            def random(self):
+                return 1 - 2 ** -53
+
+        for weights in ([0.3, 0.1], [0.001, 0.2, 0.1, 1 / 3, 0.1], [0.1, 0.3, 0.1, 1 / 3, 0.001, 1 / 3, 1 / 3, 2 / 3]):
+            table = {
+                "vendors": [{"id": i} for i in range(len(weights))],
+                "weights": weights,
+                "prefix": list(accumulate(weights)),
+                "fenwick": server.build_fenwick(weights),
+            }
+            for rng in (HighRandom(), server.random.Random(1)):
+                picks = [v["id"] for v in server.pick_vendors(table, len(weights), rng)]
+                self.assertEqual(sorted(picks), list(range(len(weights))), weights)
+        self.assertAlmostEqual(server.fenwick_total(table["fenwick"]), sum(weights))
+
+    def test_seeded_pick_is_reproducible_and_skips_zero_weight(self):
+        first = self.client.get("/api/pick?n=3&seed=42").get_json()["picks"]
+        second = self.client.get("/api/pick?n=3&seed=42").get_json()["picks"]
+        self.assertEqual(first, second)
+        names = [pick["vendor"] for pick in first]
+        self.assertEqual(len(set(names)), 3)
+        self.assertNotIn("Zero", names)
+
+    def test_n_larger_than_candidates_returns_each_once(self):
+        picks = self.client.get("/api/pick?n=10&seed=1").get_json()["picks"]
+        self.assertEqual(sorted(p["vendor"] for p in picks), ["A", "B", "K记"])
+
+    def test_weight_rules_are_computed_without_writing(self):
+        kji = next(v for v in self.manage.get("/api/vendors").get_json() if v["vendor"] == "K记")
+        self.manage.post("/api/weight_rules", json={"vendor_id": kji["id"], "weekday": 3, "weight": 1000, "priority": 1})
+        self.manage.post("/api/weight_rules", json={"vendor_id": kji["id"], "weight": 100})
+
+        for day, expected in [(4, 1000), (5, 100)]:  # 2024-01-04 is a Thursday
+            with mock.patch.object(server, "datetime") as fake:
+                fake.now.return_value = datetime(2024, 1, day, 12, tzinfo=server.BJ_TZ)
+                table = server.pick_table()
+                vendors = self.client.get("/api/vendors").get_json()
+            weights = {v["vendor"]: v["weight"] for v in table["vendors"]}
+            self.assertEqual(weights["K记"], expected)
+            self.assertEqual({v["vendor"]: v["weight"] for v in vendors}["K记"], expected)
+
+        stored = {v["vendor"]: v["weight"] for v in self.manage.get("/api/vendors").get_json()}
+        self.assertEqual(stored["K记"], 5)
+
+    def test_rule_time_windows_and_dates(self):
+        rule = {"weekday": None, "date_from": "240101", "date_to": "240131", "time_from": "22:00", "time_to": "02:00"}
+        at = lambda *args: datetime(*args, tzinfo=server.BJ_TZ)  # noqa: E731
+        self.assertTrue(server.rule_matches(rule, at(2024, 1, 10, 23, 30)))
+        self.assertTrue(server.rule_matches(rule, at(2024, 1, 10, 1, 59)))
+        self.assertFalse(server.rule_matches(rule, at(2024, 1, 10, 12, 0)))
+        self.assertFalse(server.rule_matches(rule, at(2024, 2, 1, 23, 0)))
+
+    def test_read_path_never_takes_write_lock(self):
+        with self.assertRaises(server_manage.sqlite3.OperationalError):
+            server.get_conn().execute("DELETE FROM vendors")
+
+        writer = db.connect(server_manage.DB_FILE)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            self.assertEqual(self.client.get("/api/vendors").status_code, 200)
+            self.assertEqual(self.client.get("/api/pick").status_code, 200)
+        finally:
+            writer.rollback()
+
+    def test_distribution_follows_weights(self):
+        table = {"vendors": [{"vendor": "A", "weight": 1}, {"vendor": "B", "weight": 3}], "prefix": [1, 4]}
+        rng = server.random.Random(0)
+        counts = Counter(server.pick_vendors(table, 1, rng)[0]["vendor"] for _ in range(4000))
+        self.assertAlmostEqual(counts["B"] / 4000, 0.75, delta=0.03)
+
+    def test_rejects_bad_n(self):
+        self.assertEqual(self.client.get("/api/pick?n=0").status_code, 400)
+        self.assertEqual(self.client.get("/api/pick?n=x").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import random
+import unittest
+from datetime import datetime, timedelta
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import server
+
+
+class RecommendTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.now(server.BJ_TZ).date()
+
+    def _add_meal(self, days_ago, vendor_id, rate=4, price=20):
+        day = (self.today - timedelta(days=days_ago)).strftime("%y%m%d")
+        return self.manage.post(
+            "/api/meals", json={"date": day, "vendor_id": vendor_id, "price": price, "rate": rate}
+        ).get_json()["meal"]["id"]
+
+    def test_incremental_summary_matches_full_scan(self):
+        rng = random.Random(3)
+        vendor_ids = [self._add_vendor(f"V{i}") for i in range(5)]
+
+        def random_meal():
+            return {
+                "date": (self.today - timedelta(days=rng.randint(0, 60))).strftime("%y%m%d"),
+                "vendor_id": rng.choice(vendor_ids),
+                "price": rng.choice([0, 15]),
+                "rate": rng.randint(1, 10) / 2,
+            }
+
+        meal_ids = []
+        for round_ in range(4):
+            meal_ids = self._random_writes(rng, random_meal, inserts=20, updates=5, deletes=3, meal_ids=meal_ids)
+
+            # Each round reads only the vendors touched since the previous one.
+            summary = server.load_vendor_activity()["vendors"]
+            meals = [dict(row) for row in server.get_conn().execute("SELECT * FROM meals")]
+            for vendor_id in vendor_ids:
+                own = [m for m in meals if m["vendor_id"] == vendor_id]
+                visits, rate_sum, last_date, _ = summary.get(vendor_id, (0, 0.0, None, None))
+                self.assertEqual(visits, len(own), round_)
+                self.assertAlmostEqual(rate_sum, sum(m["rate"] for m in own))
+                if own:
+                    self.assertEqual(last_date, max(m["date"] for m in own))
+
+    def test_only_changed_vendors_are_reread(self):
+        first, second = self._add_vendor("A"), self._add_vendor("B")
+        self._add_meal(5, first)
+        self._add_meal(5, second)
+        seq = server.load_vendor_activity()["seq"]
+
+        self._add_meal(1, first)
+        changed = server.get_conn().execute(
+            "SELECT vendor_id FROM vendor_activity WHERE seq > ?", (seq,)
+        ).fetchall()
+        self.assertEqual([row["vendor_id"] for row in changed], [first])
+        self.assertEqual(server.load_vendor_activity()["vendors"][first][2], (self.today - timedelta(days=1)).strftime("%y%m%d"))
+
+    def test_ranking_penalizes_recent_visits_and_rewards_ratings(self):
+        yesterday, favourite, fresh, zero = (
+            self._add_vendor("昨天"), self._add_vendor("常去"), self._add_vendor("没去过"), self._add_vendor("停用", 0),
+        )
+        self._add_meal(1, yesterday, rate=5)
+        for days_ago in (20, 30, 40):
+            self._add_meal(days_ago, favourite, rate=5)
+
+        ranked = self.client.get("/api/recommend").get_json()["vendors"]
+        self.assertEqual([v["id"] for v in ranked], [favourite, fresh, yesterday])
+        self.assertNotIn(zero, [v["id"] for v in ranked])
+        self.assertEqual((ranked[2]["daysSince"], ranked[2]["avgRating"]), (1, 5.0))
+        self.assertEqual((ranked[1]["lastVisit"], ranked[1]["score"]), (None, 1.0))
+
+        self.assertEqual(len(self.client.get("/api/recommend?n=1").get_json()["vendors"]), 1)
+        self.assertEqual(self.client.get("/api/recommend?n=0").status_code, 400)
+
+        # Eating at the favourite today pushes it to the bottom.
+        self._add_meal(0, favourite, rate=5)
+        ranked = self.client.get("/api/recommend").get_json()["vendors"]
+        self.assertEqual(ranked[-1]["id"], favourite)
+
+    def test_pick_mode_recommend(self):
+        for name in ("A", "B", "C"):
+            self._add_vendor(name)
+        first = self.client.get("/api/pick?mode=recommend&n=3&seed=9").get_json()["picks"]
+        second = self.client.get("/api/pick?mode=recommend&n=3&seed=9").get_json()["picks"]
+        self.assertEqual(first, second)
+        self.assertEqual(sorted(p["vendor"] for p in first), ["A", "B", "C"])
+        self.assertIn("score", first[0])
+        self.assertEqual(self.client.get("/api/pick?mode=best").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
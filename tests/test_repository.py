@@ -0,0 +1,49 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import repository
+import server
+
+
+class RepositoryTestCase(unittest.TestCase):
+    def test_dumps_with_and_without_orjson(self):
+        payload = {"meals": [{"id": 1, "order": "牛肉面", "price": 12.5, "vendor_name": None}], "next": None}
+        fast = repository.dumps(payload)
+        with mock.patch.object(repository, "orjson", None):
+            fallback = repository.dumps(payload)
+
+        for body in (fast, fallback):
+            self.assertTrue(body.endswith(b"\n"))
+            self.assertEqual(json.loads(body), payload)
+            self.assertIn("牛肉面".encode("utf-8"), body)
+
+    def test_jsonify_uses_shared_encoder(self):
+        with server.app.test_request_context():
+            resp = server.app.json.response({"vendor": "K记"})
+        self.assertEqual(resp.mimetype, "application/json")
+        self.assertEqual(resp.get_data(), repository.dumps({"vendor": "K记"}))
+
+    def test_serialize_meal_zips_columns_in_order(self):
+        row = (3, "240101", 2, "K记", "鸡腿堡", 25.0, 4.5, "")
+        self.assertEqual(
+            repository.serialize_meal(row),
+            {"id": 3, "date": "240101", "vendor_id": 2, "vendor_name": "K记", "order": "鸡腿堡",
+             "price": 25.0, "rate": 4.5, "image": ""},
+        )
+
+    def test_meal_sql_is_built_once_per_filter_combination(self):
+        first = repository.meals_sql(True, False, True, False, True)
+        self.assertIs(repository.meals_sql(True, False, True, False, True), first)
+        self.assertIn("(m.date, m.id) < (?, ?)", first)
+        self.assertIn("m.date <= ?", first)
+        self.assertNotIn("m.vendor_id = ?", first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import gzip
+import json
+import os
+import unittest
+from unittest import mock
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import response_cache
+import server
+
+
+class ResponseCacheTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        vendor = self.manage.post("/api/vendors", json={"vendor": "Noodles", "weight": 5}).get_json()["vendor"]
+        self.manage.post("/api/meals", json={"date": "240101", "vendor_id": vendor["id"], "price": 12, "rate": 4})
+        self.vendor = vendor
+
+    def test_if_none_match_returns_304_without_body(self):
+        for url in ("/api/vendors", "/api/meals", "/api/meals?limit=1", "/api/stats"):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            etag = first.headers["ETag"]
+
+            again = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(again.status_code, 304, url)
+            self.assertEqual(again.data, b"")
+            self.assertEqual(again.headers["ETag"], etag)
+
+    def test_cached_body_skips_query_until_data_changes(self):
+        first = self.client.get("/api/meals")
+        with mock.patch.object(server, "read_meals", wraps=server.read_meals) as read_meals:
+            second = self.client.get("/api/meals")
+            self.assertEqual(read_meals.call_count, 0)
+            self.assertEqual(second.data, first.data)
+
+            self.manage.put(f"/api/vendors/{self.vendor['id']}", json={"vendor": "Rice"})
+            third = self.client.get("/api/meals", headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual(read_meals.call_count, 1)
+
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(third.get_json()[0]["vendor_name"], "Rice")
+
+    def _add_meals(self, count):
+        self.manage.post(
+            "/api/meals/bulk",
+            json=[
+                {"date": "2402%02d" % (i % 28 + 1), "vendor_id": self.vendor["id"], "order": "Beef noodles", "price": 15, "rate": 4}
+                for i in range(count)
+            ],
+        )
+
+    def test_large_responses_are_compressed_once_per_version(self):
+        self._add_meals(40)
+        plain = self.client.get("/api/meals")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+
+        with mock.patch.object(server.assets, "compress", wraps=server.assets.compress) as compress:
+            first = self.client.get("/api/meals", headers={"Accept-Encoding": "gzip"})
+            second = self.client.get("/api/meals", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(compress.call_count, 1)
+
+        self.assertEqual(first.headers["Content-Encoding"], "gzip")
+        self.assertEqual(second.data, first.data)
+        self.assertLess(len(first.data), len(plain.data) / 5)
+        self.assertEqual(gzip.decompress(first.data), plain.data)
+        self.assertEqual(first.headers["ETag"], plain.headers["ETag"][:-1] + '-gzip"')
+
+        again = self.client.get("/api/meals", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+    def test_small_and_uncached_json(self):
+        small = self.client.get("/api/vendors", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", small.headers)
+
+        self._add_meals(40)
+        resp = self.manage.get("/api/meals", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(resp.data))), 41)
+
+        export = self.client.get("/api/meals/export", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", export.headers)
+
+    def test_warmup_fills_response_cache(self):
+        response_cache._entries.clear()
+        server.warmup()
+        self.assertIn("/api/vendors?", response_cache._entries)
+        self.assertIn("/api/stats?", response_cache._entries)
+
+        with mock.patch.object(server, "read_meals", wraps=server.read_meals) as read_meals:
+            self.assertEqual(self.client.get("/api/meals").status_code, 200)
+            self.assertEqual(read_meals.call_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import unittest
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import repository
+import server
+
+
+class SearchTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manage.post(
+            "/api/meals/bulk",
+            json=[
+                {"date": "240315", "vendor": "兰州牛肉面馆", "order": "牛肉面 加蛋", "price": 18, "rate": 4.5},
+                {"date": "240410", "vendor": "兰州牛肉面馆", "order": "凉皮", "price": 12, "rate": 4},
+                {"date": "240420", "vendor": "麦当劳", "order": "Big Mac 套餐", "price": 35, "rate": 3},
+                {"date": "240501", "vendor": "Noodle Bar", "order": "beef noodles 50%_off", "price": 25, "rate": 4},
+            ],
+        )
+
+    def _search(self, query):
+        resp = self.client.get("/api/search?" + query)
+        self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+        return resp.get_json()
+
+    def test_trigram_matches_order_text_and_vendor_name(self):
+        data = self._search("q=牛肉面")
+        self.assertEqual([v["vendor"] for v in data["vendors"]], ["兰州牛肉面馆"])
+        self.assertEqual(len(data["meals"]), 2)
+
+        data = self._search("q=NOODLE")
+        self.assertEqual([m["order"] for m in data["meals"]], ["beef noodles 50%_off"])
+
+    def test_order_text_hits_rank_before_vendor_only_hits(self):
+        # Both meals belong to the vendor, but only the older one mentions the dish itself.
+        data = self._search("q=牛肉面")
+        self.assertEqual([m["order"] for m in data["meals"]], ["牛肉面 加蛋", "凉皮"])
+
+        data = self._search("q=兰州 加蛋")
+        self.assertEqual([m["order"] for m in data["meals"]], ["牛肉面 加蛋"])
+
+    def test_short_terms(self):
+        self.assertEqual([m["vendor_name"] for m in self._search("q=麦当")["meals"]], ["麦当劳"])
+        # Punctuation is split away by the tokenizer, so such terms still use LIKE.
+        self.assertEqual([m["order"] for m in self._search("q=%_")["meals"]], ["beef noodles 50%_off"])
+        self.assertEqual(self._search("q=凉")["meals"][0]["date"], "240410")
+
+    def test_two_character_terms_use_bigram_index(self):
+        with server.get_conn() as conn:
+            self.assertEqual(repository.search_indexes(conn), {"fts", "bigram"})
+            self.assertEqual(repository.term_index("兰州", repository.search_indexes(conn)), "bigram")
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT rowid FROM meals_bigram WHERE meals_bigram MATCH ?", ('"凉皮"',)
+            ).fetchall()
+        self.assertIn("VIRTUAL TABLE INDEX", " ".join(row["detail"] for row in plan))
+
+        data = self._search("q=兰州")
+        self.assertEqual([v["vendor"] for v in data["vendors"]], ["兰州牛肉面馆"])
+        self.assertEqual([m["order"] for m in data["meals"]], ["凉皮", "牛肉面 加蛋"])
+        self.assertEqual([m["order"] for m in self._search("q=凉皮")["meals"]], ["凉皮"])
+        self.assertEqual([m["order"] for m in self._search("q=BI")["meals"]], ["Big Mac 套餐"])
+        self.assertEqual([m["order"] for m in self._search("q=餐")["meals"]], ["Big Mac 套餐"])
+        self.assertEqual(self._search("q=兰州 加蛋")["meals"][0]["order"], "牛肉面 加蛋")
+        self.assertEqual(self._search("q=州兰")["meals"], [])
+        self.assertEqual([m["order"] for m in self._search("q=兰州&from=240401")["meals"]], ["凉皮"])
+        self.assertEqual([m["order"] for m in self._search("q=兰州 牛肉面")["meals"]], ["牛肉面 加蛋", "凉皮"])
+        page = self._search("q=兰州&limit=1&offset=1")
+        self.assertEqual(([m["order"] for m in page["meals"]], page["next_offset"]), (["牛肉面 加蛋"], None))
+
+        # Renaming a vendor re-indexes its meals under the new name.
+        vendor_id = data["vendors"][0]["id"]
+        self.manage.put(f"/api/vendors/{vendor_id}", json={"vendor": "西北面馆"})
+        self.assertEqual(self._search("q=兰州")["meals"], [])
+        self.assertEqual(len(self._search("q=西北")["meals"]), 2)
+
+        meal = self._search("q=凉皮")["meals"][0]
+        self.manage.put(f"/api/meals/{meal['id']}", json={"order": "米线"})
+        self.assertEqual(self._search("q=凉皮")["meals"], [])
+        self.assertEqual([m["id"] for m in self._search("q=米线")["meals"]], [meal["id"]])
+        self.manage.delete(f"/api/meals/{meal['id']}")
+        self.assertEqual(self._search("q=米线")["meals"], [])
+
+    def test_index_follows_writes(self):
+        meal = self.client.get("/api/meals").get_json()[0]
+        self.manage.put(f"/api/meals/{meal['id']}", json={"order": "Ramen"})
+        self.assertEqual(self._search("q=ramen")["meals"][0]["id"], meal["id"])
+        self.assertEqual(self._search("q=beef")["meals"], [])
+
+        vendor_id = meal["vendor_id"]
+        self.manage.put(f"/api/vendors/{vendor_id}", json={"vendor": "Udon House"})
+        self.assertEqual(self._search("q=udon")["vendors"][0]["id"], vendor_id)
+        self.manage.delete(f"/api/meals/{meal['id']}")
+        self.assertEqual(self._search("q=ramen")["meals"], [])
+
+    def test_pagination_and_date_filter(self):
+        first = self._search("q=兰州牛肉&limit=1")
+        self.assertEqual(first["next_offset"], 1)
+        second = self._search("q=兰州牛肉&limit=1&offset=1")
+        self.assertIsNone(second["next_offset"])
+        self.assertNotEqual(first["meals"][0]["id"], second["meals"][0]["id"])
+
+        spring = self._search("q=兰州牛肉&from=2024-03-01&to=240331")
+        self.assertEqual([m["date"] for m in spring["meals"]], ["240315"])
+
+    def test_rejects_bad_params(self):
+        self.assertEqual(self.client.get("/api/search").status_code, 400)
+        self.assertEqual(self.client.get("/api/search?q=a&limit=0").status_code, 400)
+        self.assertEqual(self.client.get("/api/search?q=a&offset=-1").status_code, 400)
+
+    def test_search_uses_fts_index(self):
+        with server.get_conn() as conn:
+            self.assertTrue(repository.search_available(conn))
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT rowid FROM meals_fts WHERE meals_fts MATCH ?", ('"牛肉面"',)
+            ).fetchall()
+        self.assertIn("VIRTUAL TABLE INDEX", " ".join(row["detail"] for row in plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import os
+import random
+import unittest
+from collections import defaultdict
+from datetime import date, timedelta
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import migrations
+import server
+import server_manage
+
+
+# The original full-scan queries behind /api/stats, used as the reference.
+LEGACY_QUERIES = {
+    "topVendors": """
+        SELECT v.vendor, COUNT(m.id) AS count,
+               ROUND(AVG(m.price), 2) AS avgPrice, ROUND(SUM(m.price), 2) AS total
+        FROM meals m JOIN vendors v ON m.vendor_id = v.id
+        WHERE m.price > 0 GROUP BY m.vendor_id
+        ORDER BY count DESC, total DESC LIMIT 15
+    """,
+    "monthly": """
+        SELECT SUBSTR(date, 1, 4) AS month, COUNT(*) AS count,
+               ROUND(SUM(price), 2) AS total, ROUND(AVG(price), 2) AS avgPrice
+        FROM meals WHERE price > 0 GROUP BY month ORDER BY month
+    """,
+    "ratingDist": """
+        SELECT ROUND(rate * 2) / 2 AS rating, COUNT(*) AS count
+        FROM meals WHERE price > 0 GROUP BY rating ORDER BY rating DESC
+    """,
+    "vendorRatings": """
+        SELECT v.vendor, COUNT(m.id) AS count,
+               ROUND(AVG(m.rate), 1) AS avgRating, ROUND(AVG(m.price), 2) AS avgPrice
+        FROM meals m JOIN vendors v ON m.vendor_id = v.id
+        WHERE m.price > 0 GROUP BY m.vendor_id HAVING count >= 2
+        ORDER BY avgRating DESC, count DESC LIMIT 10
+    """,
+}
+LEGACY_SUMMARY = """
+    SELECT COUNT(*) AS totalMeals, COUNT(DISTINCT vendor_id) AS vendorsUsed,
+           ROUND(AVG(price), 2) AS avgPrice, ROUND(MIN(price), 2) AS minPrice,
+           ROUND(MAX(price), 2) AS maxPrice, ROUND(SUM(price), 2) AS totalSpent,
+           ROUND(AVG(rate), 1) AS avgRating
+    FROM meals WHERE price > 0
+"""
+
+
+class StatsAggregatesTestCase(ApiTestCase):
+    def _expected(self):
+        with server.get_conn() as conn:
+            expected = {
+                key: [dict(row) for row in conn.execute(sql).fetchall()]
+                for key, sql in LEGACY_QUERIES.items()
+            }
+            expected["summary"] = dict(conn.execute(LEGACY_SUMMARY).fetchone())
+        return expected
+
+    def _assert_matches_legacy(self):
+        data = self.client.get("/api/stats").get_json()
+        expected = self._expected()
+        for key, value in expected.items():
+            self.assertEqual(data[key], value, key)
+        self.assertEqual(sum(r["count"] for r in data["priceDist"]), len(self.client.get("/api/meals").get_json()))
+
+    def test_empty_database(self):
+        data = self.client.get("/api/stats").get_json()
+        self.assertEqual(data["summary"]["totalMeals"], 0)
+        self.assertIsNone(data["summary"]["avgPrice"])
+        self.assertEqual(data["monthly"], [])
+        self.assertEqual(data["priceDist"], [])
+
+    def test_triggers_track_random_writes(self):
+        rng = random.Random(7)
+        vendor_ids = [self._add_vendor(f"V{i}") for i in range(5)]
+
+        def random_meal():
+            return {
+                "date": f"2{rng.randint(3, 4)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+                "vendor_id": rng.choice(vendor_ids),
+                "price": rng.choice([0, round(rng.uniform(5, 60), 1)]),
+                "rate": rng.randint(1, 10) / 2,
+            }
+
+        self._random_writes(rng, random_meal, inserts=60, updates=20, deletes=15)
+
+        self._assert_matches_legacy()
+
+        incremental = server.read_stats()
+        with server_manage.write_transaction() as conn:
+            migrations.rebuild_stats(conn)
+        self.assertEqual(server.read_stats()["priceDist"], incremental["priceDist"])
+
+    def _ranged_expected(self, date_from, date_to, bucket, vendor_id):
+        """Full scan of meals grouped in Python, the reference for the rollup-backed ranges."""
+        def key(day):
+            if bucket == "day":
+                return day
+            if bucket == "month":
+                return day[:4]
+            if bucket == "year":
+                return day[:2]
+            parsed = date(2000 + int(day[:2]), int(day[2:4]), int(day[4:]))
+            return (parsed - timedelta(days=parsed.weekday())).strftime("%y%m%d")
+
+        groups = defaultdict(list)
+        for row in server.get_conn().execute("SELECT date, vendor_id, price, rate FROM meals WHERE price > 0"):
+            if date_from and row["date"] < date_from or date_to and row["date"] > date_to:
+                continue
+            if vendor_id is not None and row["vendor_id"] != vendor_id:
+                continue
+            groups[key(row["date"])].append(row)
+        return [
+            {
+                "bucket": bucket_key,
+                "count": len(rows),
+                "total": round(sum(r["price"] for r in rows), 2),
+                "rateSum": sum(r["rate"] for r in rows),
+            }
+            for bucket_key, rows in sorted(groups.items())
+        ]
+
+    def test_ranged_buckets_match_full_scan(self):
+        rng = random.Random(11)
+        vendor_ids = [self._add_vendor(f"V{i}") for i in range(3)]
+        start = date(2023, 12, 1)
+
+        def random_meal():
+            return {
+                "date": (start + timedelta(days=rng.randint(0, 90))).strftime("%Y-%m-%d"),
+                "vendor_id": rng.choice(vendor_ids),
+                "price": rng.choice([0, rng.randint(5, 60)]),
+                "rate": rng.randint(1, 10) / 2,
+            }
+
+        self._random_writes(rng, random_meal, inserts=80, updates=20, deletes=10)
+
+        for date_from, date_to in ((None, None), ("231215", "240110"), ("2024-01-01", "2024-01-31")):
+            for bucket in ("day", "week", "month", "year"):
+                for vendor_id in (None, vendor_ids[1]):
+                    params = {"bucket": bucket}
+                    if date_from:
+                        params.update({"from": date_from, "to": date_to})
+                    if vendor_id:
+                        params["vendor_id"] = vendor_id
+                    data = self.client.get("/api/stats", query_string=params).get_json()
+
+                    expected = self._ranged_expected(
+                        date_from and date_from.replace("-", "")[-6:],
+                        date_to and date_to.replace("-", "")[-6:],
+                        bucket,
+                        vendor_id,
+                    )
+                    got = [{k: r[k] for k in ("bucket", "count", "total")} for r in data["buckets"]]
+                    self.assertEqual(got, [{k: r[k] for k in ("bucket", "count", "total")} for r in expected], params)
+                    # SQLite rounds halves away from zero, Python to even: compare within rounding.
+                    for row, reference in zip(data["buckets"], expected):
+                        self.assertAlmostEqual(row["avgRating"], reference["rateSum"] / reference["count"], delta=0.051)
+                    self.assertEqual(data["summary"]["totalMeals"], sum(r["count"] for r in expected))
+
+        weeks = self.client.get("/api/stats?bucket=week&from=231225&to=240107").get_json()["buckets"]
+        self.assertTrue(all(r["bucket"] in ("231225", "240101") for r in weeks))
+
+        incremental = self.client.get("/api/stats?bucket=day").get_json()
+        with server_manage.write_transaction() as conn:
+            migrations.rebuild_daily_stats(conn)
+        self.assertEqual(self.client.get("/api/stats?bucket=day").get_json(), incremental)
+
+    def test_ranged_stats_validation_and_normalized_dates(self):
+        self.assertEqual(self.client.get("/api/stats?bucket=hour").status_code, 400)
+        self.assertEqual(self.client.get("/api/stats?from=2024").status_code, 400)
+        self.assertEqual(self.client.get("/api/stats?vendor_id=x").status_code, 400)
+        self.assertEqual(self.manage.post("/api/meals", json={"date": "tomorrow", "vendor_id": 1}).status_code, 400)
+
+        vendor_id = self.manage.post("/api/vendors", json={"vendor": "V", "weight": 1}).get_json()["vendor"]["id"]
+        meal = self.manage.post(
+            "/api/meals", json={"date": "2024-02-03", "vendor_id": vendor_id, "price": 12, "rate": 4}
+        ).get_json()["meal"]
+        self.assertEqual(meal["date"], "240203")
+
+        data = self.client.get("/api/stats?from=2024-02-01&to=2024-02-29").get_json()
+        self.assertEqual(data["range"], {"from": "240201", "to": "240229", "bucket": "month", "vendor_id": None})
+        self.assertEqual(data["summary"], {
+            "totalMeals": 1, "totalSpent": 12.0, "avgPrice": 12.0, "avgRating": 4.0, "vendorsUsed": 1,
+        })
+        self.assertEqual(data["buckets"], [{"bucket": "2402", "count": 1, "total": 12.0, "avgPrice": 12.0, "avgRating": 4.0}])
+
+        empty = self.client.get("/api/stats?from=250101").get_json()
+        self.assertEqual(empty["summary"]["totalMeals"], 0)
+        self.assertEqual(empty["buckets"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
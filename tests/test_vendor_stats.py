@@ -0,0 +1,114 @@
+import os
+import random
+import statistics
+import unittest
+from datetime import date, datetime, timedelta
+
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from base import ApiTestCase
+import server
+
+
+class VendorStatsTestCase(ApiTestCase):
+    def _add_meal(self, day, vendor_id, price=20, rate=4):
+        return self.manage.post(
+            "/api/meals", json={"date": day.strftime("%y%m%d"), "vendor_id": vendor_id, "price": price, "rate": rate}
+        ).get_json()["meal"]["id"]
+
+    def test_aggregates_match_full_scan_after_random_writes(self):
+        rng = random.Random(5)
+        today = date(2024, 6, 30)
+        vendor_ids = [self._add_vendor(f"V{i}") for i in range(4)]
+
+        def random_meal():
+            return {
+                "date": (today - timedelta(days=rng.randint(-5, 500))).strftime("%y%m%d"),
+                "vendor_id": rng.choice(vendor_ids),
+                "price": rng.choice([0, rng.randint(5, 60)]),
+                "rate": rng.randint(1, 10) / 2,
+            }
+
+        self._random_writes(rng, random_meal, inserts=120, updates=30, deletes=20)
+
+        meals = [dict(row) for row in server.get_conn().execute("SELECT * FROM meals")]
+        for stats in server.read_vendor_stats(today=today):
+            own = [m for m in meals if m["vendor_id"] == stats["id"]]
+            paid = [m for m in own if m["price"] > 0]
+            self.assertEqual(stats["count"], len(paid))
+            self.assertAlmostEqual(stats["total"], sum(m["price"] for m in paid))
+            self.assertEqual(stats["medianRating"], statistics.median(m["rate"] for m in paid) if paid else None)
+            self.assertEqual(stats["lastVisit"], max((m["date"] for m in paid), default=None))
+            for days in server.VENDOR_STATS_WINDOWS:
+                start = (today - timedelta(days=days - 1)).strftime("%y%m%d")
+                inside = [m for m in paid if start <= m["date"] <= today.strftime("%y%m%d")]
+                window = stats["windows"][f"{days}d"]
+                self.assertEqual(window["count"], len(inside), days)
+                self.assertAlmostEqual(window["total"], sum(m["price"] for m in inside))
+                if inside:
+                    self.assertAlmostEqual(window["avgRating"], sum(m["rate"] for m in inside) / len(inside), delta=0.051)
+                else:
+                    self.assertIsNone(window["avgRating"])
+
+    def test_last_visit_ignores_free_meals_like_the_counts(self):
+        free_only, mixed = self._add_vendor("Free"), self._add_vendor("Mixed")
+        today = date(2024, 6, 30)
+        self._add_meal(today, free_only, price=0)
+        paid = self._add_meal(today - timedelta(days=3), mixed)
+        self._add_meal(today, mixed, price=0)
+
+        stats = {s["id"]: s for s in server.read_vendor_stats(today=today)}
+        self.assertEqual((stats[free_only]["count"], stats[free_only]["lastVisit"]), (0, None))
+        self.assertEqual((stats[mixed]["count"], stats[mixed]["lastVisit"]), (1, "240627"))
+
+        self.manage.delete(f"/api/meals/{paid}")
+        self.assertIsNone(server.read_vendor_stats(mixed, today=today)[0]["lastVisit"])
+
+    def test_single_vendor_endpoint(self):
+        vendor_id = self._add_vendor("面馆")
+        today = datetime.now(server.BJ_TZ).date()
+        for days_ago, rate in ((0, 5), (10, 4), (100, 3), (400, 1)):
+            self._add_meal(today - timedelta(days=days_ago), vendor_id, rate=rate)
+
+        data = self.client.get(f"/api/vendors/{vendor_id}/stats").get_json()
+        self.assertEqual((data["count"], data["total"], data["avgPrice"]), (4, 80.0, 20.0))
+        self.assertEqual(data["medianRating"], 3.5)
+        self.assertEqual(data["lastVisit"], today.strftime("%y%m%d"))
+        self.assertEqual(
+            [data["windows"][key]["count"] for key in ("30d", "90d", "365d")],
+            [2, 2, 3],
+        )
+        self.assertEqual(data["ratingDist"][0], {"rating": 5.0, "count": 1})
+        self.assertEqual(self.client.get("/api/vendors/999/stats").status_code, 404)
+
+    def test_list_sorting_and_pagination(self):
+        today = datetime.now(server.BJ_TZ).date()
+        busy, quiet, unused = self._add_vendor("A"), self._add_vendor("B"), self._add_vendor("C")
+        for _ in range(3):
+            self._add_meal(today - timedelta(days=200), busy, rate=2)
+        self._add_meal(today, quiet, rate=5)
+
+        data = self.client.get("/api/vendors/stats").get_json()
+        self.assertEqual([v["id"] for v in data["vendors"]], [busy, quiet, unused])
+        self.assertNotIn("ratingDist", data["vendors"][0])
+        self.assertEqual((data["total"], data["next_offset"]), (3, None))
+
+        recent = self.client.get("/api/vendors/stats?sort=count30d").get_json()["vendors"]
+        self.assertEqual(recent[0]["id"], quiet)
+
+        # Vendors without ratings sort last in either direction.
+        for order, expected in (("desc", [quiet, busy, unused]), ("asc", [busy, quiet, unused])):
+            rated = self.client.get(f"/api/vendors/stats?sort=avgRating&order={order}").get_json()["vendors"]
+            self.assertEqual([v["id"] for v in rated], expected)
+
+        page = self.client.get("/api/vendors/stats?limit=1&offset=1").get_json()
+        self.assertEqual(([v["id"] for v in page["vendors"]], page["next_offset"]), ([quiet], 2))
+
+        for query in ("sort=weight", "order=up", "limit=0", "offset=-1"):
+            self.assertEqual(self.client.get(f"/api/vendors/stats?{query}").status_code, 400, query)
+
+
+if __name__ == "__main__":
+    unittest.main()